@@ -0,0 +1,103 @@
+"""Asyncio API of the FY-3 readers for concurrent services"""
+
+import asyncio
+import contextlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fy3Reader.factory import open_reader
+
+# executors shared by every granule unless others are given
+_EXECUTORS = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+def _default_executor(kind):
+    with _EXECUTORS_LOCK:
+        if kind not in _EXECUTORS:
+            _EXECUTORS[kind] = ThreadPoolExecutor(thread_name_prefix=f"fy3-{kind}")
+        return _EXECUTORS[kind]
+
+class AsyncReader(object):
+    """Awaitable counterparts of the blocking methods of one reader (granule).
+
+    HDF5 I/O (`aload`, `asave`) runs on `io_executor` and the CPU-heavy steps
+    (`acrop`, `aresample`, `acomposite`) on `cpu_executor`, both thread pools
+    shared by all granules by default. At most `concurrency` calls run on the
+    granule at once, since the reader methods change its state. Resampling of
+    composite bands can be sent to processes with `processes=`, see `resample`.
+
+    A call cancelled before it started in its executor is dropped. A running
+    call can't be stopped in its thread, the cancelled task waits for it to
+    finish: `acrop`, `aresample` & `acomposite` are then rolled back (the
+    attributes of the reader are restored), a cancelled `aload` still loads.
+    With `concurrency` > 1 a rollback also undoes the calls that ran meanwhile.
+
+    >>> reader = await aopen("FY3D_MWRIA_GBAL_L1_20240530_0405_010KM_MS.HDF")
+    >>> await reader.aload('89_color')
+    >>> await reader.aresample(resampler='nearest', to_shape=(2000, 2000))
+    >>> rgb = reader.values
+    """
+
+    def __init__(self, reader, io_executor=None, cpu_executor=None, concurrency=1):
+        self.reader = reader
+        self.io_executor = io_executor or _default_executor("io")
+        self.cpu_executor = cpu_executor or _default_executor("cpu")
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run(self, executor, rollback, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        await self._semaphore.acquire()
+        # lists (e.g. the bands of a composite) by value, they may be changed in place
+        state = {k: list(v) if isinstance(v, list) else v for k, v in self.reader.__dict__.items()} if rollback else None
+        try:
+            future = executor.submit(functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._semaphore.release()
+            raise
+        # released when the work is done (or cancelled before it started),
+        # not when the awaiting task is cancelled
+        future.add_done_callback(lambda f: loop.is_closed() or loop.call_soon_threadsafe(self._semaphore.release))
+        task = asyncio.wrap_future(future)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if future.cancel():
+                raise
+            # already running, wait for it (cancelling again doesn't stop
+            # the wait) then undo its changes of the reader
+            while not task.done():
+                with contextlib.suppress(asyncio.CancelledError):
+                    await asyncio.wait([task])
+            if not task.cancelled():
+                task.exception()
+            if rollback:
+                self.reader.__dict__.clear()
+                self.reader.__dict__.update(state)
+            raise
+
+    async def aload(self, *args, **kwargs):
+        return await self._run(self.io_executor, False, self.reader.load, *args, **kwargs)
+
+    async def acrop(self, ll_box):
+        return await self._run(self.cpu_executor, True, self.reader.crop, ll_box)
+
+    async def aresample(self, *args, **kwargs):
+        return await self._run(self.cpu_executor, True, self.reader.resample, *args, **kwargs)
+
+    async def acomposite(self, **kwargs):
+        return await self._run(self.cpu_executor, True, self.reader.composite, **kwargs)
+
+    async def asave(self, fname, **kwargs):
+        return await self._run(self.io_executor, False, self.reader.save, fname, **kwargs)
+
+    def __getattr__(self, name):
+        # data, coordinates & metadata of the reader
+        if name == "reader":
+            raise AttributeError(name)
+        return getattr(self.reader, name)
+
+async def aopen(fname, io_executor=None, cpu_executor=None, concurrency=1, **kwargs):
+    """Open `fname` on the I/O executor, see `open_reader`, and return its `AsyncReader`."""
+    io_executor = io_executor or _default_executor("io")
+    reader = await asyncio.wrap_future(io_executor.submit(functools.partial(open_reader, fname, **kwargs)))
+    return AsyncReader(reader, io_executor=io_executor, cpu_executor=cpu_executor, concurrency=concurrency)
@@ -6,7 +6,7 @@ import numpy as np
 cimport numpy as np
 
 cimport cython
-from libc.math cimport floor, fabs, isnan
+from libc.math cimport floor, fabs, isnan, NAN
 
 
 cdef inline Py_ssize_t clamp_ssize(Py_ssize_t v,
@@ -34,14 +34,15 @@ cdef inline double u(double t, double a) nogil:
 def bicubic_map(double[:, ::1] img,
                 double[:, ::1] I,
                 double[:, ::1] J,
-                double a=-0.5):
+                double a=-0.5,
+                out=None):
     cdef Py_ssize_t H  = img.shape[0]
     cdef Py_ssize_t W  = img.shape[1]
     cdef Py_ssize_t OH = I.shape[0]
     cdef Py_ssize_t OW = I.shape[1]
 
-    cdef np.ndarray out_np = np.empty((OH, OW), dtype=np.float64)
-    cdef double[:, ::1] out = out_np
+    cdef np.ndarray out_np = np.empty((OH, OW), dtype=np.float64) if out is None else out
+    cdef double[:, ::1] out_v = out_np
 
     cdef Py_ssize_t r, c, ix, iy
     cdef Py_ssize_t xi0, xi1, xi2, xi3, yi0, yi1, yi2, yi3
@@ -49,45 +50,47 @@ def bicubic_map(double[:, ::1] img,
     cdef double wx0, wx1, wx2, wx3, wy0, wy1, wy2, wy3
     cdef double acc
 
-    for r in range(OH):
-        for c in range(OW):
-            y = I[r, c]
-            x = J[r, c]
-
-            if isnan(y) or isnan(x):
-                out[r, c] = np.nan
-                continue
-
-            if y < 0.0:       y = 0.0
-            elif y > H - 1:   y = H - 1.0
-            if x < 0.0:       x = 0.0
-            elif x > W - 1:   x = W - 1.0
-
-            iy = <Py_ssize_t>floor(y)
-            ix = <Py_ssize_t>floor(x)
-            dy = y - iy
-            dx = x - ix
-
-            xi0 = clamp_ssize(ix - 1, 0, W - 1)
-            xi1 = ix
-            xi2 = clamp_ssize(ix + 1, 0, W - 1)
-            xi3 = clamp_ssize(ix + 2, 0, W - 1)
-
-            yi0 = clamp_ssize(iy - 1, 0, H - 1)
-            yi1 = iy
-            yi2 = clamp_ssize(iy + 1, 0, H - 1)
-            yi3 = clamp_ssize(iy + 2, 0, H - 1)
-
-            wx0 = u(1.0 + dx, a);  wx1 = u(dx, a)
-            wx2 = u(1.0 - dx, a);  wx3 = u(2.0 - dx, a)
-            wy0 = u(1.0 + dy, a);  wy1 = u(dy, a)
-            wy2 = u(1.0 - dy, a);  wy3 = u(2.0 - dy, a)
-
-            acc  = (wx0*img[yi0, xi0] + wx1*img[yi0, xi1] + wx2*img[yi0, xi2] + wx3*img[yi0, xi3]) * wy0
-            acc += (wx0*img[yi1, xi0] + wx1*img[yi1, xi1] + wx2*img[yi1, xi2] + wx3*img[yi1, xi3]) * wy1
-            acc += (wx0*img[yi2, xi0] + wx1*img[yi2, xi1] + wx2*img[yi2, xi2] + wx3*img[yi2, xi3]) * wy2
-            acc += (wx0*img[yi3, xi0] + wx1*img[yi3, xi1] + wx2*img[yi3, xi2] + wx3*img[yi3, xi3]) * wy3
-
-            out[r, c] = acc
+    # no Python objects below, other threads run meanwhile
+    with nogil:
+        for r in range(OH):
+            for c in range(OW):
+                y = I[r, c]
+                x = J[r, c]
+
+                if isnan(y) or isnan(x):
+                    out_v[r, c] = NAN
+                    continue
+
+                if y < 0.0:       y = 0.0
+                elif y > H - 1:   y = H - 1.0
+                if x < 0.0:       x = 0.0
+                elif x > W - 1:   x = W - 1.0
+
+                iy = <Py_ssize_t>floor(y)
+                ix = <Py_ssize_t>floor(x)
+                dy = y - iy
+                dx = x - ix
+
+                xi0 = clamp_ssize(ix - 1, 0, W - 1)
+                xi1 = ix
+                xi2 = clamp_ssize(ix + 1, 0, W - 1)
+                xi3 = clamp_ssize(ix + 2, 0, W - 1)
+
+                yi0 = clamp_ssize(iy - 1, 0, H - 1)
+                yi1 = iy
+                yi2 = clamp_ssize(iy + 1, 0, H - 1)
+                yi3 = clamp_ssize(iy + 2, 0, H - 1)
+
+                wx0 = u(1.0 + dx, a);  wx1 = u(dx, a)
+                wx2 = u(1.0 - dx, a);  wx3 = u(2.0 - dx, a)
+                wy0 = u(1.0 + dy, a);  wy1 = u(dy, a)
+                wy2 = u(1.0 - dy, a);  wy3 = u(2.0 - dy, a)
+
+                acc  = (wx0*img[yi0, xi0] + wx1*img[yi0, xi1] + wx2*img[yi0, xi2] + wx3*img[yi0, xi3]) * wy0
+                acc += (wx0*img[yi1, xi0] + wx1*img[yi1, xi1] + wx2*img[yi1, xi2] + wx3*img[yi1, xi3]) * wy1
+                acc += (wx0*img[yi2, xi0] + wx1*img[yi2, xi1] + wx2*img[yi2, xi2] + wx3*img[yi2, xi3]) * wy2
+                acc += (wx0*img[yi3, xi0] + wx1*img[yi3, xi1] + wx2*img[yi3, xi2] + wx3*img[yi3, xi3]) * wy3
+
+                out_v[r, c] = acc
 
     return out_np
@@ -0,0 +1,61 @@
+"""Reusable array buffers for long-running workers"""
+
+import threading
+import numpy as np
+
+class BufferPool(object):
+    """Pool of arrays keyed by shape & dtype, scoped to one worker.
+
+    Readers created with `pool=` read, calibrate and resample into buffers of
+    the pool, and give them back on the next `load` (or `release`), so a worker
+    processing many granules of the same size reuses the same memory.
+    Arrays got from such a reader must be copied to be kept past that point.
+
+    >>> pool = BufferPool(max_bytes=2 * 1024 ** 3)
+    >>> for fname in fnames:
+    ...     reader = FY3D_MWRI_L1(fname, pool=pool)
+    ...     reader.load('89_color')
+    ...     ...
+    ...     reader.release()
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._free = {}
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(shape, dtype):
+        return tuple(int(s) for s in shape), np.dtype(dtype).str
+
+    @property
+    def nbytes(self):
+        """Bytes held by the free buffers of the pool."""
+        return self._nbytes
+
+    def acquire(self, shape, dtype=np.float64):
+        """Return an uninitialized C-contiguous array, reused if possible."""
+        key = self._key(shape, dtype)
+        with self._lock:
+            buffers = self._free.get(key)
+            if buffers:
+                buf = buffers.pop()
+                self._nbytes -= buf.nbytes
+                return buf
+        return np.empty(key[0], dtype=key[1])
+
+    def release(self, buf):
+        """Give `buf` back to the pool, views are ignored."""
+        if buf is None or buf.base is not None or not buf.flags.c_contiguous:
+            return
+        with self._lock:
+            if self.max_bytes is not None and self._nbytes + buf.nbytes > self.max_bytes:
+                return
+            self._free.setdefault(self._key(buf.shape, buf.dtype), []).append(buf)
+            self._nbytes += buf.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._free = {}
+            self._nbytes = 0
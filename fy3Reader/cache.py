@@ -0,0 +1,132 @@
+"""Node-local cache of calibrated bands & geolocation shared by processes"""
+
+import os
+import hashlib
+import tempfile
+import contextlib
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # not POSIX, concurrent misses of a key may then be decoded more than once
+    fcntl = None
+
+DEFAULT_DIRECTORY = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "fy3Reader-cache")
+
+# number of lock files the keys are spread over
+LOCK_STRIPES = 64
+
+class GranuleCache(object):
+    """Cache of decoded arrays in memory-mapped `.npy` files of `directory`
+    (shared memory under `/dev/shm` by default), used by every process of
+    the node that opens its readers with `cache=`.
+
+    Entries are written once to a temporary file and renamed into place, hits
+    are read-only memory maps of the same pages in every process. The least
+    recently used entries are evicted when the total size is over `max_bytes`,
+    arrays already mapped stay valid after their file is evicted.
+
+    >>> cache = GranuleCache(max_bytes=4 * 1024 ** 3)
+    >>> reader = FY3D_MWRI_L1(fname, cache=cache)
+    """
+
+    def __init__(self, directory=None, max_bytes=2 * 1024 ** 3):
+        self.directory = directory or DEFAULT_DIRECTORY
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(fname, group, band, window=None):
+        # a granule replaced in place gets new keys
+        stat = os.stat(fname)
+        return (os.path.abspath(fname), stat.st_mtime_ns, stat.st_size, group, band, window)
+
+    def _digest(self, key):
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, self._digest(key) + ".npy")
+
+    @contextlib.contextmanager
+    def _locked(self, name):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, f".{name}.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    yield entry.path, entry.stat()
+                except FileNotFoundError:
+                    continue
+
+    @property
+    def nbytes(self):
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def get(self, key):
+        """Return the cached array of `key` as a read-only memory map, or None."""
+        path = self._path(key)
+        try:
+            data = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        # recently used
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return data
+
+    def put(self, key, data):
+        """Store `data` as the array of `key` and return it."""
+        data = np.asarray(data)
+        if self.max_bytes is not None and data.nbytes > self.max_bytes:
+            return data
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._evict()
+        return data
+
+    def fetch(self, key, loader):
+        """Return the cached array of `key`, on a miss it is computed by
+        `loader()` and stored; concurrent misses of a key are decoded once."""
+        data = self.get(key)
+        if data is not None:
+            return data
+        with self._locked(f"key-{int(self._digest(key), 16) % LOCK_STRIPES}"):
+            data = self.get(key)
+            if data is not None:
+                return data
+            return self.put(key, loader())
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        with self._locked("evict"):
+            entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+            total = sum(stat.st_size for _, stat in entries)
+            for path, stat in entries:
+                if total <= self.max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+                total -= stat.st_size
+
+    def clear(self):
+        with self._locked("evict"):
+            for path, _ in list(self._entries()):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
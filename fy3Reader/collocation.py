@@ -0,0 +1,124 @@
+"""Cross-sensor collocation of FY-3 swaths (e.g. PMR <-> MWRI, MWHS <-> MWRI)"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+from fy3Reader.resample import lonlat_to_xyz
+from fy3Reader.parallel import process_pool
+
+def swath_of(reader):
+    """Longitudes, latitudes and per-scanline times of a loaded reader."""
+    if reader.longitude is None or reader.latitude is None or reader.scanline_times is None:
+        raise ValueError(
+            "Longitude or Latitude or scan line times are empty, "
+            "you should run `load` first and collocate before `resample`."
+        )
+    return reader.longitude, reader.latitude, reader.scanline_times
+
+def _pixel_times(times, shape):
+    if times is None:
+        return None
+    times = np.asarray(times)
+    if times.ndim == 1:
+        # one time per scan line
+        times = np.broadcast_to(times[:, None], shape)
+    return times.astype('datetime64[ms]').astype(np.int64).ravel()
+
+class Collocator(object):
+    """Index the swath of one sensor once, then match the pixels of other
+    swaths to it by distance (km, on a 3-D Cartesian KD-tree) and time.
+
+    >>> coll = Collocator(*swath_of(mwri))
+    >>> index, ref_index, distance, dt = coll.match(*swath_of(pmr), max_distance=5, max_time=900)
+    """
+
+    def __init__(self, lons, lats, times=None):
+        self.shape = np.shape(lons)
+        valid = (np.isfinite(lons) & np.isfinite(lats)).ravel()
+        self.index = np.flatnonzero(valid)
+        self.tree = cKDTree(lonlat_to_xyz(np.ravel(lons)[valid], np.ravel(lats)[valid]))
+        self.times = _pixel_times(times, self.shape)
+        if self.times is not None:
+            self.times = self.times[valid]
+
+    @classmethod
+    def from_reader(cls, reader):
+        return cls(*swath_of(reader))
+
+    def _query_points(self, lons, lats, times):
+        valid = (np.isfinite(lons) & np.isfinite(lats)).ravel()
+        index = np.flatnonzero(valid)
+        points = lonlat_to_xyz(np.ravel(lons)[valid], np.ravel(lats)[valid])
+        times = _pixel_times(times, np.shape(lons))
+        return index, points, None if times is None else times[valid]
+
+    def match(self, lons, lats, times=None, max_distance=5.0, max_time=None, k=4):
+        """Match every pixel to the nearest reference pixel within `max_distance`
+        km and `max_time` seconds (the `k` nearest are checked for time).
+
+        Return flat indices of the matched pixels, flat indices of their
+        reference pixels, distances in km and time differences in seconds.
+        """
+        index, points, times = self._query_points(lons, lats, times)
+        k = min(k, self.tree.n)
+        distances, candidates = self.tree.query(points, k=k, distance_upper_bound=max_distance)
+        distances, candidates = distances.reshape(len(points), k), candidates.reshape(len(points), k)
+        ok = np.isfinite(distances)
+        dt = np.zeros(distances.shape, dtype=np.float64)
+        if max_time is not None and times is not None and self.times is not None:
+            safe = np.where(ok, candidates, 0)
+            dt = (self.times[safe] - times[:, None]) / 1000.0
+            ok &= np.abs(dt) <= max_time
+        # candidates are sorted by distance, take the first one passing all checks
+        matched = ok.any(axis=1)
+        first = np.argmax(ok, axis=1)[matched]
+        rows = np.flatnonzero(matched)
+        return (
+            index[rows],
+            self.index[candidates[rows, first]],
+            distances[rows, first],
+            dt[rows, first]
+        )
+
+    def average(self, lons, lats, values, times=None, radius=7.5, max_time=None, sigma=None):
+        """Average the reference `values` over the footprint (`radius` km) of
+        every pixel, weighted by a Gaussian of width `sigma` km if given.
+        Return the averaged values in the shape of `lons` (NaN if empty)."""
+        index, points, times = self._query_points(lons, lats, times)
+        neighbours = self.tree.query_ball_point(points, r=radius, return_sorted=False)
+        counts = np.fromiter((len(n) for n in neighbours), dtype=np.int64, count=len(neighbours))
+        owners = np.repeat(np.arange(len(points)), counts)
+        members = np.fromiter((m for n in neighbours for m in n), dtype=np.int64, count=counts.sum())
+        values = np.ravel(values)[self.index[members]].astype(np.float64)
+        weights = np.isfinite(values).astype(np.float64)
+        if sigma is not None:
+            chord = np.linalg.norm(self.tree.data[members] - points[owners], axis=1)
+            weights *= np.exp(-0.5 * (chord / sigma) ** 2)
+        if max_time is not None and times is not None and self.times is not None:
+            weights *= np.abs(self.times[members] - times[owners]) / 1000.0 <= max_time
+        total = np.bincount(owners, weights=weights * np.nan_to_num(values), minlength=len(points))
+        norm = np.bincount(owners, weights=weights, minlength=len(points))
+        out = np.full(int(np.prod(np.shape(lons))), np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[index] = np.where(norm > 0, total / norm, np.nan)
+        return out.reshape(np.shape(lons))
+
+def _collocate_pair(args):
+    reference, target, max_distance, max_time = args
+    ref_times, times = reference[2], target[2]
+    if max_time is not None and ref_times is not None and times is not None:
+        # skip granules without overlap in time
+        gap = max(
+            np.min(ref_times) - np.max(times),
+            np.min(times) - np.max(ref_times)
+        ) / np.timedelta64(1, 's')
+        if gap > max_time:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0), np.empty(0)
+    return Collocator(*reference).match(*target, max_distance=max_distance, max_time=max_time)
+
+def collocate_batch(pairs, max_distance=5.0, max_time=None, processes=None):
+    """Collocate many granule pairs `[(reference, target), ...]`, each given as
+    `(lons, lats, times)` (see `swath_of`), in the processes of
+    `process_pool(processes)`."""
+    args = [(reference, target, max_distance, max_time) for reference, target in pairs]
+    return list(process_pool(processes).map(_collocate_pair, args))
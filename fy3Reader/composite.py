@@ -1,105 +1,226 @@
 """FY-3 MWRI/MWHS Composite Bands"""
 
+import sys
+import copyreg
 import numpy as np
-from matplotlib.colors import Normalize
+from functools import lru_cache
 from matplotlib.cm import ScalarMappable
 
-class PolarizationDifference(object):
-
-    def __init__(self, datas, fractions=(1.0, 1.0)):
-        self.v, self.h = datas
-        self.fractions = fractions
-
-    def composite(self):
-        """Generate the Polarization Difference composite."""
-        return self.v * self.fractions[0] - self.h * self.fractions[1]
-
-class PolarizationCorrectedTemperature(object):
-
-    def __init__(self, datas, fractions=(1.7, 0.7)):
-        self.v, self.h = datas
-        self.fractions = fractions
-
-    def composite(self):
-        """Generate the Polarization Corrected Temperature composite."""
-        return self.v * self.fractions[0] - self.h * self.fractions[1]
-
-class Color_89(object):
-
-    def __init__(self, datas, fractions=(1.7, 0.7)):
-        self.v_89, self.h_89 = datas
-        self.PCT_89 = PolarizationCorrectedTemperature((self.v_89, self.h_89), fractions=fractions)
-        self.composite_name = '89_color'
-        self.colormaps = {
-            "r_89_pct": ScalarMappable(norm=Normalize(vmin=212, vmax=295, clip=True), cmap="gray_r"),
-            "g_89_h": ScalarMappable(norm=Normalize(vmin=245, vmax=305, clip=True), cmap="gray"),
-            "b_89_v": ScalarMappable(norm=Normalize(vmin=255, vmax=310, clip=True), cmap="gray"),
-        }
-
-    def composite(self):
-        """Generate the 89_color composite."""
-        self.pct_89 = self.PCT_89.composite()
-        self.r = self.colormaps["r_89_pct"].to_rgba(self.pct_89, bytes=True)[..., 0]
-        self.g = self.colormaps["g_89_h"].to_rgba(self.h_89, bytes=True)[..., 0]
-        self.b = self.colormaps["b_89_v"].to_rgba(self.v_89, bytes=True)[..., 0]
-        return np.stack([self.r, self.g, self.b], axis=-1)
-
-class Color_37(object):
-
-    def __init__(self, datas, fractions=(2.15, 1.15)):
-        self.v_37, self.h_37 = datas
-        self.PCT_37 = PolarizationCorrectedTemperature((self.v_37, self.h_37), fractions=fractions)
-        self.composite_name = '37_color'
-        self.colormaps = {
-            "r_37_pct": ScalarMappable(norm=Normalize(vmin=260, vmax=280, clip=True), cmap="gray_r"),
-            "g_37_h": ScalarMappable(norm=Normalize(vmin=195, vmax=280, clip=True), cmap="gray"),
-            "b_37_v": ScalarMappable(norm=Normalize(vmin=170, vmax=280, clip=True), cmap="gray"),
-        }
-
-    def composite(self):
-        """Generate the 37_color composite."""
-        self.pct_37 = self.PCT_37.composite()
-        self.r = self.colormaps["r_37_pct"].to_rgba(self.pct_37, bytes=True)[..., 0]
-        self.g = self.colormaps["g_37_h"].to_rgba(self.v_37, bytes=True)[..., 0]
-        self.b = self.colormaps["b_37_v"].to_rgba(self.h_37, bytes=True)[..., 0]
-        return np.stack([self.r, self.g, self.b], axis=-1)
-
-class HydrometeorType(object):
-
-    def __init__(self, datas, fractions=((1.0, 1.0), (1.7, 0.7))):
-        self.v_19, self.h_19, self.v_89, self.h_89 = datas
-        self.PD_19 = PolarizationDifference((self.v_19, self.h_19), fractions=fractions[0])
-        self.PCT_89 = PolarizationCorrectedTemperature((self.v_89, self.h_89), fractions=fractions[1])
-        self.composite_name = 'hydrometeor_type'
-        self.colormaps = {
-            "r_89_pct": ScalarMappable(norm=Normalize(vmin=205, vmax=290, clip=True), cmap="gray_r"),
-            "g_19_pd": ScalarMappable(norm=Normalize(vmin=0, vmax=65, clip=True), cmap="gray_r"),
-            "b_89_h": ScalarMappable(norm=Normalize(vmin=240, vmax=305, clip=True), cmap="gray"),
-        }
-
-    def composite(self):
-        """Generate the hydrometeor_type composite."""
-        self.pct_89 = self.PCT_89.composite()
-        self.pd_19 = self.PD_19.composite()
-        self.r = self.colormaps["r_89_pct"].to_rgba(self.pct_89, bytes=True)[..., 0]
-        self.g = self.colormaps["g_19_pd"].to_rgba(self.pd_19, bytes=True)[..., 0]
-        self.b = self.colormaps["b_89_h"].to_rgba(self.h_89, bytes=True)[..., 0]
-        return np.stack([self.r, self.g, self.b], axis=-1)
-
-class Color_89_MWHS(object):
-
-    def __init__(self, datas, fractions=None):
-        self.h_89, self.h_166 = datas
-        self.composite_name = '89_color_mwhs'
-        self.colormaps = {
-            "r_166_h": ScalarMappable(norm=Normalize(vmin=120, vmax=305, clip=True), cmap="gray_r"),
-            "g_89_h": ScalarMappable(norm=Normalize(vmin=245, vmax=305, clip=True), cmap="gray"),
-            "b_89_h": ScalarMappable(norm=Normalize(vmin=245, vmax=305, clip=True), cmap="gray"),
-        }
-
-    def composite(self):
-        """Generate the 89_color_mwhs composite."""
-        self.r = self.colormaps["r_166_h"].to_rgba(self.h_166, bytes=True)[..., 0]
-        self.g = self.colormaps["g_89_h"].to_rgba(self.h_89, bytes=True)[..., 0]
-        self.b = self.colormaps["b_89_h"].to_rgba(self.h_89, bytes=True)[..., 0]
-        return np.stack([self.r, self.g, self.b], axis=-1)
+# Size of one block of a float64 band evaluated at once, small enough that
+# every temporary of a block stays in cache.
+BLOCK_BYTES = 256 * 1024
+
+_EVAL_GLOBALS = {"__builtins__": {}, "np": np}
+
+@lru_cache(maxsize=None)
+def _colormap_lut(cmap):
+    cmap = ScalarMappable(cmap=cmap).get_cmap()
+    lut = cmap(np.arange(cmap.N), bytes=True)[:, 0]
+    bad = cmap(np.array([np.nan]), bytes=True)[0, 0]
+    return lut, bad
+
+def _flatten(values):
+    if values is None:
+        return ()
+    if isinstance(values, (tuple, list)):
+        return tuple(v for value in values for v in _flatten(value))
+    return (values,)
+
+def _apply_lut(value, vmin, vmax, cmap, out):
+    # same result as `ScalarMappable(Normalize(vmin, vmax, clip=True), cmap).to_rgba(value, bytes=True)[..., 0]`
+    lut, bad = _colormap_lut(cmap)
+    t = np.subtract(value, vmin, dtype=np.float64)
+    t /= (vmax - vmin)
+    np.clip(t, 0.0, 1.0, out=t)
+    t *= lut.size
+    invalid = np.isnan(t)
+    t[invalid] = 0
+    np.minimum(t, lut.size - 1, out=t)
+    out[...] = lut[t.astype(np.intp)]
+    out[invalid] = bad
+
+class _CompositeType(type):
+    """Type of the composites, pickled by their declaration (see below)."""
+
+def _reduce_composite(cls):
+    # by reference when importable, otherwise (declared at runtime by
+    # `fused_composite`) declared again when unpickled
+    if getattr(sys.modules.get(cls.__module__), cls.__qualname__, None) is cls:
+        return cls.__qualname__
+    return fused_composite, (cls.composite_name, cls.variables, cls.channels, cls.fraction_names, cls.default_fractions)
+
+copyreg.pickle(_CompositeType, _reduce_composite)
+
+class FusedComposite(object, metaclass=_CompositeType):
+    """Composite declared as expressions over bands.
+
+    `variables` are the names bound to the input bands (in order) and
+    `fraction_names` the names bound to the (flattened) fractions. Each entry of
+    `channels` is `(name, expression, vmin, vmax, cmap)`; a composite with a
+    single channel and no cmap returns the expression value itself, otherwise
+    each channel is stretched to uint8 and the result is stacked to (M, N, C).
+    `limits` (`{channel name: (vmin, vmax)}`, e.g. from `fy3Reader.stats`)
+    replace the stretch of the given channels. Expressions are compiled once
+    and evaluated block by block, so no full-size intermediates are created.
+    """
+
+    composite_name = None
+    variables = ()
+    fraction_names = ()
+    default_fractions = None
+    channels = ()
+
+    def __init__(self, datas, fractions=None, limits=None):
+        if not len(datas) == len(self.variables):
+            raise ValueError(f"`datas` should have {len(self.variables)} bands.")
+        self.datas = datas
+        self.fractions = self.default_fractions if fractions is None else fractions
+        values = _flatten(self.fractions)
+        names = _flatten(self.fraction_names)
+        if not len(values) == len(names):
+            raise ValueError(f"`fractions` should have {len(names)} values.")
+        self.params = dict(zip(names, values))
+        limits = dict(limits or {})
+        unknown = set(limits) - {channel[0] for channel in self.channels}
+        if unknown:
+            raise ValueError(f"Unknown channels in `limits`: {sorted(unknown)}")
+        self._compiled = []
+        for name, expr, vmin, vmax, cmap in self.channels:
+            vmin, vmax = limits.get(name, (vmin, vmax))
+            self._compiled.append((name, compile(expr, f"<{self.composite_name}:{name}>", "eval"), vmin, vmax, cmap))
+
+    @property
+    def rgb(self):
+        return not (len(self.channels) == 1 and self.channels[0][4] is None)
+
+    def _allocate(self, shape):
+        if self.rgb:
+            return np.empty(shape + (len(self.channels),), dtype=np.uint8)
+        return np.empty(shape, dtype=np.float64)
+
+    def _blocks(self):
+        shape = np.shape(self.datas[0])
+        width = int(np.prod(shape[1:], dtype=np.int64)) or 1
+        rows = max(1, BLOCK_BYTES // (8 * width))
+        for r0 in range(0, shape[0], rows):
+            yield r0, min(shape[0], r0 + rows)
+
+    def channel_values(self, r0, r1):
+        """Yield `(name, value)` of every channel over rows `r0:r1`, before
+        the stretch."""
+        scope = dict(self.params)
+        # lazy bands (e.g. `CalibratedMemmap`) are read block by block
+        scope.update({v: np.asarray(d[r0:r1]) for v, d in zip(self.variables, self.datas)})
+        for name, code, _, _, _ in self._compiled:
+            yield name, eval(code, _EVAL_GLOBALS, scope)
+
+    def _evaluate(self, r0, r1, out):
+        for c, (name, value) in enumerate(self.channel_values(r0, r1)):
+            vmin, vmax, cmap = self._compiled[c][2:]
+            if cmap is None:
+                out[...] = value
+            else:
+                _apply_lut(value, vmin, vmax, cmap, out[..., c])
+
+    def composite(self, out=None):
+        """Generate the composite, optionally into a preallocated `out` array."""
+        if out is None:
+            out = self._allocate(np.shape(self.datas[0]))
+        for r0, r1 in self._blocks():
+            self._evaluate(r0, r1, out[r0:r1])
+        return out
+
+    def iter_blocks(self):
+        """Generate the composite block by block as `(row_slice, block)`,
+        e.g. to stream it into a file without the full-size output."""
+        shape = np.shape(self.datas[0])
+        for r0, r1 in self._blocks():
+            out = self._allocate((r1 - r0,) + shape[1:])
+            self._evaluate(r0, r1, out)
+            yield slice(r0, r1), out
+
+def fused_composite(name, variables, channels, fraction_names=(), default_fractions=None):
+    """Declare a new composite class, e.g. to register it to a reader:
+
+    >>> NDI_89 = fused_composite("89_ndi", ("v", "h"), [("ndi", "(v - h) / (v + h)", None, None, None)])
+    >>> reader.register_composite("89_ndi", ["btemp_89.0v", "btemp_89.0h"], NDI_89, rgb=False)
+    """
+    return type(name, (FusedComposite,), {
+        "composite_name": name,
+        "variables": tuple(variables),
+        "fraction_names": fraction_names,
+        "default_fractions": default_fractions,
+        "channels": tuple(tuple(channel) for channel in channels),
+    })
+
+class PolarizationDifference(FusedComposite):
+    """Generate the Polarization Difference composite."""
+
+    composite_name = 'pd'
+    variables = ("v", "h")
+    fraction_names = ("a", "b")
+    default_fractions = (1.0, 1.0)
+    channels = (
+        ("pd", "v * a - h * b", None, None, None),
+    )
+
+class PolarizationCorrectedTemperature(FusedComposite):
+    """Generate the Polarization Corrected Temperature composite."""
+
+    composite_name = 'pct'
+    variables = ("v", "h")
+    fraction_names = ("a", "b")
+    default_fractions = (1.7, 0.7)
+    channels = (
+        ("pct", "v * a - h * b", None, None, None),
+    )
+
+class Color_89(FusedComposite):
+    """Generate the 89_color composite."""
+
+    composite_name = '89_color'
+    variables = ("v_89", "h_89")
+    fraction_names = ("a", "b")
+    default_fractions = (1.7, 0.7)
+    channels = (
+        ("r_89_pct", "v_89 * a - h_89 * b", 212, 295, "gray_r"),
+        ("g_89_h", "h_89", 245, 305, "gray"),
+        ("b_89_v", "v_89", 255, 310, "gray"),
+    )
+
+class Color_37(FusedComposite):
+    """Generate the 37_color composite."""
+
+    composite_name = '37_color'
+    variables = ("v_37", "h_37")
+    fraction_names = ("a", "b")
+    default_fractions = (2.15, 1.15)
+    channels = (
+        ("r_37_pct", "v_37 * a - h_37 * b", 260, 280, "gray_r"),
+        ("g_37_h", "v_37", 195, 280, "gray"),
+        ("b_37_v", "h_37", 170, 280, "gray"),
+    )
+
+class HydrometeorType(FusedComposite):
+    """Generate the hydrometeor_type composite."""
+
+    composite_name = 'hydrometeor_type'
+    variables = ("v_19", "h_19", "v_89", "h_89")
+    fraction_names = (("a_19", "b_19"), ("a_89", "b_89"))
+    default_fractions = ((1.0, 1.0), (1.7, 0.7))
+    channels = (
+        ("r_89_pct", "v_89 * a_89 - h_89 * b_89", 205, 290, "gray_r"),
+        ("g_19_pd", "v_19 * a_19 - h_19 * b_19", 0, 65, "gray_r"),
+        ("b_89_h", "h_89", 240, 305, "gray"),
+    )
+
+class Color_89_MWHS(FusedComposite):
+    """Generate the 89_color_mwhs composite."""
+
+    composite_name = '89_color_mwhs'
+    variables = ("h_89", "h_166")
+    channels = (
+        ("r_166_h", "h_166", 120, 305, "gray_r"),
+        ("g_89_h", "h_89", 245, 305, "gray"),
+        ("b_89_h", "h_89", 245, 305, "gray"),
+    )
@@ -0,0 +1,318 @@
+"""Long-running ingest of new FY-3 granules into products"""
+
+import os
+import time
+import queue
+import fnmatch
+import logging
+import argparse
+import threading
+import numpy as np
+from collections import deque
+from fy3Reader.factory import reader_class
+from fy3Reader.scene import Scene
+
+try:
+    from inotify_simple import INotify, flags
+    _HAS_INOTIFY = True
+except ImportError:
+    _HAS_INOTIFY = False
+
+logger = logging.getLogger(__name__)
+
+# stages timed for every granule, `latency` is from arrival to products written
+STAGES = ("queue", "open", "load", "crop", "resample", "save", "latency")
+
+class _LatencyStats(object):
+    """Count, mean & percentiles of the latest `window` samples of a stage."""
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.samples.append(seconds)
+
+    def summary(self):
+        if not self.samples:
+            return {"count": self.count}
+        samples = np.asarray(self.samples)
+        return {
+            "count": self.count,
+            "mean": float(samples.mean()),
+            "p50": float(np.percentile(samples, 50)),
+            "p95": float(np.percentile(samples, 95)),
+            "max": float(samples.max()),
+        }
+
+def target_grid(ll_box, to_shape):
+    """Regular lon/lat grid (`(lon_grid, lat_grid)`) of `to_shape` over
+    `ll_box` (`(latmin, latmax, lonmin, lonmax)`)."""
+    latmin, latmax, lonmin, lonmax = ll_box
+    if lonmin > lonmax:
+        # box crossing the antimeridian
+        lonmax += 360
+    return np.meshgrid(np.linspace(lonmin, lonmax, to_shape[1]), np.linspace(latmin, latmax, to_shape[0]))
+
+class IngestDaemon(object):
+    """Watch `watch_dir` and turn every new granule into `products`.
+
+    Granules are detected by inotify (with `inotify_simple` installed) or by
+    polling, a file is taken once it is closed after writing / moved in, or
+    when polled its size & mtime did not change for `settle` seconds. They go
+    through a queue of `queue_size` (the watcher waits while it is full) to
+    `threads` worker threads that keep the readers, the target grid & the
+    composite tables warm. Each granule is loaded into a `Scene`, optionally
+    cropped to `ll_box`, resampled to `to_shape` (onto the fixed grid of
+    `ll_box` when both are given) and saved to `out_dir` as
+    `<granule>_<product>.nc`, see `Scene.save_datasets`. Granules already in
+    `watch_dir` at start are taken too once settled, each version (size &
+    mtime) of a granule is queued once, granules of readers without
+    composites (PMR L2) are skipped.
+
+    >>> daemon = IngestDaemon("incoming", "products", ['89_color', '89_pct'], ll_box=(10, 40, 110, 150), to_shape=(1500, 2000))
+    >>> daemon.start()
+    >>> daemon.stats()
+    """
+
+    def __init__(
+        self, watch_dir, out_dir, products, pattern="FY3*.HDF", ll_box=None, to_shape=None,
+        resampler='nearest', threads=2, workers=None, processes=1, queue_size=16, poll_interval=2.0, settle=1.0,
+        reader_kwargs=None, writer_kwargs=None
+    ):
+        if to_shape is None:
+            raise ValueError("`to_shape` parameter should be provided.")
+        self.watch_dir = watch_dir
+        self.out_dir = out_dir
+        self.products = list(products)
+        self.pattern = pattern
+        self.ll_box = ll_box
+        self.to_shape = to_shape
+        self.resampler = resampler
+        self.threads = threads
+        self.workers = workers
+        # products written in this thread (1), or in the shared process pool
+        # of that size / an executor, see `process_pool`
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.reader_kwargs = reader_kwargs or {}
+        self.writer_kwargs = writer_kwargs or {}
+        # the fixed target grid is set up once for all granules
+        self.target = None if ll_box is None else target_grid(ll_box, to_shape)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {stage: _LatencyStats() for stage in STAGES}
+        self._failed = 0
+        # signature (size & mtime) of the granules queued or skipped, by path
+        self._seen = {}
+
+    def _matches(self, fname):
+        return fnmatch.fnmatch(os.path.basename(fname), self.pattern)
+
+    @staticmethod
+    def _supported(fname):
+        # a Scene is only made of MWRI/MWHS granules
+        try:
+            return hasattr(reader_class(fname), "_band_source")
+        except ValueError:
+            return False
+
+    def _accept(self, fname):
+        """Whether `fname` is a granule to process, unsupported ones are logged."""
+        if not self._matches(fname):
+            return False
+        if not self._supported(fname):
+            logger.info("Skipping %s, not a MWRI/MWHS granule", fname)
+            return False
+        return True
+
+    def submit(self, fname, arrived=None):
+        """Queue `fname`, waiting while the queue is full (backpressure).
+        Return False if the daemon was stopped meanwhile."""
+        item = (fname, time.time() if arrived is None else arrived, time.monotonic())
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _signature(self, fname):
+        stat = os.stat(fname)
+        return (stat.st_size, stat.st_mtime_ns), stat.st_mtime
+
+    def _submit_new(self, fname, signature, arrived=None):
+        # a granule is queued once per version (size & mtime)
+        if self._seen.get(fname) == signature:
+            return True
+        self._seen[fname] = signature
+        return self.submit(fname, arrived=arrived)
+
+    def _submit_settled(self, fnames, pending):
+        """Queue the granules of `fnames` whose size & mtime did not change for
+        `settle` seconds, the others are kept in `pending`."""
+        now = time.time()
+        for fname in fnames:
+            try:
+                signature, mtime = self._signature(fname)
+            except FileNotFoundError:
+                pending.pop(fname, None)
+                continue
+            if self._seen.get(fname) == signature:
+                continue
+            if not self._accept(fname):
+                # logged once
+                self._seen[fname] = signature
+                continue
+            first, last = pending.get(fname, (now, None))
+            if last == signature and now - first >= self.settle:
+                # unchanged long enough, the file is complete
+                del pending[fname]
+                if not self._submit_new(fname, signature, arrived=mtime):
+                    return
+            elif last != signature:
+                pending[fname] = (now, signature)
+
+    def _watch_inotify(self):
+        inotify = INotify()
+        inotify.add_watch(self.watch_dir, flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE | flags.MOVED_FROM)
+        # granules there before the watch are taken once settled, as when
+        # polled, unless their closing after writing comes first
+        pending = {}
+        try:
+            self._submit_settled([entry.path for entry in os.scandir(self.watch_dir) if entry.is_file()], pending)
+            while not self._stop.is_set():
+                for event in inotify.read(timeout=int(self.poll_interval * 1000)):
+                    fname = os.path.join(self.watch_dir, event.name)
+                    pending.pop(fname, None)
+                    if event.mask & (flags.DELETE | flags.MOVED_FROM):
+                        self._seen.pop(fname, None)
+                        continue
+                    if not self._accept(fname):
+                        continue
+                    try:
+                        signature, _ = self._signature(fname)
+                    except FileNotFoundError:
+                        continue
+                    self._submit_new(fname, signature)
+                if pending:
+                    self._submit_settled(list(pending), pending)
+        finally:
+            inotify.close()
+
+    def _watch_poll(self):
+        pending = {}
+        while not self._stop.is_set():
+            fnames = [entry.path for entry in os.scandir(self.watch_dir) if entry.is_file()]
+            # forget granules removed from the directory
+            self._seen = {fname: self._seen[fname] for fname in fnames if fname in self._seen}
+            self._submit_settled(fnames, pending)
+            self._stop.wait(self.poll_interval)
+
+    def _record(self, stage, seconds):
+        with self._lock:
+            self._stats[stage].add(seconds)
+
+    def process(self, fname, arrived=None):
+        """Make every product of `fname` and return the written files."""
+        arrived = time.time() if arrived is None else arrived
+        stem = os.path.splitext(os.path.basename(fname))[0]
+        if not self._supported(fname):
+            raise ValueError(f"Only MWRI/MWHS granules are supported by the ingest daemon: {fname}")
+        t = time.perf_counter()
+        reader = reader_class(fname)(fname, **self.reader_kwargs)
+        timings = [("open", time.perf_counter() - t)]
+        try:
+            scn = Scene(reader)
+            for stage, step in (
+                ("load", lambda: scn.load(self.products)),
+                ("crop", lambda: self.ll_box is not None and scn.crop(self.ll_box)),
+                ("resample", lambda: scn.resample(self.resampler, self.to_shape, workers=self.workers, target=self.target)),
+            ):
+                t = time.perf_counter()
+                step()
+                timings.append((stage, time.perf_counter() - t))
+            t = time.perf_counter()
+            written = scn.save_datasets(os.path.join(self.out_dir, f"{stem}_{{name}}.nc"), processes=self.processes, **self.writer_kwargs)
+            timings.append(("save", time.perf_counter() - t))
+        finally:
+            reader.close()
+        for stage, seconds in timings + [("latency", time.time() - arrived)]:
+            self._record(stage, seconds)
+        return written
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                fname, arrived, queued = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            self._record("queue", time.monotonic() - queued)
+            try:
+                self.process(fname, arrived=arrived)
+            except Exception:
+                logger.exception("Failed to process %s", fname)
+                with self._lock:
+                    self._failed += 1
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        self._stop.clear()
+        watch = self._watch_inotify if _HAS_INOTIFY else self._watch_poll
+        self._threads = [threading.Thread(target=watch, name="fy3-watch", daemon=True)] + [
+            threading.Thread(target=self._work, name=f"fy3-ingest-{i}", daemon=True) for i in range(self.threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, wait=True):
+        """Stop watching, granules being processed are finished if `wait`."""
+        self._stop.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def run_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stats(self):
+        """Per-stage latency summaries (seconds), queue size & failures."""
+        with self._lock:
+            summary = {stage: stats.summary() for stage, stats in self._stats.items()}
+            summary["failed"] = self._failed
+        summary["queued"] = self._queue.qsize()
+        return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Turn new FY-3 granules of a directory into products.")
+    parser.add_argument("watch_dir")
+    parser.add_argument("out_dir")
+    parser.add_argument("--products", nargs="+", required=True)
+    parser.add_argument("--pattern", default="FY3*.HDF")
+    parser.add_argument("--ll-box", nargs=4, type=float, metavar=("LATMIN", "LATMAX", "LONMIN", "LONMAX"))
+    parser.add_argument("--to-shape", nargs=2, type=int, required=True, metavar=("M", "N"))
+    parser.add_argument("--resampler", default="nearest")
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=16)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    IngestDaemon(
+        args.watch_dir, args.out_dir, args.products, pattern=args.pattern,
+        ll_box=None if args.ll_box is None else tuple(args.ll_box), to_shape=tuple(args.to_shape),
+        resampler=args.resampler, threads=args.threads, queue_size=args.queue_size
+    ).run_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Open a FY-3 file with the reader matching its name"""
+
+import os
+from fy3Reader.mwri_l1 import FY3D_MWRI_L1, FY3F_MWRI_L1, FY3G_MWRI_L1
+from fy3Reader.mwhs_l1 import FY3D_MWHS_L1, FY3E_MWHS_L1, FY3F_MWHS_L1, FY3H_MWHS_L1
+from fy3Reader.pmr_l2 import FY3G_PMR_L2
+
+# (satellite, instrument) in the file name, e.g. `FY3D_MWRIA_GBAL_L1_...`
+READERS = {
+    ("FY3D", "MWRI"): FY3D_MWRI_L1,
+    ("FY3F", "MWRI"): FY3F_MWRI_L1,
+    ("FY3G", "MWRI"): FY3G_MWRI_L1,
+    ("FY3D", "MWHS"): FY3D_MWHS_L1,
+    ("FY3E", "MWHS"): FY3E_MWHS_L1,
+    ("FY3F", "MWHS"): FY3F_MWHS_L1,
+    ("FY3H", "MWHS"): FY3H_MWHS_L1,
+    ("FY3G", "PMR"): FY3G_PMR_L2,
+}
+
+def reader_class(fname):
+    """Return the reader class of `fname` from its FY-3 file name."""
+    satellite, _, rest = os.path.basename(fname).upper().partition("_")
+    for (sat, instrument), cls in READERS.items():
+        if sat == satellite and rest.startswith(instrument):
+            return cls
+    raise ValueError(f"No reader found for file: {fname}")
+
+def open_reader(fname, **kwargs):
+    """Open `fname` with its reader, `kwargs` are passed to the reader."""
+    return reader_class(fname)(fname, **kwargs)
@@ -0,0 +1,194 @@
+"""Chunk-aware reads of channels from FY-3 HDF5 datasets"""
+
+import numpy as np
+from h5py import h5s
+
+# Size of the raw block of rows read at once when channels are demultiplexed
+BLOCK_BYTES = 16 * 1024 * 1024
+
+def _channel_chunk(dataset, axis):
+    # channels stored together in one chunk, 1 for a contiguous channel-first
+    # layout where every channel is one contiguous hyperslab
+    if dataset.chunks is None:
+        return dataset.shape[axis] if axis == -1 else 1
+    return dataset.chunks[axis]
+
+def _block_rows(dataset, axis, channels):
+    # rows of a block, aligned to the chunks & at least one chunk of rows
+    row_axis = 0 if axis == -1 else 1
+    row_bytes = dataset.dtype.itemsize * channels * int(np.prod(dataset.shape, dtype=np.int64) // (dataset.shape[row_axis] * dataset.shape[axis]))
+    rows = max(1, BLOCK_BYTES // max(1, row_bytes))
+    if dataset.chunks is not None:
+        chunk_rows = dataset.chunks[row_axis]
+        rows = max(1, rows // chunk_rows) * chunk_rows
+    return rows
+
+def _channel_ranges(indices, step, size):
+    # channel ranges of the runs of consecutive chunks holding `indices`
+    runs = []
+    for chunk in sorted(set(idx // step for idx in indices)):
+        if runs and runs[-1][1] == chunk:
+            runs[-1][1] = chunk + 1
+        else:
+            runs.append([chunk, chunk + 1])
+    return [(c0 * step, min(size, c1 * step)) for c0, c1 in runs]
+
+def read_hyperslab(dataset, out, start, count, stride=None):
+    """Read the hyperslab `start`/`count` (every `stride`-th element) of
+    `dataset` straight into `out` (same number of elements, any dtype) with
+    one `H5Dread`."""
+    if not out.flags.c_contiguous:
+        block = np.empty(out.shape, dtype=out.dtype)
+        read_hyperslab(dataset, block, start, count, stride)
+        out[...] = block
+        return out
+    if not all(count):
+        return out
+    fspace = dataset.id.get_space()
+    fspace.select_hyperslab(tuple(start), tuple(count), None if stride is None else tuple(stride))
+    # memory space of the same rank as the file selection, with a squeezed one
+    # HDF5 falls back to an element by element copy
+    dataset.id.read(h5s.create_simple(tuple(count)), fspace, out.reshape(count))
+    return out
+
+def read_strided(dataset, stride, index=None, axis=0, dtype=None):
+    """Every `stride`-th row & column of `dataset`, or of its channel `index`
+    along `axis` (0 or -1), in one strided read converted to `dtype`."""
+    if index is None:
+        shape = dataset.shape
+    elif axis in (0, -1):
+        shape = dataset.shape[1:] if axis == 0 else dataset.shape[:-1]
+    else:
+        raise ValueError("Channel axis should be 0 or -1.")
+    reduced = tuple(-(-n // stride) for n in shape)
+    start, count, step = (0,) * len(shape), reduced, (stride,) * len(shape)
+    if index is not None and axis == 0:
+        start, count, step = (index,) + start, (1,) + count, (1,) + step
+    elif index is not None:
+        start, count, step = start + (index,), count + (1,), step + (1,)
+    # converting the dtype in NumPy is faster than in HDF5
+    data = read_hyperslab(dataset, np.empty(reduced, dtype=dataset.dtype), start, count, step)
+    return data if dtype is None else data.astype(dtype, copy=False)
+
+def memmap_dataset(dataset):
+    """Read-only `np.memmap` of `dataset` if it is stored contiguous and
+    uncompressed in the file, otherwise None (it has to be read)."""
+    if dataset.chunks is not None or dataset.external or dataset.dtype.kind not in "biuf":
+        return None
+    if not dataset.file.driver == "sec2":
+        return None
+    offset = dataset.id.get_offset()
+    if offset is None:
+        # storage not allocated, only fill values
+        return None
+    return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape)
+
+class CalibratedMemmap(object):
+    """Band calibrated lazily from memory-mapped raw counts by `calibrate`.
+
+    Slicing only slices the map, the counts are read from the mapped pages and
+    calibrated when the band is converted to an array (`np.asarray`), so after
+    a crop only the pages of the window are touched.
+    """
+
+    def __init__(self, raw, calibrate):
+        self.raw = raw
+        self.calibrate = calibrate
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @property
+    def ndim(self):
+        return self.raw.ndim
+
+    @property
+    def dtype(self):
+        return self.calibrate(np.zeros(1, dtype=self.raw.dtype)).dtype
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, key):
+        return CalibratedMemmap(self.raw[key], self.calibrate)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.calibrate(self.raw.view(np.ndarray))
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+def read_channels(dataset, indices, axis=0, outs=None, dtype=None):
+    """Read channels `indices` along `axis` (0 or -1) of `dataset` into `outs`
+    (new arrays of `dtype` if None), converting the values to their dtype.
+
+    A channel that is stored apart (own chunks, or contiguous channel-first
+    data) is read directly into its output. Otherwise the rows are read in
+    blocks covering every chunk of the requested channels once, and each
+    channel is copied out of the block, instead of one strided read (that
+    decompresses the same chunks again) per channel.
+    """
+    if axis not in (0, -1):
+        raise ValueError("Channel axis should be 0 or -1.")
+    shape = dataset.shape[1:] if axis == 0 else dataset.shape[:-1]
+    dtype = dataset.dtype if dtype is None else np.dtype(dtype)
+    if outs is None:
+        outs = [None] * len(indices)
+    outs = [np.empty(shape, dtype=dtype) if out is None else out for out in outs]
+    if not len(indices):
+        return outs
+    step = _channel_chunk(dataset, axis)
+    if step == 1:
+        # converting the dtype in NumPy is faster than in HDF5
+        raw = None
+        for idx, out in zip(indices, outs):
+            if axis == 0:
+                start, count = (idx,) + (0,) * len(shape), (1,) + shape
+            else:
+                start, count = (0,) * len(shape) + (idx,), shape + (1,)
+            if out.dtype == dataset.dtype:
+                read_hyperslab(dataset, out, start, count)
+            else:
+                raw = np.empty(shape, dtype=dataset.dtype) if raw is None else raw
+                out[...] = read_hyperslab(dataset, raw, start, count)
+        return outs
+    for r0, r1, blocks in iter_channel_blocks(dataset, indices, axis=axis):
+        for out, block in zip(outs, blocks):
+            out[r0:r1] = block
+    return outs
+
+def iter_channel_blocks(dataset, indices, axis=0):
+    """Yield `(r0, r1, blocks)` over the rows of `dataset`, `blocks` holding
+    the raw rows `r0:r1` of channels `indices` along `axis` (0 or -1). The
+    rows of every chunk of the requested channels are read once."""
+    if axis not in (0, -1):
+        raise ValueError("Channel axis should be 0 or -1.")
+    shape = dataset.shape[1:] if axis == 0 else dataset.shape[:-1]
+    ranges = _channel_ranges(indices, _channel_chunk(dataset, axis), dataset.shape[axis])
+    if not ranges:
+        return
+    rows = min(_block_rows(dataset, axis, c1 - c0) for c0, c1 in ranges)
+    zeros = (0,) * (len(shape) - 1)
+    for r0 in range(0, shape[0], rows):
+        r1 = min(shape[0], r0 + rows)
+        channels = {}
+        for c0, c1 in ranges:
+            if axis == 0:
+                start, count = (c0, r0) + zeros, (c1 - c0, r1 - r0) + shape[1:]
+            else:
+                start, count = (r0,) + zeros + (c0,), (r1 - r0,) + shape[1:] + (c1 - c0,)
+            block = read_hyperslab(dataset, np.empty(count, dtype=dataset.dtype), start, count)
+            for idx in indices:
+                if c0 <= idx < c1:
+                    channels[idx] = block[idx - c0] if axis == 0 else block[..., idx - c0]
+        yield r0, r1, [channels[idx] for idx in indices]
+
+def iter_row_blocks(dataset):
+    """Yield `(r0, r1, block)` over the rows of `dataset` in blocks of about
+    `BLOCK_BYTES`, aligned to its chunks."""
+    row_bytes = dataset.dtype.itemsize * int(np.prod(dataset.shape[1:], dtype=np.int64))
+    rows = max(1, BLOCK_BYTES // max(1, row_bytes))
+    if dataset.chunks is not None:
+        rows = max(1, rows // dataset.chunks[0]) * dataset.chunks[0]
+    for r0 in range(0, dataset.shape[0], rows):
+        r1 = min(dataset.shape[0], r0 + rows)
+        yield r0, r1, dataset[r0:r1]
@@ -1,63 +1,275 @@
 """FY-3 MWHS-II L1 Reader base"""
 
+import copy
 import h5py
+import functools
 import numpy as np
 from datetime import datetime
-from functools import lru_cache
 from fy3Reader.resample import (
     lonlat_interp,
     kdtree_interp,
     spline_interp,
     bicubic_interp,
-    rgb_project
+    rgb_project,
+    n_workers
 )
+from concurrent.futures import ThreadPoolExecutor
+from fy3Reader.parallel import load_bands, resample_bands
+from fy3Reader.writer import ProductWriter
+from fy3Reader.regions import box_windows
+from fy3Reader.h5io import read_channels, read_strided, memmap_dataset, CalibratedMemmap
 
 class MWHS_BASE(object):
 
-    def __init__(self, fname):
-        self._datasets = h5py.File(fname, "r")
+    def __init__(self, fname, pool=None, cache=None, mmap=False):
+        self.fname = fname
+        self._file = h5py.File(fname, "r")
+        self._indices = (None, None, {})
+        # optional `BufferPool` to read, calibrate & resample into
+        self.pool = pool
+        self._pooled = []
+        # optional `GranuleCache` of decoded bands & geolocation
+        self.cache = cache
+        # map contiguous & uncompressed datasets instead of reading them,
+        # bands are then `CalibratedMemmap` calibrated on `np.asarray`
+        self.mmap = mmap
         self.dataset_name = None
         self.data = None
         self.latitude = None
+        self.scanline_times = None
         self.longitude = None
         self.MWHS_DATASETS = None
         self.MWHS_DATASETS_EXACT = None
         self.COMPOSITE_BANDS = None
 
+    @property
+    def _datasets(self):
+        # reopened on first use after unpickling
+        if self._file is None:
+            self._file = h5py.File(self.fname, "r")
+        return self._file
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self):
+        # the file is reopened by name, buffers of the pool stay in this process
+        state = self.__dict__.copy()
+        state["_file"] = None
+        state["_indices"] = (None, None, {})
+        state["pool"], state["_pooled"] = None, []
+        return state
+
     @staticmethod
-    def _cal_bt(dataset, intercept, slope):
+    def _cal_bt(dataset, intercept, slope, out=None):
         # 0 slope is invalid. Note: slope can be a scalar or array.
         slope = np.where(slope == 0, 1, slope)
-        dataset = dataset * slope + intercept
-        return dataset
+        if out is None:
+            dataset = dataset * slope + intercept
+            return dataset
+        # in place, `out` may already hold the raw counts
+        np.multiply(dataset, slope, out=out)
+        out += intercept
+        return out
+
+    def _cal_dtype(self, EOB):
+        # dtype of the calibrated values, the same as a `_cal_bt` of the raw counts
+        return self._cal_bt(np.zeros(1, dtype=EOB.dtype), EOB.attrs["Intercept"], EOB.attrs["Slope"]).dtype
 
     @staticmethod
     def _autodecode(string, encoding="gbk"):
         return string.decode(encoding) if isinstance(string, bytes) else string
 
-    @lru_cache(maxsize=2)
-    def _get_indices(self, georange):
+    @staticmethod
+    def _box_mask(longitude, latitude, georange):
         latmin, latmax, lonmin, lonmax = georange
+        if lonmin > lonmax:
+            # box crossing the antimeridian, e.g. (lonmin, lonmax) = (170, -170)
+            lon_mask = (
+                  ((longitude >= lonmin) & (longitude <= 180))
+                | ((longitude >= -180) & (longitude <= lonmax))
+            )
+        else:
+            lon_mask = (longitude >= lonmin) & (longitude <= lonmax)
         barr = (
-              (self.latitude >= latmin)
-            & (self.latitude <= latmax)
-            & (self.longitude >= lonmin)
-            & (self.longitude <= lonmax)
+              (latitude >= latmin)
+            & (latitude <= latmax)
+            & lon_mask
         )
-        barrind_y, barrind_x = np.where(barr)
+        return barr
+
+    @classmethod
+    def _box_indices(cls, longitude, latitude, georange):
+        barrind_y, barrind_x = np.where(cls._box_mask(longitude, latitude, georange))
         yi, yj = np.amin(barrind_y), np.amax(barrind_y)
         xi, xj = np.amin(barrind_x), np.amax(barrind_x)
         return yi, yj, xi, xj
 
+    def _get_indices(self, georange):
+        # cached per instance, for the current coordinates only
+        longitude, latitude, indices = self._indices
+        if longitude is not self.longitude or latitude is not self.latitude:
+            indices = {}
+            self._indices = (self.longitude, self.latitude, indices)
+        if georange not in indices:
+            indices[georange] = self._box_indices(self.longitude, self.latitude, georange)
+        return indices[georange]
+
     def all_available_datasets(self):
         return NotImplemented
 
     def get_exact_dataset_name(self, dataset_name):
         return self.MWHS_DATASETS_EXACT[dataset_name]
 
-    def load(self, name):
+    def _band_source(self, name):
+        """Return the geolocation group, the calibration dataset, the channel
+        index and the channel axis of band `name`."""
         return NotImplemented
 
+    def _acquire(self, shape, dtype=np.float64):
+        """Buffer from the pool held until the next `release`, or None
+        (let the callee allocate) without a pool."""
+        if self.pool is None:
+            return None
+        buf = self.pool.acquire(shape, dtype)
+        self._pooled.append(buf)
+        return buf
+
+    def release(self):
+        """Give every buffer got from the pool back to it, arrays of this
+        reader must not be used afterwards."""
+        if self.pool is not None:
+            for buf in self._pooled:
+                self.pool.release(buf)
+        self._pooled = []
+
+    def _read_direct(self, dataset):
+        out = self._acquire(dataset.shape, dataset.dtype)
+        dataset.read_direct(out)
+        return out
+
+    def _cached(self, group, band, loader, window=None):
+        if self.cache is None:
+            return loader()
+        return self.cache.fetch(self.cache.key(self._datasets.filename, group, band, window), loader)
+
+    def _read_band(self, name):
+        EOB = self._band_source(name)[1]
+        return self._cached(EOB.name, name, lambda: self._decode_bands([name])[0])
+
+    def _read_bands(self, names):
+        """Read & calibrate `names`, channels of one dataset in one pass."""
+        if self.cache is None:
+            return self._decode_bands(names)
+        keys = [self.cache.key(self._datasets.filename, self._band_source(name)[1].name, name) for name in names]
+        bands = [self.cache.get(key) for key in keys]
+        missing = [idx for idx, band in enumerate(bands) if band is None]
+        for idx, band in zip(missing, self._decode_bands([names[idx] for idx in missing])):
+            bands[idx] = self.cache.put(keys[idx], band)
+        return bands
+
+    def _decode_bands(self, names):
+        groups = {}
+        for idx, name in enumerate(names):
+            _, EOB, dataset_index, axis = self._band_source(name)
+            groups.setdefault(EOB.name, (EOB, axis, []))[2].append((idx, dataset_index))
+        bands = [None] * len(names)
+        for EOB, axis, channels in groups.values():
+            raw = memmap_dataset(EOB) if self.mmap else None
+            if raw is not None:
+                calibrate = functools.partial(self._cal_bt, intercept=EOB.attrs["Intercept"], slope=EOB.attrs["Slope"])
+                for idx, dataset_index in channels:
+                    bands[idx] = CalibratedMemmap(raw[dataset_index] if axis == 0 else raw[..., dataset_index], calibrate)
+                continue
+            shape = EOB.shape[1:] if axis == 0 else EOB.shape[:-1]
+            dtype = self._cal_dtype(EOB)
+            # raw counts are converted by HDF5 into the outputs, then calibrated in place
+            outs = read_channels(
+                EOB, [dataset_index for _, dataset_index in channels], axis=axis,
+                outs=[self._acquire(shape, dtype) for _ in channels], dtype=dtype
+            )
+            for (idx, _), out in zip(channels, outs):
+                bands[idx] = self._cal_bt(out, EOB.attrs["Intercept"], EOB.attrs["Slope"], out=out)
+        return bands
+
+    def _read_overview(self, group, band, stride, loader, overviews):
+        # strided reads are kept in the overview pyramid if any, else in the cache
+        if overviews is not None:
+            return overviews.fetch(group, band, stride, loader)
+        return self._cached(group, band, loader, window=("stride", stride))
+
+    def _decode_strided(self, name, stride):
+        _, EOB, dataset_index, axis = self._band_source(name)
+        band = read_strided(EOB, stride, index=dataset_index, axis=axis, dtype=self._cal_dtype(EOB))
+        return self._cal_bt(band, EOB.attrs["Intercept"], EOB.attrs["Slope"], out=band)
+
+    def _read_strided_bands(self, names, stride, overviews=None):
+        """Read & calibrate every `stride`-th scan line & pixel of `names`."""
+        return [
+            self._read_overview(self._band_source(name)[1].name, name, stride, lambda name=name: self._decode_strided(name, stride), overviews)
+            for name in names
+        ]
+
+    def _read_lonlat(self, name, stride=1, overviews=None):
+        if name in self.COMPOSITE_BANDS:
+            name = self.COMPOSITE_BANDS[name]["bands"][0]
+        geolocation = self._band_source(name)[0]
+        if stride > 1:
+            return tuple(
+                self._read_overview(geolocation.name, k, stride, lambda k=k: read_strided(geolocation[k], stride), overviews)
+                for k in ("Longitude", "Latitude")
+            )
+        return tuple(
+            self._cached(geolocation.name, k, lambda k=k: self._read_dataset(geolocation[k]))
+            for k in ("Longitude", "Latitude")
+        )
+
+    def _read_dataset(self, dataset):
+        data = memmap_dataset(dataset) if self.mmap else None
+        if data is not None:
+            return data
+        return dataset[:] if self.pool is None else self._read_direct(dataset)
+
+    def load(self, name, processes=None, stride=1, overviews=None):
+        """Load band or composite `name`, of every `stride`-th scan line &
+        pixel only for a quicklook (kept in `overviews` if given, see
+        `fy3Reader.quicklook`)."""
+        # buffers of the previous load are reused
+        self.release()
+        if stride > 1:
+            bands = self.COMPOSITE_BANDS[name]["bands"] if name in self.COMPOSITE_BANDS else [name]
+            band_datas = self._read_strided_bands(bands, stride, overviews)
+            if name in self.COMPOSITE_BANDS:
+                self.composite_func = self.COMPOSITE_BANDS[name]["func"]
+            else:
+                band_datas = band_datas[0]
+                self.composite_func = None
+        elif name in self.COMPOSITE_BANDS and processes is not None:
+            # read bands in worker processes into one shared array
+            band_datas = list(load_bands(self, self.COMPOSITE_BANDS[name]["bands"], processes=processes))
+            self.composite_func = self.COMPOSITE_BANDS[name]["func"]
+        elif name in self.COMPOSITE_BANDS:
+            band_datas = self._read_bands(self.COMPOSITE_BANDS[name]["bands"])
+            self.composite_func = self.COMPOSITE_BANDS[name]["func"]
+        else:
+            band_datas = self._read_band(name)
+            self.composite_func = None
+        self.dataset_name = name
+        # load lonlat & data
+        self.longitude, self.latitude = self._read_lonlat(name, stride, overviews)
+        if stride > 1:
+            band = self.COMPOSITE_BANDS[name]["bands"][0] if name in self.COMPOSITE_BANDS else name
+            self.scanline_times = self._scanline_times(self._band_source(band)[0]["Latitude"].shape[0])[::stride]
+        else:
+            self.scanline_times = self._scanline_times(self.latitude.shape[0])
+        self.data = band_datas
+
+    def register_composite(self, name, bands, func, fractions=None, rgb=True):
+        """Register a composite, e.g. one declared by `fused_composite`."""
+        self.COMPOSITE_BANDS[name] = {"bands": list(bands), "func": func, "fractions": fractions, "rgb": rgb}
+
     @property
     def attrs(self):
         return {k: self._autodecode(v) for k, v in self._datasets.attrs.items()}
@@ -84,10 +296,17 @@ class MWHS_BASE(object):
         except ValueError:
             return datetime.strptime(time, "%Y-%m-%d %H:%M:%S")
 
-    def _check_box(self, ll_box, idx_box):
+    def _scanline_times(self, n):
+        # scan lines are assumed evenly spaced between the observing beginning & ending times
+        start = np.datetime64(self.start_time, 'ms')
+        duration = (np.datetime64(self.end_time, 'ms') - start).astype(np.int64)
+        return start + (np.linspace(0, 1, n) * duration).astype('timedelta64[ms]')
+
+    def _check_box(self, ll_box, idx_box, lonlats=None):
         yi, yj, xi, xj = idx_box
-        _lats = self.latitude[yi:yj, xi:xj]
-        _lons = self.longitude[yi:yj, xi:xj]
+        lons, lats = self.get_lonlats() if lonlats is None else lonlats
+        _lats = lats[yi:yj, xi:xj]
+        _lons = lons[yi:yj, xi:xj]
         _valid_lats = ~(_lats == 65535)
         _valid_lons = ~(_lons == 65535)
         latmin, latmax, lonmin, lonmax = (
@@ -97,6 +316,12 @@ class MWHS_BASE(object):
             _lons[_valid_lons].max()
         )
         check_latmin, check_latmax, check_lonmin, check_lonmax = ll_box
+        if check_lonmin > check_lonmax:
+            # compare in longitudes unwrapped across the antimeridian
+            _lons = _lons[_valid_lons]
+            _lons = np.where(_lons < 0, _lons + 360, _lons)
+            lonmin, lonmax = _lons.min(), _lons.max()
+            check_lonmax += 360
         if (
             (latmin - check_latmin) > 5 or \
             (latmax - check_latmax) > 5 or \
@@ -111,17 +336,48 @@ class MWHS_BASE(object):
                 "Longitude or Latitude or data is empty, "
                 "you should run `load` first."
             )
-        yi, yj, xi, xj = self._get_indices(ll_box)
-        self._check_box(ll_box, (yi, yj, xi, xj))
+        idx_box = self._get_indices(ll_box)
+        self._check_box(ll_box, idx_box)
+        self._crop_window(idx_box)
+
+    def crop_many(self, boxes):
+        """Crop the loaded data to each of `boxes` at once, the windows are
+        found in one scan of the geolocation. Return one sub-reader per box,
+        viewing (not copying) the arrays of this reader, that can be resampled
+        or composited on its own (see `fy3Reader.regions.extract_regions`).
+        This reader is not changed, its next `load` with a pool reuses the
+        buffers the regions view."""
+        if self.longitude is None or self.latitude is None or self.data is None:
+            raise ValueError(
+                "Longitude or Latitude or data is empty, "
+                "you should run `load` first."
+            )
+        boxes = [tuple(box) for box in boxes]
+        regions = []
+        for ll_box, idx_box in zip(boxes, box_windows(self.longitude, self.latitude, boxes, self._box_mask)):
+            self._check_box(ll_box, idx_box)
+            # copied as pickled (own file handle & list of pooled buffers),
+            # sharing the pool for the outputs of the region
+            region = copy.copy(self)
+            region.pool = self.pool
+            region._crop_window(idx_box)
+            regions.append(region)
+        return regions
+
+    def _crop_window(self, idx_box):
+        yi, yj, xi, xj = idx_box
         self.latitude = self.latitude[yi:yj, xi:xj]
         self.longitude = self.longitude[yi:yj, xi:xj]
+        self.scanline_times = self.scanline_times[yi:yj]
         if self.composite_func is None:
             self.data = self.data[yi:yj, xi:xj]
         else:
-            for idx, d in enumerate(self.data):
-                self.data[idx] = d[yi:yj, xi:xj]
+            # a new list, the bands of the uncropped reader stay as they are
+            self.data = [d[yi:yj, xi:xj] for d in self.data]
 
-    def composite(self, **kwargs):
+    def composite(self, workers=None, limits=None, **kwargs):
+        """Make the composite of the loaded bands, `limits` replace the
+        stretch of its channels, see `FusedComposite`."""
         if self.longitude is None or self.latitude is None or self.data is None:
             raise ValueError(
                 "Longitude or Latitude or data is empty, "
@@ -132,14 +388,19 @@ class MWHS_BASE(object):
                 "Composite method for this band is not supported, "
                 "or you should reload the data after the previous composite."
             )
-        cm = self.composite_func(self.data, fractions=self.COMPOSITE_BANDS[self.dataset_name]["fractions"])
+        cm = self.composite_func(self.data, fractions=self.COMPOSITE_BANDS[self.dataset_name]["fractions"], limits=limits)
+        shape = np.shape(self.data[0])
         if self.COMPOSITE_BANDS[self.dataset_name]["rgb"]:
-            self.data = rgb_project(self.longitude, self.latitude, cm.composite(), **kwargs)
+            shape += (len(cm.channels),)
+            rgb = cm.composite(out=self._acquire(shape, np.uint8))
+            self.data = rgb_project(
+                self.longitude, self.latitude, rgb, out=self._acquire(shape, np.uint8), workers=n_workers(workers), **kwargs
+            )
         else:
-            self.data = cm.composite()
+            self.data = cm.composite(out=self._acquire(shape))
         self.composite_func = None
 
-    def resample(self, resampler='nearest', to_shape=None, **kwargs):
+    def resample(self, resampler='nearest', to_shape=None, processes=None, workers=None, **kwargs):
         if self.longitude is None or self.latitude is None or self.data is None:
             raise ValueError(
                 "Longitude or Latitude or data is empty, "
@@ -151,20 +412,25 @@ class MWHS_BASE(object):
             raise ValueError("`to_shape` parameter should be provided.")
         if not len(to_shape) == 2:
             raise ValueError("`to_shape` should be a list or tuple that length is 2.")
+        # a resampled grid has no scan lines
+        self.scanline_times = None
         if self.composite_func is None:
             if self.dataset_name in self.COMPOSITE_BANDS:
                 return
             if resampler == 'nearest':
                 self.longitude, self.latitude, self.data = kdtree_interp(
-                    self.longitude, self.latitude, self.data, to_shape, no_xy=False
+                    self.longitude, self.latitude, self.data, to_shape, no_xy=False, out=self._acquire(to_shape),
+                    workers=n_workers(workers)
                 )
             elif resampler == 'spline':
                 self.longitude, self.latitude, self.data = spline_interp(
-                    self.longitude, self.latitude, self.data, to_shape, no_xy=False
+                    self.longitude, self.latitude, self.data, to_shape, no_xy=False, out=self._acquire(to_shape),
+                    workers=n_workers(workers)
                 )
             elif resampler == 'bicubic':
                 self.longitude, self.latitude, self.data = bicubic_interp(
-                    self.longitude, self.latitude, self.data, to_shape, no_xy=False
+                    self.longitude, self.latitude, self.data, to_shape, no_xy=False, out=self._acquire(to_shape),
+                    workers=n_workers(workers)
                 )
         else:
             # start interploation
@@ -178,11 +444,41 @@ class MWHS_BASE(object):
             elif resampler == 'bicubic':
                 interp_lonlat = lonlat_interp
                 interp_data = bicubic_interp
-            for idx, d in enumerate(self.data):
-                self.data[idx] = interp_data(self.longitude, self.latitude, d, to_shape, no_xy=True)
+            if processes is not None:
+                self.data = list(resample_bands(
+                    self.longitude, self.latitude, self.data, to_shape, resampler=resampler, processes=processes
+                ))
+            else:
+                # bands in threads (the kernels release the GIL), the rest of
+                # the workers for the KD-tree queries & bicubic rows of each band
+                threads = min(n_workers(workers), len(self.data))
+                band_workers = max(1, n_workers(workers) // threads)
+                outs = [self._acquire(to_shape) for _ in self.data]
+                def interp_band(args):
+                    d, out = args
+                    return interp_data(self.longitude, self.latitude, d, to_shape, no_xy=True, out=out, workers=band_workers)
+                if threads == 1:
+                    self.data = [interp_band(args) for args in zip(self.data, outs)]
+                else:
+                    with ThreadPoolExecutor(threads) as pool:
+                        self.data = list(pool.map(interp_band, zip(self.data, outs)))
             self.longitude, self.latitude = interp_lonlat(self.longitude, self.latitude, to_shape)
             # make data projected
-            self.composite(**kwargs)
+            self.composite(workers=workers, **kwargs)
+
+    def save(self, fname, **kwargs):
+        """Save data & coordinates into a chunked, compressed file, see `ProductWriter`."""
+        if self.longitude is None or self.latitude is None or self.data is None:
+            raise ValueError(
+                "Longitude or Latitude or data is empty, "
+                "you should run `load` first."
+            )
+        if self.composite_func is not None:
+            raise ValueError(
+                "Composite bands should be resampled or composited before saving."
+            )
+        with ProductWriter(fname, **kwargs) as writer:
+            writer.write(self.dataset_name, self.data, self.longitude, self.latitude)
 
     def get_lonlats(self):
         return self.longitude, self.latitude
@@ -5,8 +5,8 @@ from fy3Reader.composite import *
 
 class FY3D_MWRI_L1(MWRI_BASE):
 
-    def __init__(self, fname):
-        super(FY3D_MWRI_L1, self).__init__(fname)
+    def __init__(self, fname, **kwargs):
+        super(FY3D_MWRI_L1, self).__init__(fname, **kwargs)
         if not self.attrs["Satellite Name"] == "FY-3D":
             raise ValueError("Satellite not matched")
         self.MWRI_DATASETS = {"S1": ["btemp_10.0v","btemp_10.0h","btemp_19.0v","btemp_19.0h","btemp_23.0v","btemp_23.0h","btemp_37.0v","btemp_37.0h","btemp_89.0v","btemp_89.0h"]}
@@ -15,37 +15,20 @@ class FY3D_MWRI_L1(MWRI_BASE):
     def all_available_datasets(self):
         return self.MWRI_DATASETS["S1"]
 
-    def load(self, name):
+    def _band_source(self, name):
         if name in self.MWRI_DATASETS["S1"]:
-            dataset_index = self.MWRI_DATASETS["S1"].index(name)
-            flag = "EARTH_OBSERVE_BT_10_to_89GHz"
-            self.composite_func = None
-        elif name in self.COMPOSITE_BANDS:
-            band_datas = []
-            for band in self.COMPOSITE_BANDS[name]["bands"]:
-                self.load(band)
-                band_datas.append(self.data)
-            self.composite_func = self.COMPOSITE_BANDS[name]["func"]
-        else:
-            raise ValueError(f"Dataset not found: {name}")
-        self.dataset_name = name
-        # load lonlat & data
-        self.latitude = self._datasets["Geolocation"]["Latitude"][:]
-        self.longitude = self._datasets["Geolocation"]["Longitude"][:]
-        if self.composite_func is None:
-            EOB = self._datasets["Calibration"][flag]
-            self.data = self._cal_bt(
-                EOB[dataset_index, ...],
-                EOB.attrs["Intercept"],
-                EOB.attrs["Slope"]
+            return (
+                self._datasets["Geolocation"],
+                self._datasets["Calibration"]["EARTH_OBSERVE_BT_10_to_89GHz"],
+                self.MWRI_DATASETS["S1"].index(name),
+                0
             )
-        else:
-            self.data = band_datas
+        raise ValueError(f"Dataset not found: {name}")
 
 class FY3F_MWRI_L1(MWRI_BASE):
 
-    def __init__(self, fname):
-        super(FY3F_MWRI_L1, self).__init__(fname)
+    def __init__(self, fname, **kwargs):
+        super(FY3F_MWRI_L1, self).__init__(fname, **kwargs)
         if not self.attrs["Satellite Name"] == "FY-3F":
             raise ValueError("Satellite not matched")
         self.MWRI_DATASETS = {"S1": ["btemp_10.0v","btemp_10.0h","btemp_19.0v","btemp_19.0h","btemp_23.0v","btemp_23.0h","btemp_37.0v","btemp_37.0h","btemp_89.0v","btemp_89.0h"], "S2": ["btemp_50.0v","btemp_50.0h","btemp_52.0v","btemp_52.0h","btemp_53.24v","btemp_53.24h","btemp_53.75v","btemp_53.75h","btemp_118.0_3v","btemp_118.0_2v","btemp_118.0_1.4v","btemp_118.0_1.2v","btemp_165.5v","btemp_183.0_2v","btemp_183.0_3v","btemp_183.0_7v"]}
@@ -62,44 +45,21 @@ class FY3F_MWRI_L1(MWRI_BASE):
     def all_available_datasets(self):
         return self.MWRI_DATASETS["S1"] + self.MWRI_DATASETS["S2"]
 
-    def load(self, name):
+    def _band_source(self, name):
         if name in self.MWRI_DATASETS["S1"]:
             dataset_index = self.MWRI_DATASETS["S1"].index(name)
             dataset = self._datasets["Window Channel"]
-            flag = "EARTH_OBSERVE_BT"
-            self.composite_func = None
         elif name in self.MWRI_DATASETS["S2"]:
             dataset_index = self.MWRI_DATASETS["S2"].index(name)
             dataset = self._datasets["Sounding Channel"]
-            flag = "EARTH_OBSERVE_BT"
-            self.composite_func = None
-        elif name in self.COMPOSITE_BANDS:
-            band_datas = []
-            for band in self.COMPOSITE_BANDS[name]["bands"]:
-                self.load(band)
-                band_datas.append(self.data)
-            dataset = self._datasets[self.COMPOSITE_BANDS[name]["dataset"]]
-            self.composite_func = self.COMPOSITE_BANDS[name]["func"]
         else:
             raise ValueError(f"Dataset not found: {name}")
-        self.dataset_name = name
-        # load lonlat & data
-        self.latitude = dataset["Geolocation"]["Latitude"][:]
-        self.longitude = dataset["Geolocation"]["Longitude"][:]
-        if self.composite_func is None:
-            EOB = dataset["Calibration"][flag]
-            self.data = self._cal_bt(
-                EOB[..., dataset_index],
-                EOB.attrs["Intercept"],
-                EOB.attrs["Slope"]
-            )
-        else:
-            self.data = band_datas
+        return dataset["Geolocation"], dataset["Calibration"]["EARTH_OBSERVE_BT"], dataset_index, -1
 
 class FY3G_MWRI_L1(MWRI_BASE):
 
-    def __init__(self, fname):
-        super(FY3G_MWRI_L1, self).__init__(fname)
+    def __init__(self, fname, **kwargs):
+        super(FY3G_MWRI_L1, self).__init__(fname, **kwargs)
         if not self.attrs["Satellite Name"] == "FY-3G":
             raise ValueError("Satellite not matched")
         self.MWRI_DATASETS = {"S1": ["btemp_10.0v","btemp_10.0h","btemp_19.0v","btemp_19.0h","btemp_23.0v","btemp_23.0h","btemp_37.0v","btemp_37.0h","btemp_89.0v","btemp_89.0h"], "S2": ["btemp_50.0v","btemp_50.0h","btemp_52.0v","btemp_52.0h","btemp_53.24v","btemp_53.24h","btemp_53.75v","btemp_53.75h","btemp_118.0_3v","btemp_118.0_2v","btemp_118.0_1.4v","btemp_118.0_1.2v","btemp_165.5v","btemp_183.0_2v","btemp_183.0_3v","btemp_183.0_7v"]}
@@ -108,36 +68,15 @@ class FY3G_MWRI_L1(MWRI_BASE):
     def all_available_datasets(self):
         return self.MWRI_DATASETS["S1"] + self.MWRI_DATASETS["S2"]
 
-    def load(self, name):
+    def _band_source(self, name):
         if name in self.MWRI_DATASETS["S1"]:
             dataset_index = self.MWRI_DATASETS["S1"].index(name)
             dataset = self._datasets["S1"]
             flag = "EARTH_OBSERVE_BT_10_to_89GHz"
-            self.composite_func = None
         elif name in self.MWRI_DATASETS["S2"]:
             dataset_index = self.MWRI_DATASETS["S2"].index(name)
             dataset = self._datasets["S2"]
             flag = "EARTH_OBSERVE_BT_50_to_183GHz"
-            self.composite_func = None
-        elif name in self.COMPOSITE_BANDS:
-            band_datas = []
-            for band in self.COMPOSITE_BANDS[name]["bands"]:
-                self.load(band)
-                band_datas.append(self.data)
-            dataset = self._datasets[self.COMPOSITE_BANDS[name]["dataset"]]
-            self.composite_func = self.COMPOSITE_BANDS[name]["func"]
         else:
             raise ValueError(f"Dataset not found: {name}")
-        self.dataset_name = name
-        # load lonlat & data
-        self.latitude = dataset["Geolocation"]["Latitude"][:]
-        self.longitude = dataset["Geolocation"]["Longitude"][:]
-        if self.composite_func is None:
-            EOB = dataset["Data"][flag]
-            self.data = self._cal_bt(
-                EOB[..., dataset_index],
-                EOB.attrs["Intercept"],
-                EOB.attrs["Slope"]
-            )
-        else:
-            self.data = band_datas
+        return dataset["Geolocation"], dataset["Data"][flag], dataset_index, -1
@@ -0,0 +1,147 @@
+"""Parallel band reads & resampling with results in shared memory"""
+
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from fy3Reader.resample import kdtree_interp, spline_interp, bicubic_interp
+
+_INTERP_FUNCS = {
+    'nearest': kdtree_interp,
+    'spline': spline_interp,
+    'bicubic': bicubic_interp,
+}
+
+# bands of a call smaller than this in total are read & resampled in the
+# calling process, a task round trip costs more than it saves
+MIN_PARALLEL_BYTES = 16 * 1024 * 1024
+
+# process pools kept for the whole session, by number of processes
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+# readers opened by a worker process, reused by the next calls on a granule
+_READERS = OrderedDict()
+MAX_WORKER_READERS = 8
+
+def process_pool(processes=None):
+    """Executor of `processes`: an `Executor` given by the caller is used as
+    is, otherwise a process pool of that size kept and shared by every call
+    (reads, resampling & writes), so workers are spawned once per session."""
+    if isinstance(processes, Executor):
+        return processes
+    with _POOLS_LOCK:
+        if processes not in _POOLS:
+            _POOLS[processes] = ProcessPoolExecutor(processes)
+        return _POOLS[processes]
+
+def shutdown_pools(wait=True):
+    """Shut the shared process pools down, e.g. before forking a service."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
+
+class _SharedOwner(np.ndarray):
+    """Array holding a shared memory block, it is kept as the base of every
+    array handed out so the block lives as long as they do."""
+
+def _attach(name):
+    return shared_memory.SharedMemory(name=name)
+
+def _shared_empty(shape, dtype=np.float64):
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+    owner = _SharedOwner(shape, dtype=dtype, buffer=shm.buf)
+    owner._shm = shm
+    return shm, owner.view(np.ndarray)
+
+def _worker_reader(reader_class, fname, kwargs):
+    # a granule replaced in place is opened again
+    stat = os.stat(fname)
+    key = (reader_class, os.path.abspath(fname), stat.st_mtime_ns, stat.st_size, getattr(kwargs.get("cache"), "directory", None))
+    reader = _READERS.pop(key, None)
+    if reader is None:
+        reader = reader_class(fname, **kwargs)
+    _READERS[key] = reader
+    while len(_READERS) > MAX_WORKER_READERS:
+        _READERS.popitem(last=False)[1].close()
+    return reader
+
+def _read_band_into(args):
+    reader_class, fname, kwargs, name, index, shm_name, shape, dtype = args
+    shm = _attach(shm_name)
+    out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    out[index] = _worker_reader(reader_class, fname, kwargs)._read_band(name)
+    del out
+    shm.close()
+
+def _resample_band_into(args):
+    index, lonlat_name, lonlat_shape, lonlat_dtype, band_name, band_shape, band_dtype, dst_name, dst_shape, resampler = args
+    lonlat_shm, band_shm, dst_shm = _attach(lonlat_name), _attach(band_name), _attach(dst_name)
+    lonlats = np.ndarray(lonlat_shape, dtype=lonlat_dtype, buffer=lonlat_shm.buf)
+    bands = np.ndarray(band_shape, dtype=band_dtype, buffer=band_shm.buf)
+    out = np.ndarray(dst_shape, dtype=np.float64, buffer=dst_shm.buf)
+    out[index] = _INTERP_FUNCS[resampler](lonlats[0], lonlats[1], bands[index], dst_shape[1:], no_xy=True)
+    del lonlats, bands, out
+    for shm in (lonlat_shm, band_shm, dst_shm):
+        shm.close()
+
+def load_bands(reader, names, processes=None):
+    """Read and calibrate `names` of `reader` in worker processes of
+    `process_pool(processes)`.
+
+    Every worker writes its band straight into one shared (C, H, W) array,
+    which is returned to the caller without pickling or copying. A single
+    band, or bands under `MIN_PARALLEL_BYTES` are read serially instead.
+    """
+    geolocation, EOB, _, _ = reader._band_source(names[0])
+    shape = (len(names),) + geolocation["Latitude"].shape
+    # same dtype as a serial `_read_band`
+    dtype = reader._cal_dtype(EOB)
+    if len(names) < 2 or np.prod(shape) * dtype.itemsize < MIN_PARALLEL_BYTES:
+        return reader._read_bands(names)
+    shm, stack = _shared_empty(shape, dtype=dtype)
+    # workers share the cache of the reader, not its buffer pool
+    reader_args = (type(reader), reader.fname, {"cache": reader.cache})
+    try:
+        list(process_pool(processes).map(
+            _read_band_into, [reader_args + (name, idx, shm.name, shape, dtype) for idx, name in enumerate(names)]
+        ))
+    finally:
+        shm.unlink()
+    return stack
+
+def resample_bands(lons, lats, datas, to_shape, resampler='nearest', processes=None):
+    """Resample every band of `datas` in worker processes of
+    `process_pool(processes)`, results are written into one shared (C, M, N)
+    array. A single band, or bands under `MIN_PARALLEL_BYTES` are resampled
+    serially instead."""
+    if resampler not in _INTERP_FUNCS:
+        raise ValueError("Resampler only supports `nearest`, `spline` and `bicubic`.")
+    if len(datas) < 2 or sum(np.asarray(d).nbytes for d in datas) < MIN_PARALLEL_BYTES:
+        stack = np.empty((len(datas),) + tuple(to_shape))
+        for idx, d in enumerate(datas):
+            _INTERP_FUNCS[resampler](lons, lats, d, tuple(to_shape), no_xy=True, out=stack[idx])
+        return stack
+    lonlat_shm, lonlats = _shared_empty((2,) + lons.shape, dtype=np.result_type(lons, lats))
+    band_shm, bands = _shared_empty((len(datas),) + lons.shape, dtype=np.result_type(*datas))
+    dst_shape = (len(datas),) + tuple(to_shape)
+    dst_shm, stack = _shared_empty(dst_shape)
+    try:
+        lonlats[0], lonlats[1] = lons, lats
+        for idx, d in enumerate(datas):
+            bands[idx] = d
+        args = (
+            lonlat_shm.name, lonlats.shape, lonlats.dtype,
+            band_shm.name, bands.shape, bands.dtype,
+            dst_shm.name, dst_shape, resampler
+        )
+        list(process_pool(processes).map(_resample_band_into, [(idx,) + args for idx in range(len(datas))]))
+    finally:
+        for shm in (lonlat_shm, band_shm, dst_shm):
+            shm.unlink()
+    return stack
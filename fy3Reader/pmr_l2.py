@@ -1,36 +1,79 @@
 """FY-3G PMR L2 Reader"""
 
+import copy
 import h5py
 import numpy as np
 from datetime import datetime
-from functools import lru_cache
+from scipy.spatial import cKDTree
 from fy3Reader.resample import kdtree_interp, spline_interp, bicubic_interp
+from fy3Reader.writer import ProductWriter
+from fy3Reader.regions import box_windows
 
 class FY3G_PMR_L2(object):
 
-    def __init__(self, fname):
-        self._datasets = h5py.File(fname, "r")
+    def __init__(self, fname, cache=None):
+        self.fname = fname
+        self._file = h5py.File(fname, "r")
+        self._indices = (None, None, {})
         if not self.attrs["Satellite Name"] == "FY-3G":
             raise ValueError("Satellite not matched")
         self.dataset_name = None
         self.data = self.latitude = self.longitude = None
+        self.scanline_times = None
+        # optional `GranuleCache` of decoded datasets & geolocation
+        self.cache = cache
+
+    @property
+    def _datasets(self):
+        # reopened on first use after unpickling
+        if self._file is None:
+            self._file = h5py.File(self.fname, "r")
+        return self._file
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self):
+        # the open file & the index cache are dropped, the file is reopened by name
+        state = self.__dict__.copy()
+        state["_file"] = None
+        state["_indices"] = (None, None, {})
+        return state
 
     @staticmethod
     def _autodecode(string, encoding="gbk"):
         return string.decode(encoding) if isinstance(string, bytes) else string
 
-    @lru_cache(maxsize=2)
     def _get_indices(self, georange):
+        # cached per instance, for the current coordinates only
+        longitude, latitude, indices = self._indices
+        if longitude is not self.longitude or latitude is not self.latitude:
+            indices = {}
+            self._indices = (self.longitude, self.latitude, indices)
+        if georange not in indices:
+            indices[georange] = self._box_indices(self.longitude, self.latitude, georange)
+        return indices[georange]
+
+    @staticmethod
+    def _box_mask(lon, lat, georange):
         latmin, latmax, lonmin, lonmax = georange
-        lat = self.latitude
-        lon = self.longitude
+        if lonmin > lonmax:
+            # box crossing the antimeridian, e.g. (lonmin, lonmax) = (170, -170)
+            lon_mask = ((lon > lonmin - 0.5) & (lon <= 180)) | ((lon >= -180) & (lon < lonmax + 0.5))
+        else:
+            lon_mask = (lon > lonmin - 0.5) & (lon < lonmax + 0.5)
         barr = (
             (lat > latmin - 0.5)
             & (lat < latmax + 0.5)
-            & (lon > lonmin - 0.5)
-            & (lon < lonmax + 0.5)
+            & lon_mask
         )
-        barrind = np.where(barr)
+        return barr
+
+    @classmethod
+    def _box_indices(cls, lon, lat, georange):
+        barrind = np.where(cls._box_mask(lon, lat, georange))
         barrind_y, barrind_x = barrind
         yi, yj = np.amin(barrind_y), np.amax(barrind_y)
         xi, xj = np.amin(barrind_x), np.amax(barrind_x)
@@ -39,24 +82,129 @@ class FY3G_PMR_L2(object):
     def all_available_datasets(self):
         return list(self._datasets["SLV"].keys())
 
-    def load(self, name, level=0):
-        if name not in self.all_available_datasets():
-            raise ValueError(f"Dataset not found: {name}")
+    @staticmethod
+    def _mask_invalid(data, fill):
+        # fill values of float datasets, compared as a value of their dtype
+        if np.issubdtype(data.dtype, np.floating):
+            data[data == data.dtype.type(-9999.9)] = fill
+        return data
+
+    @staticmethod
+    def _check_level(level):
         if level not in (0, 1):
             raise ValueError(
                 "Level of the geolocation should be "
                 "0 (surface of the Earth's ellipsoid) "
                 "or 1 (approx. 18 km above the Earth's ellipsoid)"
             )
+
+    @staticmethod
+    def _bin_slice(dataset, bins):
+        if bins is None or dataset.ndim < 3:
+            return ()
+        return (slice(*bins),)
+
+    def _cached(self, group, band, loader, window=None):
+        if self.cache is None:
+            return loader()
+        return self.cache.fetch(self.cache.key(self._datasets.filename, group, band, window), loader)
+
+    def _read_overview(self, group, band, stride, loader, overviews):
+        # strided reads are kept in the overview pyramid if any, else in the cache
+        if overviews is not None:
+            return overviews.fetch(group, band, stride, loader)
+        return self._cached(group, band, loader, window=("stride", stride))
+
+    def _read_geolocation(self, level, selection=np.s_[:, :]):
+        # hyperslab of the selected level only
+        geo = self._datasets["Geo_Fields"]
+        return (
+            self._mask_invalid(geo["Longitude"][selection + (level,)], np.inf),
+            self._mask_invalid(geo["Latitude"][selection + (level,)], np.inf)
+        )
+
+    def load(self, name, level=0, bins=None, stride=1, overviews=None):
+        """Load dataset `name` with the geolocation of `level`, for 3-D datasets
+        only the range bins `bins` (`(start, stop)`) are read. With `stride`
+        only every `stride`-th scan line & ray is read for a quicklook (kept in
+        `overviews` if given, see `fy3Reader.quicklook`)."""
+        if name not in self.all_available_datasets():
+            raise ValueError(f"Dataset not found: {name}")
+        self._check_level(level)
         self.dataset_name = name
+        dataset = self._datasets["SLV"][self.dataset_name]
+        window = bins if dataset.ndim == 3 else None
+        if stride > 1:
+            selection = np.s_[::stride, ::stride]
+            geo = self._datasets["Geo_Fields"]
+            self.longitude, self.latitude = (
+                self._read_overview(
+                    "/Geo_Fields", f"{k}_{level}", stride,
+                    lambda k=k: self._mask_invalid(geo[k][selection + (level,)], np.inf), overviews
+                )
+                for k in ("Longitude", "Latitude")
+            )
+            self.scanline_times = self._scanline_times(dataset.shape[0])[::stride]
+            band = name if window is None else f"{name}_{window[0]}_{window[1]}"
+            self.data = self._read_overview(
+                "/SLV", band, stride,
+                lambda: self._mask_invalid(dataset[selection + self._bin_slice(dataset, bins)], np.nan), overviews
+            )
+            return
         # load lonlat & data
-        self.longitude = self._datasets["Geo_Fields"]["Longitude"][:,:,level]
-        self.latitude = self._datasets["Geo_Fields"]["Latitude"][:,:,level]
-        self.data = self._datasets["SLV"][self.dataset_name][:]
-        # mask invalid values
-        self.longitude[self.longitude==-9999.9] = np.inf
-        self.longitude[self.longitude==-9999.9] = np.inf
-        self.data[self.data==-9999.9] = np.nan
+        # both coordinates in one entry of the cache
+        self.longitude, self.latitude = self._cached(
+            "/Geo_Fields", "lonlat", lambda: np.stack(self._read_geolocation(level)), window=level
+        )
+        self.scanline_times = self._scanline_times(self.latitude.shape[0])
+        # read & mask invalid values
+        self.data = self._cached(
+            "/SLV", name,
+            lambda: self._mask_invalid(dataset[(slice(None), slice(None)) + self._bin_slice(dataset, bins)], np.nan),
+            window=window
+        )
+
+    def vertical_profile(self, name, level=0, bins=None, ray=None, polyline=None, samples=None):
+        """Extract a vertical curtain of the 3-D dataset `name` without reading
+        the full volume, either along the track at scan position `ray` (nadir
+        by default) or along `polyline` (`[(lon, lat), ...]`) sampled by
+        `samples` points (about one per footprint by default).
+
+        Return longitudes, latitudes and the curtain in shape of (samples, bins).
+        """
+        if name not in self.all_available_datasets():
+            raise ValueError(f"Dataset not found: {name}")
+        self._check_level(level)
+        dataset = self._datasets["SLV"][name]
+        if not dataset.ndim == 3:
+            raise ValueError(f"Dataset is not a 3-D volume: {name}")
+        bin_slice = self._bin_slice(dataset, bins) or (slice(None),)
+        if polyline is None:
+            ray = dataset.shape[1] // 2 if ray is None else ray
+            lons, lats = self._read_geolocation(level, np.s_[:, ray])
+            curtain = dataset[(slice(None), ray) + bin_slice]
+            return lons, lats, self._mask_invalid(curtain, np.nan)
+        lon, lat = self._read_geolocation(level)
+        valid = np.isfinite(lon) & np.isfinite(lat)
+        tree = cKDTree(np.column_stack((lon[valid], lat[valid])))
+        footprint = np.max(tree.query(tree.data, k=2)[0][:, 1])
+        polyline = np.asarray(polyline, dtype=np.float64)
+        # densify the polyline along its length
+        distance = np.r_[0, np.cumsum(np.hypot(*np.diff(polyline, axis=0).T))]
+        if samples is None:
+            samples = max(2, int(np.ceil(distance[-1] / footprint)) + 1)
+        steps = np.linspace(0, distance[-1], samples)
+        lons = np.interp(steps, distance, polyline[:, 0])
+        lats = np.interp(steps, distance, polyline[:, 1])
+        distances, indices = tree.query(np.column_stack((lons, lats)), k=1)
+        rows, cols = (idx[indices] for idx in np.nonzero(valid))
+        # read only the scan lines crossed by the polyline
+        unique_rows, row_index = np.unique(rows, return_inverse=True)
+        col_slice = slice(cols.min(), cols.max() + 1)
+        volume = dataset[(unique_rows, col_slice) + bin_slice]
+        curtain = self._mask_invalid(volume[row_index, cols - col_slice.start], np.nan)
+        curtain[distances > footprint] = np.nan
+        return lons, lats, curtain
 
     @property
     def attrs(self):
@@ -84,6 +232,12 @@ class FY3G_PMR_L2(object):
         except ValueError:
             return datetime.strptime(time, "%Y-%m-%d %H:%M:%S")
 
+    def _scanline_times(self, n):
+        # scan lines are assumed evenly spaced between the observing beginning & ending times
+        start = np.datetime64(self.start_time, 'ms')
+        duration = (np.datetime64(self.end_time, 'ms') - start).astype(np.int64)
+        return start + (np.linspace(0, 1, n) * duration).astype('timedelta64[ms]')
+
     def _check_box(self, ll_box, idx_box):
         yi, yj, xi, xj = idx_box
         _lats = self.latitude[yi:yj, xi:xj]
@@ -97,6 +251,12 @@ class FY3G_PMR_L2(object):
             _lons[_valid_lons].max()
         )
         check_latmin, check_latmax, check_lonmin, check_lonmax = ll_box
+        if check_lonmin > check_lonmax:
+            # compare in longitudes unwrapped across the antimeridian
+            _lons = _lons[_valid_lons]
+            _lons = np.where(_lons < 0, _lons + 360, _lons)
+            lonmin, lonmax = _lons.min(), _lons.max()
+            check_lonmax += 360
         if (
             (latmin - check_latmin) > 5 or \
             (latmax - check_latmax) > 5 or \
@@ -111,10 +271,34 @@ class FY3G_PMR_L2(object):
                 "Longitude or Latitude or data is empty. "
                 "You should run `load` first."
             )
-        yi, yj, xi, xj = self._get_indices(ll_box)
-        self._check_box(ll_box, (yi, yj, xi, xj))
+        idx_box = self._get_indices(ll_box)
+        self._check_box(ll_box, idx_box)
+        self._crop_window(idx_box)
+
+    def crop_many(self, boxes):
+        """Crop the loaded data to each of `boxes` at once, the windows are
+        found in one scan of the geolocation. Return one sub-reader per box,
+        viewing (not copying) the arrays of this reader, that can be resampled
+        on its own (see `fy3Reader.regions.extract_regions`)."""
+        if self.longitude is None or self.latitude is None or self.data is None:
+            raise ValueError(
+                "Longitude or Latitude or data is empty. "
+                "You should run `load` first."
+            )
+        boxes = [tuple(box) for box in boxes]
+        regions = []
+        for ll_box, idx_box in zip(boxes, box_windows(self.longitude, self.latitude, boxes, self._box_mask)):
+            self._check_box(ll_box, idx_box)
+            region = copy.copy(self)
+            region._crop_window(idx_box)
+            regions.append(region)
+        return regions
+
+    def _crop_window(self, idx_box):
+        yi, yj, xi, xj = idx_box
         self.latitude = self.latitude[yi:yj, xi:xj]
         self.longitude = self.longitude[yi:yj, xi:xj]
+        self.scanline_times = self.scanline_times[yi:yj]
         self.data = self.data[yi:yj, xi:xj]
 
     def resample(self, resampler='nearest', to_shape=None):
@@ -129,6 +313,8 @@ class FY3G_PMR_L2(object):
             raise ValueError("`to_shape` parameter should be provided.")
         if not len(to_shape) == 2:
             raise ValueError("`to_shape` should be a list or tuple that length is 2.")
+        # a resampled grid has no scan lines
+        self.scanline_times = None
         if resampler == 'nearest':
             self.longitude, self.latitude, self.data = kdtree_interp(
                 self.longitude, self.latitude, self.data, to_shape
@@ -142,6 +328,16 @@ class FY3G_PMR_L2(object):
                 self.longitude, self.latitude, self.data, to_shape
             )
 
+    def save(self, fname, **kwargs):
+        """Save data & coordinates into a chunked, compressed file, see `ProductWriter`."""
+        if self.longitude is None or self.latitude is None or self.data is None:
+            raise ValueError(
+                "Longitude or Latitude or data is empty. "
+                "You should run `load` first."
+            )
+        with ProductWriter(fname, **kwargs) as writer:
+            writer.write(self.dataset_name, self.data, self.longitude, self.latitude)
+
     def get_lonlats(self):
         return self.longitude, self.latitude
     
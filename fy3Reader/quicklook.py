@@ -0,0 +1,146 @@
+"""Quicklooks of FY-3 granules from strided reads & overview pyramids"""
+
+import os
+import h5py
+import contextlib
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # not POSIX, concurrent writers of a sidecar are then not serialized
+    fcntl = None
+
+# strides of the levels of an overview pyramid
+OVERVIEW_LEVELS = (2, 4, 8, 16, 32)
+
+class Overviews(object):
+    """Pyramid of overview levels of a granule `fname` in a sidecar HDF5 file
+    `<granule>.ovr.h5` (in `directory`, next to the granule by default).
+
+    A level holds every `stride`-th scan line & pixel of the calibrated bands
+    & geolocation read so far. A missing level is sliced from the coarsest
+    stored level it is a multiple of, or read from the granule with strided
+    reads, and stored. The sidecar of a granule replaced in place is rebuilt.
+
+    >>> overviews = Overviews(fname)
+    >>> overviews.build(FY3D_MWRI_L1(fname), ['89_color', '37_color'])
+    >>> lons, lats, rgb = quicklook(FY3D_MWRI_L1(fname), '89_color', stride=16, overviews=overviews)
+    """
+
+    def __init__(self, fname, directory=None):
+        self.fname = fname
+        directory = directory or os.path.dirname(os.path.abspath(fname))
+        self.path = os.path.join(directory, os.path.basename(fname) + ".ovr.h5")
+
+    def _signature(self):
+        stat = os.stat(self.fname)
+        return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+    @staticmethod
+    def _name(group, band, stride):
+        return f"{stride}{group}/{band}"
+
+    @contextlib.contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def levels(self):
+        """Strides of the levels stored in the sidecar."""
+        try:
+            with h5py.File(self.path, "r") as f:
+                if not np.array_equal(f.attrs.get("granule"), self._signature()):
+                    return []
+                return sorted(int(level) for level in f)
+        except OSError:
+            # no sidecar yet, or being written
+            return []
+
+    def _lookup(self, group, band, stride):
+        # overview of `band` at `stride` & the stored level it comes from
+        try:
+            with h5py.File(self.path, "r") as f:
+                if not np.array_equal(f.attrs.get("granule"), self._signature()):
+                    return None, None
+                for level in sorted((int(level) for level in f), reverse=True):
+                    name = self._name(group, band, level)
+                    if stride % level == 0 and name in f:
+                        step = stride // level
+                        return f[name][::step, ::step], level
+        except OSError:
+            pass
+        return None, None
+
+    def get(self, group, band, stride):
+        """Return the overview of `band` at `stride`, or None."""
+        return self._lookup(group, band, stride)[0]
+
+    def put(self, group, band, stride, data):
+        """Store `data` as the overview of `band` at `stride` and return it."""
+        data = np.asarray(data)
+        with self._locked():
+            signature = self._signature()
+            try:
+                f = h5py.File(self.path, "a")
+            except OSError:
+                f = h5py.File(self.path, "w")
+            with f:
+                if not np.array_equal(f.attrs.get("granule"), signature):
+                    # granule replaced, drop the stale levels
+                    for level in list(f):
+                        del f[level]
+                    f.attrs["granule"] = signature
+                name = self._name(group, band, stride)
+                if name in f:
+                    del f[name]
+                f.create_dataset(name, data=data)
+        return data
+
+    def fetch(self, group, band, stride, loader):
+        """Return the overview of `band` at `stride`, on a miss it is computed
+        by `loader()` (a strided read of the granule) and stored."""
+        data, level = self._lookup(group, band, stride)
+        if data is None:
+            data = loader()
+        if level != stride:
+            data = self.put(group, band, stride, data)
+        return data
+
+    def build(self, reader, names, levels=OVERVIEW_LEVELS, **kwargs):
+        """Store the levels `levels` of the bands & composites `names` of
+        `reader` (opened on this granule), `kwargs` are passed to its `load`."""
+        for name in names:
+            # finest level first, the coarser ones are sliced from it
+            for stride in sorted(levels):
+                reader.load(name, stride=stride, overviews=self, **kwargs)
+
+    def clear(self):
+        with self._locked():
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+def quicklook(reader, name, stride=8, to_shape=None, resampler='nearest', overviews=None, **kwargs):
+    """Load `name` of `reader` from every `stride`-th scan line & pixel only
+    and resample it (making the composite) at the reduced size, `to_shape` is
+    the strided swath shape by default. Strided reads are kept in `overviews`
+    if given (see `Overviews`), `kwargs` are passed to `resample`.
+
+    Return longitude, latitude & data of the quicklook.
+
+    >>> lons, lats, rgb = quicklook(FY3D_MWRI_L1(fname), '89_color', stride=8)
+    """
+    if stride < 1:
+        raise ValueError("`stride` should be a positive integer.")
+    reader.load(name, stride=stride, overviews=overviews)
+    if to_shape is None:
+        to_shape = np.shape(reader.latitude)
+    reader.resample(resampler=resampler, to_shape=tuple(to_shape), **kwargs)
+    return reader.longitude, reader.latitude, reader.values
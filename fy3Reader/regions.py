@@ -0,0 +1,57 @@
+"""Many regions of one loaded FY-3 granule"""
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from fy3Reader.resample import n_workers
+
+# geolocation scanned at once, both coordinates of a block stay in cache
+SCAN_BYTES = 1024 * 1024
+
+def box_windows(longitude, latitude, boxes, box_mask):
+    """Windows `(yi, yj, xi, xj)` (as `_box_indices` of the readers) of the
+    pixels in each of `boxes` by `box_mask(lon, lat, box)`, found in one
+    scan of the geolocation block by block."""
+    H = np.shape(latitude)[0]
+    width = int(np.prod(np.shape(latitude)[1:], dtype=np.int64)) or 1
+    rows = max(1, SCAN_BYTES // (16 * width))
+    bounds = [None] * len(boxes)
+    for r0 in range(0, H, rows):
+        r1 = min(H, r0 + rows)
+        lon, lat = np.asarray(longitude[r0:r1]), np.asarray(latitude[r0:r1])
+        for k, box in enumerate(boxes):
+            mask = box_mask(lon, lat, box)
+            in_rows = np.flatnonzero(mask.any(axis=1))
+            if not in_rows.size:
+                continue
+            in_cols = np.flatnonzero(mask.any(axis=0))
+            window = (r0 + in_rows[0], r0 + in_rows[-1], in_cols[0], in_cols[-1])
+            if bounds[k] is not None:
+                yi, yj, xi, xj = bounds[k]
+                window = (yi, window[1], min(xi, window[2]), max(xj, window[3]))
+            bounds[k] = window
+    for box, window in zip(boxes, bounds):
+        if window is None:
+            raise ValueError(f"No pixel found in the box: {box}")
+    return bounds
+
+def extract_regions(reader, boxes, threads=None, **kwargs):
+    """Sub-readers of the data loaded by `reader` in each of `boxes`, see
+    `crop_many`. With `kwargs` each region is resampled (`resample(**kwargs)`,
+    making its composite) on its own, regions in `threads` threads (-1 for
+    all CPUs), the resamplers release the GIL.
+
+    >>> reader.load('89_color')
+    >>> regions = extract_regions(reader, storm_boxes, threads=-1, resampler='nearest', to_shape=(500, 500))
+    >>> rgbs = [region.values for region in regions]
+    """
+    regions = reader.crop_many(boxes)
+    if not kwargs:
+        return regions
+    threads = min(n_workers(threads), len(regions)) or 1
+    if threads == 1:
+        for region in regions:
+            region.resample(**kwargs)
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda region: region.resample(**kwargs), regions))
+    return regions
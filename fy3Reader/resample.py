@@ -1,10 +1,12 @@
+import os
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pyproj import Proj, transform
-from scipy.spatial import cKDTree
+from scipy.spatial import cKDTree, Delaunay, ConvexHull, QhullError
 from scipy.interpolate import griddata
 from scipy.interpolate import CloughTocher2DInterpolator
 from scipy.ndimage import map_coordinates
-from scipy.ndimage import binary_dilation
+from scipy.ndimage import binary_dilation, maximum_filter
 
 try:
     from fy3Reader.bicubic_interp import bicubic_map
@@ -12,8 +14,88 @@ try:
 except ImportError:
     _HAS_CY_BICUBIC_MAP = False
 
+EARTH_RADIUS = 6371.0
+
+def n_workers(workers):
+    """Number of threads of a `workers` option, -1 (as in SciPy) for all CPUs."""
+    if workers is None:
+        return 1
+    return (os.cpu_count() or 1) if workers == -1 else max(1, workers)
+
+def _bicubic_map(arr, Igrid, Jgrid, a, out, workers):
+    if not _HAS_CY_BICUBIC_MAP:
+        return map_coordinates(arr, [Igrid, Jgrid], order=3, mode='nearest', cval=np.nan, output=out)
+    arr = np.ascontiguousarray(arr, dtype='double')
+    Igrid, Jgrid = np.ascontiguousarray(Igrid, dtype='double'), np.ascontiguousarray(Jgrid, dtype='double')
+    workers = min(n_workers(workers), Igrid.shape[0])
+    if workers == 1:
+        return bicubic_map(arr, Igrid, Jgrid, a=a, out=out)
+    # rows of the target in threads, `bicubic_map` releases the GIL
+    out = np.empty(Igrid.shape) if out is None else out
+    bounds = np.linspace(0, Igrid.shape[0], workers + 1).astype(int)
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(
+            lambda r: bicubic_map(arr, Igrid[r[0]:r[1]], Jgrid[r[0]:r[1]], a=a, out=out[r[0]:r[1]]),
+            zip(bounds[:-1], bounds[1:])
+        ))
+    return out
+
+def lonlat_to_xyz(lon, lat, radius=EARTH_RADIUS):
+    """Cartesian (ECEF on a sphere, km) coordinates of lon/lat in degrees,
+    chord distances between them are free of dateline & pole distortion."""
+    lon, lat = np.radians(lon), np.radians(lat)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1) * radius
+
+# neighbour searches of swaths reaching this latitude are done on the sphere
+POLAR_LATITUDE = 60.0
+
+def _valid_lons(x):
+    return np.isfinite(x) & (np.abs(x) <= 180)
+
+def crosses_dateline(x):
+    """Whether the longitudes `x` cross the antimeridian, i.e. they span less
+    when negative longitudes are moved by 360 degrees."""
+    lons = np.asarray(x)[_valid_lons(x)]
+    if lons.size == 0 or lons.max() - lons.min() <= 180:
+        return False
+    shifted = np.where(lons < 0, lons + 360, lons)
+    return shifted.max() - shifted.min() < lons.max() - lons.min()
+
+def unwrap_longitudes(x):
+    """Move negative longitudes by 360 degrees if `x` crosses the antimeridian,
+    so a dateline crossing swath gets continuous longitudes (up to 360)."""
+    if not crosses_dateline(x):
+        return x
+    return np.where(_valid_lons(x) & (x < 0), x + 360, x)
+
+def _align_longitudes(x, center):
+    # move longitudes into [center - 180, center + 180)
+    return center + (np.asarray(x) - center + 180) % 360 - 180
+
+def _is_polar(y):
+    lats = np.abs(np.asarray(y)[np.isfinite(y)])
+    lats = lats[lats <= 90]
+    return lats.size > 0 and lats.max() >= POLAR_LATITUDE
+
+def _search_points(x, y, spherical):
+    # points of the neighbour search, in degrees or on the sphere
+    if spherical:
+        return lonlat_to_xyz(x, y)
+    return np.column_stack((x, y))
+
+def _take(values, indices, out):
+    # gather into `out`, without a temporary when the dtypes match
+    flat = out.reshape(-1)
+    if values.dtype == out.dtype:
+        np.take(values, indices, out=flat)
+    else:
+        flat[...] = values[indices]
+    return out
+
 def lonlat_interp(x, y, to_shape):
     H, W = to_shape
+    x = unwrap_longitudes(x)
     xs, ys = x.ravel(), y.ravel()
     xmin, xmax = xs.min(), xs.max()
     ymin, ymax = ys.min(), ys.max()
@@ -21,34 +103,143 @@ def lonlat_interp(x, y, to_shape):
                          np.linspace(ymin, ymax, H))
     return xn, yn
 
-def kdtree_interp(x, y, arr, to_shape, threshold_mult=2, no_xy=False):
+def _geo_valid(x, y):
+    # geolocation of a pixel, longitudes may be unwrapped (up to 360)
+    return np.isfinite(x) & np.isfinite(y) & (np.abs(x) <= 360) & (np.abs(y) <= 90)
+
+def _swath_spacing(x, y):
+    # largest distance (degrees) between neighbouring swath pixels
+    valid = _geo_valid(x, y)
+    x, y = np.where(valid, x, np.nan), np.where(valid, y, np.nan)
+    spacing = 0.0
+    for axis in (0, 1):
+        step = np.hypot(np.diff(x, axis=axis), np.diff(y, axis=axis))
+        if np.isfinite(step).any():
+            spacing = max(spacing, np.nanmax(step))
+    return spacing
+
+def swath_footprint(x, y, lon_grid, lat_grid, margin=0.0, convex=False):
+    """Flat indices of the pixels of the target grid inside the outline of
+    the swath `x`/`y`, grown by `margin` degrees, or None when every pixel
+    has to be evaluated (grid not rectilinear, degenerate swath).
+
+    The outline (first & last scanline, first & last pixels) is rasterized
+    onto the grid with an even-odd scanline fill, its vertices are marked too
+    so a swath narrower than the grid spacing is not lost. With `convex` the
+    convex hull of the valid swath pixels is used instead, the reach of the
+    triangulations of `spline` & `bicubic` which also fill the concave gaps
+    of a curved swath.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    lon_grid, lat_grid = np.asarray(lon_grid), np.asarray(lat_grid)
+    if x.ndim != 2 or min(x.shape) < 2 or lon_grid.ndim != 2:
+        return None
+    lons, lats = lon_grid[0], lat_grid[:, 0]
+    if not (np.array_equal(lon_grid, np.broadcast_to(lons, lon_grid.shape))
+            and np.array_equal(lat_grid, np.broadcast_to(lats[:, None], lat_grid.shape))):
+        return None
+    if convex:
+        valid = _geo_valid(x, y)
+        points = np.column_stack((x[valid], y[valid]))
+        try:
+            ox, oy = points[ConvexHull(points).vertices].T
+        except (QhullError, ValueError):
+            # too few or collinear pixels
+            return None
+    else:
+        ox = np.concatenate((x[0], x[1:, -1], x[-1, -2::-1], x[-2:0:-1, 0]))
+        oy = np.concatenate((y[0], y[1:, -1], y[-1, -2::-1], y[-2:0:-1, 0]))
+        valid = _geo_valid(ox, oy)
+        ox, oy = ox[valid], oy[valid]
+        if ox.size < 3:
+            return None
+    x0, y0, x1, y1 = ox, oy, np.roll(ox, -1), np.roll(oy, -1)
+    mask = np.zeros(lon_grid.shape, dtype=bool)
+    for row, lat in enumerate(lats):
+        # crossings of the outline with the scanline, inside between pairs
+        crossing = (y0 <= lat) != (y1 <= lat)
+        if crossing.any():
+            xa, ya, xb, yb = x0[crossing], y0[crossing], x1[crossing], y1[crossing]
+            xc = np.sort(xa + (lat - ya) * (xb - xa) / (yb - ya))
+            mask[row] = np.searchsorted(xc, lons) % 2 == 1
+    # pixels of the vertices, the grid may be descending or irregular
+    col_order, row_order = np.argsort(lons), np.argsort(lats)
+    cols = col_order[np.clip(np.searchsorted(lons[col_order], ox), 0, lons.size - 1)]
+    rows = row_order[np.clip(np.searchsorted(lats[row_order], oy), 0, lats.size - 1)]
+    mask[rows, cols] = True
+    # grown by the margin plus one pixel, the fill only tests pixel centers
+    dx = np.min(np.abs(np.diff(lons))) if lons.size > 1 else np.inf
+    dy = np.min(np.abs(np.diff(lats))) if lats.size > 1 else np.inf
+    rx = 1 + (int(np.ceil(margin / dx)) if dx > 0 else lons.size)
+    ry = 1 + (int(np.ceil(margin / dy)) if dy > 0 else lats.size)
+    size = (min(2 * ry + 1, 2 * lats.size + 1), min(2 * rx + 1, 2 * lons.size + 1))
+    mask = maximum_filter(mask.view(np.uint8), size=size, mode='constant').view(bool)
+    return np.flatnonzero(mask)
+
+def _scatter(values, footprint, out):
+    # compact results of the footprint pixels into `out`, NaN elsewhere
+    flat = out.reshape(-1)
+    flat.fill(np.nan)
+    flat[footprint] = values
+    return out
+
+def kdtree_interp(x, y, arr, to_shape, threshold_mult=2, no_xy=False, spherical=None, out=None, workers=1):
+    arr = np.asarray(arr)
+    x = unwrap_longitudes(x)
+    if spherical is None:
+        spherical = _is_polar(y)
     mask = ~np.isnan(arr)
     valid_lon = x[mask].ravel()
     valid_lat = y[mask].ravel()
     valid_data = arr[mask].ravel()
     if len(valid_data) == 0:
-        return np.full(to_shape, np.nan)
-    tree = cKDTree(np.column_stack((valid_lon, valid_lat)))
-    nn_distances, _ = tree.query(tree.data, k=2)
+        if out is None:
+            return np.full(to_shape, np.nan)
+        out.fill(np.nan)
+        return out
+    tree = cKDTree(_search_points(valid_lon, valid_lat, spherical))
+    nn_distances, _ = tree.query(tree.data, k=2, workers=workers)
     max_nn_distance = np.max(nn_distances[:, 1])
     threshold = max_nn_distance * threshold_mult
     lon_grid, lat_grid = lonlat_interp(x, y, to_shape)
-    target_points = np.column_stack((lon_grid.ravel(), lat_grid.ravel()))
-    distances, indices = tree.query(target_points, k=1)
-    new_arr = valid_data[indices].astype(float)
-    new_arr[distances > threshold] = np.nan
-    new_arr = new_arr.reshape(to_shape)
+    new_arr = np.empty(to_shape) if out is None else out
+    # beyond the threshold of the outline no pixel gets a value, only
+    # searched in degrees (a polar swath is searched on the sphere)
+    footprint = None if spherical else swath_footprint(x, y, lon_grid, lat_grid, margin=threshold + _swath_spacing(x, y))
+    if footprint is None:
+        target_points = _search_points(lon_grid.ravel(), lat_grid.ravel(), spherical)
+        distances, indices = tree.query(target_points, k=1, workers=workers)
+        _take(valid_data, indices, new_arr)
+        new_arr.reshape(-1)[distances > threshold] = np.nan
+    else:
+        target_points = _search_points(lon_grid.ravel()[footprint], lat_grid.ravel()[footprint], spherical)
+        distances, indices = tree.query(target_points, k=1, workers=workers)
+        values = _take(valid_data, indices, np.empty(footprint.size))
+        values[distances > threshold] = np.nan
+        _scatter(values, footprint, new_arr)
     return new_arr if no_xy else (lon_grid, lat_grid, new_arr)
 
-def spline_interp(x, y, arr, to_shape, no_xy=False):
+def spline_interp(x, y, arr, to_shape, no_xy=False, out=None, workers=1):
+    arr = np.asarray(arr)
     H, W = to_shape
-    x, y = x.ravel(), y.ravel()
+    swath_x, swath_y = unwrap_longitudes(x), y
+    x, y = swath_x.ravel(), swath_y.ravel()
     xmin, xmax = x.min(), x.max()
     ymin, ymax = y.min(), y.max()
     newx, newy = np.meshgrid(np.linspace(xmin, xmax, W),
                              np.linspace(ymin, ymax, H))
-    new_arr = griddata(np.dstack((x, y))[0], arr.ravel(), (newx, newy), method='linear')
-    return new_arr if no_xy else (xn, yn, new_arr)
+    # `griddata` has no threads, `workers` is only for the same signature
+    # `griddata` is NaN out of the convex hull of the swath
+    footprint = swath_footprint(swath_x, swath_y, newx, newy, convex=True)
+    if footprint is None:
+        new_arr = griddata(np.dstack((x, y))[0], arr.ravel(), (newx, newy), method='linear')
+    else:
+        values = griddata(np.dstack((x, y))[0], arr.ravel(), (newx.ravel()[footprint], newy.ravel()[footprint]), method='linear')
+        new_arr = _scatter(values, footprint, np.empty(to_shape))
+    if out is not None:
+        out[...] = new_arr
+        new_arr = out
+    return new_arr if no_xy else (newx, newy, new_arr)
 
 def _build_index_interpolators(lon, lat):
     H, W = lon.shape
@@ -61,20 +252,116 @@ def _build_index_interpolators(lon, lat):
     Jtp = CloughTocher2DInterpolator(pts, jval, fill_value=np.nan)
     return Itp, Jtp
 
-def bicubic_interp(x, y, arr, to_shape, a=-0.5, threshold_mult=2.0, no_xy=False):
+def bicubic_interp(x, y, arr, to_shape, a=-0.5, threshold_mult=2.0, no_xy=False, out=None, workers=1):
+    arr = np.asarray(arr)
+    x = unwrap_longitudes(x)
     lon_grid, lat_grid = lonlat_interp(x, y, to_shape)
     Itp, Jtp = _build_index_interpolators(x, y)
-    Igrid = Itp(lon_grid, lat_grid)
-    Jgrid = Jtp(lon_grid, lat_grid)
-    if _HAS_CY_BICUBIC_MAP:
-        out = bicubic_map(arr.astype('double'), Igrid.astype('double'), Jgrid.astype('double'), a=a)
+    # the index interpolators are NaN out of the convex hull of the swath
+    footprint = swath_footprint(x, y, lon_grid, lat_grid, convex=True)
+    if footprint is None:
+        Igrid = Itp(lon_grid, lat_grid)
+        Jgrid = Jtp(lon_grid, lat_grid)
+        out = _bicubic_map(arr, Igrid, Jgrid, a, out, workers)
     else:
-        out = map_coordinates(arr, [Igrid, Jgrid], order=3, mode='nearest', cval=np.nan)
+        # compact column of the footprint pixels, split in rows by the workers
+        lons, lats = lon_grid.ravel()[footprint], lat_grid.ravel()[footprint]
+        values = _bicubic_map(arr, Itp(lons, lats)[:, None], Jtp(lons, lats)[:, None], a, None, workers)
+        out = _scatter(values[:, 0], footprint, np.empty(to_shape) if out is None else out)
     return out if no_xy else (lon_grid, lat_grid, out)
 
-def rgb_project(lons, lats, data, **kwargs):
+class ResamplePlan(object):
+    """Swath to grid mapping computed once and applied to every band sharing
+    the same geolocation. Unlike `kdtree_interp`, NaN pixels of a band are
+    propagated instead of being filled by the next valid neighbour.
+
+    The target grid spans the swath by default, or is given as `target`
+    (`(lon_grid, lat_grid)`, `to_shape` is then ignored). Longitudes of a
+    dateline crossing swath are unwrapped, see `unwrap_longitudes`. Only the
+    target pixels of the swath footprint are mapped, see `swath_footprint`
+    (its convex hull for `spline` & `bicubic`)."""
+
+    def __init__(self, x, y, to_shape, resampler='nearest', threshold_mult=2, a=-0.5, target=None, spherical=None, workers=1):
+        if resampler not in ('nearest', 'spline', 'bicubic'):
+            raise ValueError("Resampler only supports `nearest`, `spline` and `bicubic`.")
+        self.resampler = resampler
+        self.a = a
+        self.workers = workers
+        crossing = crosses_dateline(x)
+        x = unwrap_longitudes(x)
+        if target is None:
+            self.lon_grid, self.lat_grid = lonlat_interp(x, y, to_shape)
+        else:
+            self.lon_grid, self.lat_grid = target
+            if crossing:
+                # express the target in the frame of the unwrapped swath
+                lons = x[np.isfinite(x) & (np.abs(x) <= 360)]
+                self.lon_grid = _align_longitudes(self.lon_grid, (lons.min() + lons.max()) / 2)
+        self.to_shape = self.lon_grid.shape
+        if spherical is None:
+            spherical = _is_polar(y)
+        if resampler == 'nearest':
+            valid = (np.isfinite(x) & np.isfinite(y)).ravel()
+            source_index = np.flatnonzero(valid)
+            tree = cKDTree(_search_points(x.ravel()[valid], y.ravel()[valid], spherical))
+            nn_distances, _ = tree.query(tree.data, k=2, workers=workers)
+            threshold = np.max(nn_distances[:, 1]) * threshold_mult
+            # only the target pixels of the swath footprint are mapped
+            self.footprint = None if spherical else swath_footprint(
+                x, y, self.lon_grid, self.lat_grid, margin=threshold + _swath_spacing(x, y)
+            )
+        else:
+            self.footprint = swath_footprint(x, y, self.lon_grid, self.lat_grid, convex=True)
+        lons, lats = self.lon_grid.ravel(), self.lat_grid.ravel()
+        if self.footprint is not None:
+            lons, lats = lons[self.footprint], lats[self.footprint]
+        self._shape = self.to_shape if self.footprint is None else (lons.size, 1)
+        target_points = np.column_stack((lons, lats))
+        if resampler == 'nearest':
+            distances, indices = tree.query(_search_points(lons, lats, spherical), k=1, workers=workers)
+            self.indices = source_index[indices]
+            self.invalid = distances > threshold
+        elif resampler == 'spline':
+            # barycentric weights of the linear interpolation used by `griddata`
+            tri = Delaunay(np.column_stack((x.ravel(), y.ravel())))
+            simplex = tri.find_simplex(target_points)
+            transform = tri.transform[simplex]
+            bary = np.einsum('njk,nk->nj', transform[:, :2], target_points - transform[:, 2])
+            self.vertices = tri.simplices[simplex]
+            self.weights = np.column_stack((bary, 1 - bary.sum(axis=1)))
+            self.invalid = simplex == -1
+        elif resampler == 'bicubic':
+            Itp, Jtp = _build_index_interpolators(x, y)
+            self.Igrid = Itp(lons, lats).astype('double').reshape(self._shape)
+            self.Jgrid = Jtp(lons, lats).astype('double').reshape(self._shape)
+
+    def get_lonlats(self):
+        return self.lon_grid, self.lat_grid
+
+    def apply(self, arr, out=None):
+        arr = np.asarray(arr)
+        if self.footprint is None:
+            return self._map(arr, out)
+        return _scatter(self._map(arr, None).ravel(), self.footprint, np.empty(self.to_shape) if out is None else out)
+
+    def _map(self, arr, out):
+        if self.resampler == 'bicubic':
+            return _bicubic_map(arr, self.Igrid, self.Jgrid, self.a, out, self.workers)
+        if out is None:
+            out = np.empty(self._shape)
+        if self.resampler == 'nearest':
+            _take(arr.ravel(), self.indices, out)
+        else:
+            np.einsum('nj,nj->n', arr.ravel()[self.vertices], self.weights, out=out.reshape(-1))
+        out.reshape(-1)[self.invalid] = np.nan
+        return out
+
+def rgb_project(lons, lats, data, out=None, workers=1, **kwargs):
     if not len(data.shape) == 3:
         raise ValueError("`data` must be a 3-dimensional array")
+    if 'lon_0' not in kwargs and np.nanmax(lons) > 180:
+        # unwrapped longitudes, center the projection on the swath to keep x continuous
+        kwargs['lon_0'] = (np.nanmin(lons) + np.nanmax(lons)) / 2
     proj_latlon = Proj(proj='latlong', datum='WGS84')
     proj_dst = Proj(proj='eqc', datum='WGS84', **kwargs)
     x, y = transform(proj_latlon, proj_dst, lons, lats)
@@ -84,7 +371,11 @@ def rgb_project(lons, lats, data, **kwargs):
     normalized_x = ((x - min_x) / (max_x - min_x) * (data.shape[1] - 1)).astype(int)
     normalized_y = ((y - min_y) / (max_y - min_y) * (data.shape[0] - 1)).astype(int)
     # Create new image with transformed coordinates
-    projected = np.zeros_like(data)
+    if out is None:
+        projected = np.zeros_like(data)
+    else:
+        projected = out
+        projected.fill(0)
     projected[normalized_y, normalized_x] = data
     # Find the mask of the empty (zero) pixels
     mask = (projected == 0).all(axis=2)
@@ -99,6 +390,6 @@ def rgb_project(lons, lats, data, **kwargs):
     coords = np.array(np.nonzero(valid_points_mask)).T  # Non-zero coordinates
     tree = cKDTree(coords)
     missing_coords = np.array(np.nonzero(internal_mask)).T
-    distances, indices = tree.query(missing_coords, k=1)
+    distances, indices = tree.query(missing_coords, k=1, workers=workers)
     projected[internal_mask] = projected[tuple(coords[indices].T)]
     return projected
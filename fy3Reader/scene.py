@@ -0,0 +1,118 @@
+"""FY-3 Scene: many products from one MWRI/MWHS granule with shared work"""
+
+from fy3Reader.resample import ResamplePlan, rgb_project, n_workers
+from fy3Reader.writer import write_products
+
+class Scene(object):
+    """Derive several bands and composites from one reader.
+
+    Every band needed by the requested products is read and calibrated once,
+    and resampled once with a plan shared by all bands of the same geolocation.
+
+    >>> scn = Scene(FY3D_MWRI_L1(fname))
+    >>> scn.load(['89_color', '89_pct', '37_color', 'hydrometeor_type'])
+    >>> scn.crop((25, 35, 135, 145))
+    >>> scn.resample(resampler='nearest', to_shape=(2000, 2000))
+    >>> rgb = scn['89_color']
+
+    The stretch of composite channels can be replaced per product in
+    `limits`, e.g. `scn.limits['89_color'] = stretch_limits(stats)`.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.wishlist = []
+        self.bands = {}
+        self.geolocations = {}
+        self.products = {}
+        self._band_geolocation = {}
+        self._project_kwargs = {}
+        self.limits = {}
+
+    def _dependencies(self, name):
+        if name in self.reader.COMPOSITE_BANDS:
+            return self.reader.COMPOSITE_BANDS[name]["bands"]
+        if name in self.reader.all_available_datasets():
+            return [name]
+        raise ValueError(f"Dataset not found: {name}")
+
+    def load(self, names):
+        missing = []
+        for name in names:
+            for band in self._dependencies(name):
+                if band in self.bands or band in missing:
+                    continue
+                geolocation = self.reader._band_source(band)[0].name
+                if geolocation not in self.geolocations:
+                    self.geolocations[geolocation] = self.reader._read_lonlat(band)
+                self._band_geolocation[band] = geolocation
+                missing.append(band)
+            if name not in self.wishlist:
+                self.wishlist.append(name)
+        # channels of one dataset are read in one pass
+        self.bands.update(zip(missing, self.reader._read_bands(missing)))
+        self.products = {}
+
+    def _check_loaded(self):
+        if not self.bands:
+            raise ValueError(
+                "Scene is empty, "
+                "you should run `load` first."
+            )
+
+    def crop(self, ll_box):
+        self._check_loaded()
+        for geolocation, lonlats in self.geolocations.items():
+            idx_box = self.reader._box_indices(*lonlats, ll_box)
+            self.reader._check_box(ll_box, idx_box, lonlats=lonlats)
+            yi, yj, xi, xj = idx_box
+            self.geolocations[geolocation] = tuple(ll[yi:yj, xi:xj] for ll in lonlats)
+            for band, band_geolocation in self._band_geolocation.items():
+                if band_geolocation == geolocation:
+                    self.bands[band] = self.bands[band][yi:yj, xi:xj]
+        self.products = {}
+
+    def resample(self, resampler='nearest', to_shape=None, workers=None, target=None, **kwargs):
+        """Resample to a `to_shape` grid spanning each geolocation, or to a
+        fixed `target` grid (`(lon_grid, lat_grid)`)."""
+        self._check_loaded()
+        if to_shape is None and target is None:
+            raise ValueError("`to_shape` parameter should be provided.")
+        if to_shape is not None and not len(to_shape) == 2:
+            raise ValueError("`to_shape` should be a list or tuple that length is 2.")
+        for geolocation, (lons, lats) in self.geolocations.items():
+            plan = ResamplePlan(lons, lats, to_shape, resampler=resampler, target=target, workers=n_workers(workers))
+            for band, band_geolocation in self._band_geolocation.items():
+                if band_geolocation == geolocation:
+                    self.bands[band] = plan.apply(self.bands[band])
+            self.geolocations[geolocation] = plan.get_lonlats()
+        self._project_kwargs = dict(kwargs, workers=n_workers(workers))
+        self.products = {}
+
+    def _derive(self, name):
+        if name not in self.reader.COMPOSITE_BANDS:
+            return self.bands[name]
+        info = self.reader.COMPOSITE_BANDS[name]
+        cm = info["func"]([self.bands[band] for band in info["bands"]], fractions=info["fractions"], limits=self.limits.get(name))
+        if info["rgb"]:
+            return rgb_project(*self.get_lonlats(name), cm.composite(), **self._project_kwargs)
+        return cm.composite()
+
+    def get_lonlats(self, name):
+        return self.geolocations[self._band_geolocation[self._dependencies(name)[0]]]
+
+    def save_datasets(self, fname_template, processes=None, **kwargs):
+        """Save every product to `fname_template.format(name=name)`, files
+        are written in parallel processes, see `write_products`."""
+        products = {name: (self[name],) + tuple(self.get_lonlats(name)) for name in self.wishlist}
+        return write_products(products, fname_template, processes=processes, **kwargs)
+
+    def __getitem__(self, name):
+        if name not in self.wishlist:
+            raise KeyError(f"Product not loaded: {name}")
+        if name not in self.products:
+            self.products[name] = self._derive(name)
+        return self.products[name]
+
+    def __iter__(self):
+        return iter(self.wishlist)
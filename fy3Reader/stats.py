@@ -0,0 +1,199 @@
+"""Streaming statistics of FY-3 bands & composite channels"""
+
+import functools
+import numpy as np
+from fy3Reader.h5io import iter_channel_blocks, iter_row_blocks
+
+# fixed bins of the histograms, 0.1 K over the brightness temperatures and
+# the differences of the composites, the same for every granule to merge them
+DEFAULT_BINS = 5000
+DEFAULT_RANGE = (-100.0, 400.0)
+
+class BandStats(object):
+    """Min, max, mean, count & fixed-bin histogram of the valid (finite)
+    values of a band, updated block by block. Stats of the same bins &
+    range are merged with `merge` (or `+`), e.g. across granules.
+
+    Values out of `value_range` count in `underflow`/`overflow`, percentiles
+    are approximated from the histogram to within one bin.
+    """
+
+    def __init__(self, bins=DEFAULT_BINS, value_range=DEFAULT_RANGE):
+        self.bins = bins
+        self.value_range = tuple(value_range)
+        self.histogram = np.zeros(bins, dtype=np.int64)
+        self.underflow = self.overflow = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+    @property
+    def edges(self):
+        return np.linspace(self.value_range[0], self.value_range[1], self.bins + 1)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return self
+        self.count += values.size
+        self.total += values.sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        low, high = self.value_range
+        self.underflow += int(np.count_nonzero(values < low))
+        self.overflow += int(np.count_nonzero(values > high))
+        values = values[(values >= low) & (values <= high)]
+        index = ((values - low) * (self.bins / (high - low))).astype(np.int64)
+        # the upper edge is in the last bin
+        np.minimum(index, self.bins - 1, out=index)
+        self.histogram += np.bincount(index, minlength=self.bins)
+        return self
+
+    def merge(self, other):
+        """Add the stats of `other` (same bins & range) to these."""
+        if not (self.bins == other.bins and self.value_range == other.value_range):
+            raise ValueError("Stats with different bins or range can't be merged.")
+        self.histogram += other.histogram
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def __add__(self, other):
+        merged = BandStats(self.bins, self.value_range)
+        return merged.merge(self).merge(other)
+
+    def percentile(self, q):
+        """Approximate `q`-th percentile(s), interpolated in the bins."""
+        q = np.asarray(q, dtype=np.float64)
+        if not self.count:
+            return np.full(q.shape, np.nan)[()]
+        target = q / 100 * self.count
+        cumulative = self.underflow + np.cumsum(self.histogram)
+        index = np.clip(np.searchsorted(cumulative, target), 0, self.bins - 1)
+        before = np.where(index > 0, cumulative[index - 1], self.underflow)
+        in_bin = np.maximum(self.histogram[index], 1)
+        edges = self.edges
+        value = edges[index] + np.clip((target - before) / in_bin, 0, 1) * (edges[index + 1] - edges[index])
+        # out of range values are only known by the min & max
+        value = np.where(target <= self.underflow, self.min, value)
+        value = np.where(target > cumulative[-1], self.max, value)
+        return np.clip(value, self.min, self.max)[()]
+
+    def limits(self, low=2.0, high=98.0):
+        """Stretch limits `(vmin, vmax)` at the `low` & `high` percentiles."""
+        vmin, vmax = self.percentile([low, high])
+        return float(vmin), float(vmax)
+
+    def summary(self):
+        return {
+            "count": self.count, "min": float(self.min), "max": float(self.max), "mean": float(self.mean),
+            "p2": float(self.percentile(2)), "p50": float(self.percentile(50)), "p98": float(self.percentile(98)),
+        }
+
+def merge_stats(*stats):
+    """Merge dicts of `BandStats` (e.g. of several granules) by name."""
+    merged = {}
+    for item in stats:
+        for name, band_stats in item.items():
+            if name not in merged:
+                merged[name] = BandStats(band_stats.bins, band_stats.value_range)
+            merged[name].merge(band_stats)
+    return merged
+
+def stretch_limits(stats, low=2.0, high=98.0):
+    """`limits` of a composite (`{channel: (vmin, vmax)}`) from the stats of
+    its channels, see `composite_stats`."""
+    return {name: band_stats.limits(low, high) for name, band_stats in stats.items()}
+
+def _in_box(lon, lat, ll_box):
+    latmin, latmax, lonmin, lonmax = ll_box
+    if lonmin > lonmax:
+        # box crossing the antimeridian
+        lon_mask = ((lon >= lonmin) & (lon <= 180)) | ((lon >= -180) & (lon <= lonmax))
+    else:
+        lon_mask = (lon >= lonmin) & (lon <= lonmax)
+    return (lat >= latmin) & (lat <= latmax) & lon_mask
+
+def _band_blocks(reader, names, level=0):
+    # `(r0, r1, geolocation, [(name, calibrated rows r0:r1), ...])`, each
+    # dataset read in one pass over its blocks
+    if not hasattr(reader, "_band_source"):
+        # PMR L2, masked datasets with the geolocation of `level`
+        geo = reader._datasets["Geo_Fields"]
+        for name in names:
+            if name not in reader.all_available_datasets():
+                raise ValueError(f"Dataset not found: {name}")
+            for r0, r1, block in iter_row_blocks(reader._datasets["SLV"][name]):
+                yield r0, r1, (geo, level), [(name, reader._mask_invalid(block, np.nan))]
+        return
+    groups = {}
+    for name in names:
+        geolocation, EOB, dataset_index, axis = reader._band_source(name)
+        groups.setdefault(EOB.name, (geolocation, EOB, axis, []))[3].append((name, dataset_index))
+    for geolocation, EOB, axis, channels in groups.values():
+        calibrate = functools.partial(reader._cal_bt, intercept=EOB.attrs["Intercept"], slope=EOB.attrs["Slope"])
+        for r0, r1, blocks in iter_channel_blocks(EOB, [dataset_index for _, dataset_index in channels], axis=axis):
+            yield r0, r1, (geolocation, None), [(name, calibrate(block)) for (name, _), block in zip(channels, blocks)]
+
+def _box_mask(geolocation, r0, r1, ll_box):
+    group, level = geolocation
+    selection = np.s_[r0:r1] if level is None else np.s_[r0:r1, :, level]
+    return _in_box(group["Longitude"][selection], group["Latitude"][selection], ll_box)
+
+def band_stats(reader, names, ll_box=None, bins=DEFAULT_BINS, value_range=DEFAULT_RANGE, level=0):
+    """Stats (`{name: BandStats}`) of the calibrated bands `names` of
+    `reader`, or of the bands of composites in `names`, optionally of the
+    pixels in `ll_box` (`(latmin, latmax, lonmin, lonmax)`) only.
+
+    The bands are streamed from the file block by block in one pass (channels
+    of one dataset together), no full band is held in memory. For PMR L2 the
+    geolocation of `level` is used for `ll_box`.
+
+    >>> stats = merge_stats(*(band_stats(FY3D_MWRI_L1(fname), ['btemp_89.0v']) for fname in fnames))
+    >>> stats['btemp_89.0v'].percentile([2, 50, 98])
+    """
+    bands = []
+    for name in names:
+        composites = getattr(reader, "COMPOSITE_BANDS", None) or {}
+        for band in composites[name]["bands"] if name in composites else [name]:
+            if band not in bands:
+                bands.append(band)
+    stats = {band: BandStats(bins, value_range) for band in bands}
+    for r0, r1, geolocation, channels in _band_blocks(reader, bands, level):
+        inside = None if ll_box is None else _box_mask(geolocation, r0, r1, ll_box)
+        for band, values in channels:
+            stats[band].update(values if inside is None else values[inside])
+    return stats
+
+def composite_stats(reader, name, ll_box=None, bins=DEFAULT_BINS, value_range=DEFAULT_RANGE, fractions=None):
+    """Stats (`{channel: BandStats}`) of the values of the channels of the
+    composite `name` before their stretch, streamed like `band_stats`; see
+    `stretch_limits` to make the composite with data-driven limits.
+
+    >>> stats = composite_stats(reader, '89_color', ll_box=(10, 40, 110, 150))
+    >>> reader.resample(resampler='nearest', to_shape=(2000, 2000), limits=stretch_limits(stats))
+    """
+    if name not in reader.COMPOSITE_BANDS:
+        raise ValueError(f"Composite not found: {name}")
+    info = reader.COMPOSITE_BANDS[name]
+    if len({reader._band_source(band)[1].name for band in info["bands"]}) > 1:
+        raise ValueError("Stats of composites are only streamed from the bands of one dataset.")
+    fractions = info["fractions"] if fractions is None else fractions
+    stats = {channel[0]: BandStats(bins, value_range) for channel in info["func"].channels}
+    for r0, r1, geolocation, channels in _band_blocks(reader, info["bands"]):
+        inside = None if ll_box is None else _box_mask(geolocation, r0, r1, ll_box)
+        datas = dict(channels)
+        cm = info["func"]([datas[band] for band in info["bands"]], fractions=fractions)
+        for channel, values in cm.channel_values(0, r1 - r0):
+            stats[channel].update(values if inside is None else values[inside])
+    return stats
@@ -0,0 +1,171 @@
+"""Web-Mercator XYZ tile pyramid of FY-3 composites"""
+
+import os
+import numpy as np
+from PIL import Image
+from fy3Reader.resample import ResamplePlan
+from fy3Reader.parallel import process_pool
+
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511287798066
+
+def _lonlat_to_tile(lon, lat, zoom):
+    n = 2 ** zoom
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    # longitudes may be unwrapped beyond 180 degrees
+    tx = (np.asarray(lon) + 180.0) % 360.0 / 360.0 * n
+    ty = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0 * n
+    return (
+        np.clip(np.floor(tx), 0, n - 1).astype(np.int64),
+        np.clip(np.floor(ty), 0, n - 1).astype(np.int64)
+    )
+
+def tile_lonlats(zoom, x, y, tile_size=TILE_SIZE):
+    """Longitude & latitude of the pixel centres of tile `zoom/x/y`."""
+    n = 2 ** zoom
+    pixels = (np.arange(tile_size) + 0.5) / tile_size
+    lons = (x + pixels) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (y + pixels) / n))))
+    return np.meshgrid(lons, lats)
+
+def _tile_windows(lons, lats, zoom, pad=2):
+    """Swath windows `(yi, yj, xi, xj)` of all tiles covered by the swath,
+    each window also covers the pixels of the 8 neighbouring tiles and `pad`
+    more pixels around them.
+
+    A tile is covered when it holds a swath pixel or is overlapped by the cell
+    between 4 neighbouring pixels, so tiles smaller than the pixel spacing
+    inside the swath are rendered too.
+    """
+    n = 2 ** zoom
+    valid = np.isfinite(lons) & np.isfinite(lats)
+    tx, ty = _lonlat_to_tile(np.where(valid, lons, 0), np.where(valid, lats, 0), zoom)
+    # tiles of the pixels
+    rows, cols = np.nonzero(valid)
+    keys = [tx[valid] * n + ty[valid]]
+    r0s, r1s, c0s, c1s = [rows], [rows], [cols], [cols]
+    # tiles of the cells, cells across the antimeridian only by their pixels
+    cell_tx = np.stack([tx[:-1, :-1], tx[1:, :-1], tx[:-1, 1:], tx[1:, 1:]])
+    cell_ty = np.stack([ty[:-1, :-1], ty[1:, :-1], ty[:-1, 1:], ty[1:, 1:]])
+    x0, x1, y0, y1 = cell_tx.min(axis=0), cell_tx.max(axis=0), cell_ty.min(axis=0), cell_ty.max(axis=0)
+    cells = valid[:-1, :-1] & valid[1:, :-1] & valid[:-1, 1:] & valid[1:, 1:] & (x1 - x0 <= n // 2)
+    rows, cols = np.nonzero(cells)
+    x0, x1, y0, y1 = x0[cells], x1[cells], y0[cells], y1[cells]
+    width, counts = x1 - x0 + 1, (x1 - x0 + 1) * (y1 - y0 + 1)
+    cell = np.repeat(np.arange(counts.size), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    keys.append((x0[cell] + offset % width[cell]) * n + y0[cell] + offset // width[cell])
+    r0s.append(rows[cell]), r1s.append(rows[cell] + 1), c0s.append(cols[cell]), c1s.append(cols[cell] + 1)
+    keys, r0s, r1s, c0s, c1s = (np.concatenate(a) for a in (keys, r0s, r1s, c0s, c1s))
+    if not keys.size:
+        return {}
+    order = np.argsort(keys, kind='stable')
+    keys, r0s, r1s, c0s, c1s = keys[order], r0s[order], r1s[order], c0s[order], c1s[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    own = {
+        (int(k // n), int(k % n)): (r0, r1, c0, c1)
+        for k, r0, r1, c0, c1 in zip(
+            keys[starts],
+            np.minimum.reduceat(r0s, starts), np.maximum.reduceat(r1s, starts),
+            np.minimum.reduceat(c0s, starts), np.maximum.reduceat(c1s, starts)
+        )
+    }
+    H, W = lons.shape
+    windows = {}
+    for (x, y) in own:
+        boxes = [own[(x + dx, y + dy)] for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (x + dx, y + dy) in own]
+        r0, r1, c0, c1 = zip(*boxes)
+        windows[(x, y)] = (max(0, min(r0) - pad), min(H, max(r1) + 1 + pad), max(0, min(c0) - pad), min(W, max(c1) + 1 + pad))
+    return windows
+
+def _render_tile(args):
+    zoom, x, y, lons, lats, datas, func, fractions, resampler, tile_size = args
+    if lons.size < 4:
+        # too few pixels to triangulate or to get a neighbour distance
+        return None
+    plan = ResamplePlan(lons, lats, None, resampler=resampler, target=tile_lonlats(zoom, x, y, tile_size))
+    bands = [plan.apply(d) for d in datas]
+    valid = np.logical_and.reduce([np.isfinite(b) for b in bands])
+    if not valid.any():
+        return None
+    rgba = np.zeros((tile_size, tile_size, 4), dtype=np.uint8)
+    func(bands, fractions=fractions).composite(out=rgba[..., :3])
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return rgba
+
+def _downsample(children, tile_size):
+    """Merge 2x2 child tiles into their parent, averaging the valid pixels."""
+    mosaic = np.zeros((2 * tile_size, 2 * tile_size, 4), dtype=np.float64)
+    for (dx, dy), rgba in children.items():
+        mosaic[dy * tile_size:(dy + 1) * tile_size, dx * tile_size:(dx + 1) * tile_size] = rgba
+    blocks = mosaic.reshape(tile_size, 2, tile_size, 2, 4)
+    alpha = blocks[..., 3:].sum(axis=(1, 3))
+    rgb = (blocks[..., :3] * blocks[..., 3:]).sum(axis=(1, 3)) / np.where(alpha == 0, 1, alpha)
+    return np.concatenate([rgb, alpha / 4], axis=-1).round().astype(np.uint8)
+
+class TileGenerator(object):
+    """Render a composite loaded by a MWRI/MWHS reader into `z/x/y` tiles.
+
+    Each tile of the highest zoom covered by the swath is resampled only
+    from the swath pixels around it (other tiles are skipped) in the processes
+    of `process_pool(processes)`, lower zooms are built by downsampling their
+    children.
+
+    >>> reader.load('89_color')
+    >>> TileGenerator(reader).generate("tiles/89_color", zooms=(3, 8))
+    """
+
+    def __init__(self, reader, resampler='nearest', tile_size=TILE_SIZE, format='png', processes=None):
+        if reader.longitude is None or reader.latitude is None or reader.data is None:
+            raise ValueError(
+                "Longitude or Latitude or data is empty, "
+                "you should run `load` first."
+            )
+        if reader.composite_func is None or not reader.COMPOSITE_BANDS[reader.dataset_name]["rgb"]:
+            raise ValueError("Tiles can only be generated from a RGB composite before `resample`.")
+        if format not in ('png', 'webp'):
+            raise ValueError("Format only supports `png` and `webp`.")
+        self.reader = reader
+        self.resampler = resampler
+        self.tile_size = tile_size
+        self.format = format
+        self.processes = processes
+
+    def _save(self, out_dir, zoom, x, y, rgba):
+        path = os.path.join(out_dir, str(zoom), str(x))
+        os.makedirs(path, exist_ok=True)
+        Image.fromarray(rgba, mode="RGBA").save(os.path.join(path, f"{y}.{self.format}"))
+
+    def _tasks(self, zoom):
+        reader = self.reader
+        info = reader.COMPOSITE_BANDS[reader.dataset_name]
+        for (x, y), (yi, yj, xi, xj) in _tile_windows(reader.longitude, reader.latitude, zoom).items():
+            yield (
+                zoom, x, y,
+                reader.longitude[yi:yj, xi:xj],
+                reader.latitude[yi:yj, xi:xj],
+                [d[yi:yj, xi:xj] for d in reader.data],
+                reader.composite_func, info["fractions"], self.resampler, self.tile_size
+            )
+
+    def generate(self, out_dir, zooms=(0, 8)):
+        """Write tiles of zoom `zooms[0]` to `zooms[1]` and return their count."""
+        min_zoom, max_zoom = zooms
+        tasks = list(self._tasks(max_zoom))
+        rendered = process_pool(self.processes).map(_render_tile, tasks)
+        level = {
+            (task[1], task[2]): rgba
+            for task, rgba in zip(tasks, rendered) if rgba is not None
+        }
+        count = 0
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            for (x, y), rgba in level.items():
+                self._save(out_dir, zoom, x, y, rgba)
+            count += len(level)
+            if zoom == min_zoom:
+                break
+            parents = {}
+            for (x, y), rgba in level.items():
+                parents.setdefault((x // 2, y // 2), {})[(x % 2, y % 2)] = rgba
+            level = {key: _downsample(children, self.tile_size) for key, children in parents.items()}
+        return count
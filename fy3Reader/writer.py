@@ -0,0 +1,161 @@
+"""FY-3 product writer for chunked, compressed HDF5 & NetCDF4-CF files"""
+
+import h5py
+import numpy as np
+from pyproj import CRS
+from fy3Reader.parallel import process_pool
+
+class ProductWriter(object):
+    """Write bands & composites with their coordinates into one file.
+
+    Products can be written at once with `write`, or created with `create`
+    and filled block by block with `write_block` so the full product never has
+    to be materialized.
+
+    >>> with ProductWriter("89_color.nc") as writer:
+    ...     writer.write("89_color", rgb, lons, lats)
+    """
+
+    def __init__(self, fname, format='netcdf4', compression='gzip', compression_opts=4, shuffle=True, chunks=(256, 256)):
+        if format not in ('hdf5', 'netcdf4'):
+            raise ValueError("Format only supports `hdf5` and `netcdf4`.")
+        if format == 'netcdf4' and compression not in ('gzip', None):
+            raise ValueError("NetCDF4 only supports `gzip` compression.")
+        self.fname = fname
+        self.format = format
+        self.compression = compression
+        self.compression_opts = compression_opts if compression == 'gzip' else None
+        self.shuffle = shuffle
+        self.chunks = tuple(chunks)
+        self._file = h5py.File(fname, "w")
+        if format == 'netcdf4':
+            self._file.attrs["Conventions"] = "CF-1.8"
+        self._write_crs()
+
+    def _write_crs(self):
+        crs = self._file.create_dataset("crs", data=np.int32(0))
+        for k, v in CRS.from_epsg(4326).to_cf().items():
+            crs.attrs[k] = v
+
+    def _chunks(self, shape):
+        return tuple(min(c, s) for c, s in zip(self.chunks, shape)) + tuple(shape[len(self.chunks):])
+
+    def _create_dataset(self, name, shape, dtype, fill_value=None):
+        return self._file.create_dataset(
+            name,
+            shape=shape,
+            dtype=dtype,
+            chunks=self._chunks(shape),
+            compression=self.compression,
+            compression_opts=self.compression_opts,
+            shuffle=self.shuffle and self.compression is not None,
+            fillvalue=fill_value
+        )
+
+    def _existing(self, name, values):
+        # a coordinate is shared by the products of the same grid only
+        dataset = self._file[name]
+        if dataset.shape != np.shape(values) or not np.array_equal(dataset[...], values, equal_nan=True):
+            raise ValueError(f"`{name}` is already written for another grid, use another `suffix`.")
+        return dataset
+
+    def _dimension(self, name, values, attrs):
+        if name in self._file:
+            return self._existing(name, values)
+        dim = self._file.create_dataset(name, data=values)
+        dim.make_scale(name)
+        for k, v in attrs.items():
+            dim.attrs[k] = v
+        return dim
+
+    def write_coordinates(self, lons, lats, suffix=""):
+        """Write the coordinates, 1-D for a regular grid (e.g. after `resample`)
+        otherwise 2-D swath coordinates, and return the dimension names."""
+        lon_attrs = {"standard_name": "longitude", "units": "degrees_east"}
+        lat_attrs = {"standard_name": "latitude", "units": "degrees_north"}
+        if np.all(lons == lons[:1, :]) and np.all(lats == lats[:, :1]):
+            dims = ("lat" + suffix, "lon" + suffix)
+            self._dimension(dims[0], lats[:, 0], lat_attrs)
+            self._dimension(dims[1], lons[0, :], lon_attrs)
+            return dims, None
+        dims = ("y" + suffix, "x" + suffix)
+        self._dimension(dims[0], np.arange(lons.shape[0], dtype=np.int32), {})
+        self._dimension(dims[1], np.arange(lons.shape[1], dtype=np.int32), {})
+        for name, values, attrs in (("lon" + suffix, lons, lon_attrs), ("lat" + suffix, lats, lat_attrs)):
+            if name in self._file:
+                self._existing(name, values)
+                continue
+            coordinate = self._create_dataset(name, lons.shape, values.dtype)
+            coordinate[...] = values
+            for k, v in attrs.items():
+                coordinate.attrs[k] = v
+            for axis, dim in enumerate(dims):
+                coordinate.dims[axis].attach_scale(self._file[dim])
+        return dims, f"lat{suffix} lon{suffix}"
+
+    def create(self, name, shape, dtype, lons, lats, attrs=None, fill_value=None, suffix=""):
+        """Create an empty product to be filled by `write_block`."""
+        dims, coordinates = self.write_coordinates(lons, lats, suffix=suffix)
+        if fill_value is None and np.dtype(dtype).kind == 'f':
+            fill_value = np.nan
+        dataset = self._create_dataset(name, tuple(shape), dtype, fill_value=fill_value)
+        if fill_value is not None:
+            dataset.attrs["_FillValue"] = np.array(fill_value, dtype=dtype)
+        dataset.attrs["grid_mapping"] = "crs"
+        if coordinates is not None:
+            dataset.attrs["coordinates"] = coordinates
+        for axis, dim in enumerate(dims):
+            dataset.dims[axis].attach_scale(self._file[dim])
+        if len(shape) == 3:
+            band = self._dimension("band", np.arange(shape[2], dtype=np.int32), {})
+            dataset.dims[2].attach_scale(band)
+        for k, v in (attrs or {}).items():
+            dataset.attrs[k] = v
+        return dataset
+
+    def write_block(self, name, block, rows, cols=slice(None)):
+        """Write one block of the product `name` at `[rows, cols]`."""
+        self._file[name][rows, cols] = block
+
+    def write(self, name, data, lons, lats, attrs=None, suffix=""):
+        data = np.asarray(data)
+        self.create(name, data.shape, data.dtype, lons, lats, attrs=attrs, suffix=suffix)
+        rows = self._chunks(data.shape)[0]
+        for r0 in range(0, data.shape[0], rows):
+            self.write_block(name, data[r0:r0 + rows], slice(r0, r0 + rows))
+
+    def write_composite(self, name, cm, lons, lats, attrs=None, suffix=""):
+        """Stream a composite (see `FusedComposite.iter_blocks`) into the file."""
+        shape = np.shape(cm.datas[0])
+        if cm.rgb:
+            shape += (len(cm.channels),)
+        self.create(name, shape, np.uint8 if cm.rgb else np.float64, lons, lats, attrs=attrs, suffix=suffix)
+        for rows, block in cm.iter_blocks():
+            self.write_block(name, block, rows)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def _write_product(args):
+    fname, name, data, lons, lats, kwargs = args
+    with ProductWriter(fname, **kwargs) as writer:
+        writer.write(name, data, lons, lats)
+    return fname
+
+def write_products(products, fname_template, processes=None, **kwargs):
+    """Write each of `products` (`{name: (data, lons, lats)}`) to its own file
+    named by `fname_template.format(name=name)`, in the processes of
+    `process_pool(processes)` (in this process with `processes=1`)."""
+    args = [
+        (fname_template.format(name=name), name, data, lons, lats, kwargs)
+        for name, (data, lons, lats) in products.items()
+    ]
+    if processes == 1:
+        return [_write_product(arg) for arg in args]
+    return list(process_pool(processes).map(_write_product, args))
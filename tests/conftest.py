@@ -0,0 +1,97 @@
+"""Synthetic FY-3 granules shared by the tests"""
+
+import h5py
+import numpy as np
+import pytest
+
+from fy3Reader.parallel import shutdown_pools
+
+FY3D_MWRI = "FY3D_MWRIA_GBAL_L1_20240530_0405_010KM_MS.HDF"
+FY3G_MWRI = "FY3G_MWRI-_ORBD_L1_20240529_0328_7000M_V1.HDF"
+FY3D_MWHS = "FY3D_MWHSX_GBAL_L1_20240530_0405_015KM_MS.HDF"
+FY3G_PMR = "FY3G_PMR--_ORBA_L2_KuR_MLT_NUL_20240528_0026_5000M_V0.HDF"
+
+def swath(H, W, lon0=130.0, lat0=20.0):
+    """Tilted swath of `H` scan lines & `W` pixels, about 0.1 degree apart."""
+    j, i = np.meshgrid(np.arange(W), np.arange(H))
+    lat = lat0 + i * 0.1 + j * 0.02
+    lon = lon0 + j * 0.1 - i * 0.03
+    return lon.astype("f4"), lat.astype("f4")
+
+def _attrs(f, satellite):
+    f.attrs["Satellite Name"] = satellite.encode()
+    f.attrs["Observing Beginning Date"] = b"2024-05-30"
+    f.attrs["Observing Beginning Time"] = b"04:05:00.000"
+    f.attrs["Observing Ending Date"] = b"2024-05-30"
+    f.attrs["Observing Ending Time"] = b"04:55:00.000"
+
+def _counts(rng, shape):
+    # brightness temperatures of 177-307 K as scaled counts
+    return rng.integers(-15000, -2000, shape).astype("i2")
+
+def _calibration(dataset):
+    dataset.attrs["Slope"] = np.float32(0.01)
+    dataset.attrs["Intercept"] = np.float32(327.68)
+
+def make_fy3d_mwri(path, H=120, W=90, contiguous=False, **kwargs):
+    rng = np.random.default_rng(1)
+    with h5py.File(path, "w") as f:
+        _attrs(f, "FY-3D")
+        f["Geolocation/Longitude"], f["Geolocation/Latitude"] = swath(H, W, **kwargs)
+        EOB = f.create_dataset(
+            "Calibration/EARTH_OBSERVE_BT_10_to_89GHz", data=_counts(rng, (10, H, W)), chunks=None if contiguous else (1, 60, W)
+        )
+        _calibration(EOB)
+    return path
+
+def make_fy3g_mwri(path, H=120, W=90, **kwargs):
+    rng = np.random.default_rng(2)
+    with h5py.File(path, "w") as f:
+        _attrs(f, "FY-3G")
+        for group, channels, name in (("S1", 10, "EARTH_OBSERVE_BT_10_to_89GHz"), ("S2", 16, "EARTH_OBSERVE_BT_50_to_183GHz")):
+            f[group + "/Geolocation/Longitude"], f[group + "/Geolocation/Latitude"] = swath(H, W, **kwargs)
+            EOB = f.create_dataset(
+                group + "/Data/" + name, data=_counts(rng, (H, W, channels)), chunks=(30, W, channels), compression="gzip"
+            )
+            _calibration(EOB)
+    return path
+
+def make_fy3d_mwhs(path, H=120, W=98, **kwargs):
+    rng = np.random.default_rng(3)
+    with h5py.File(path, "w") as f:
+        _attrs(f, "FY-3D")
+        f["Geolocation/Longitude"], f["Geolocation/Latitude"] = swath(H, W, **kwargs)
+        EOB = f.create_dataset("Data/Earth_Obs_BT", data=_counts(rng, (15, H, W)))
+        _calibration(EOB)
+    return path
+
+def make_fy3g_pmr(path, H=100, W=49, bins=80):
+    rng = np.random.default_rng(4)
+    with h5py.File(path, "w") as f:
+        _attrs(f, "FY-3G")
+        lon, lat = swath(H, W)
+        # geolocation of 2 levels
+        f["Geo_Fields/Longitude"] = np.stack([lon, lon + 0.01], -1)
+        f["Geo_Fields/Latitude"] = np.stack([lat, lat + 0.01], -1)
+        f["SLV/zFactorCorrectedESurface"] = rng.uniform(0, 50, (H, W)).astype("f4")
+        z = rng.uniform(0, 50, (H, W, bins)).astype("f4")
+        z[z < 5] = -9999.9
+        f.create_dataset("SLV/zFactorCorrected", data=z, chunks=(10, W, bins))
+    return path
+
+@pytest.fixture(scope="session")
+def granules(tmp_path_factory):
+    """Paths of the synthetic granules by reader name."""
+    directory = tmp_path_factory.mktemp("granules")
+    return {
+        "FY3D_MWRI_L1": make_fy3d_mwri(str(directory / FY3D_MWRI)),
+        "FY3G_MWRI_L1": make_fy3g_mwri(str(directory / FY3G_MWRI)),
+        "FY3D_MWHS_L1": make_fy3d_mwhs(str(directory / FY3D_MWHS)),
+        "FY3G_PMR_L2": make_fy3g_pmr(str(directory / FY3G_PMR)),
+    }
+
+@pytest.fixture(scope="session", autouse=True)
+def _shared_pools():
+    # the process pools kept by `process_pool` are shut down after the tests
+    yield
+    shutdown_pools()
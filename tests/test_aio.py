@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+
+from fy3Reader.aio import AsyncReader, aopen
+from fy3Reader.mwri_l1 import FY3G_MWRI_L1
+
+BOX = (25, 35, 128, 138)
+
+def test_aresample_matches_resample(granules):
+    fname = granules["FY3G_MWRI_L1"]
+    expected = FY3G_MWRI_L1(fname)
+    expected.load("89_color")
+    expected.resample("nearest", (60, 60))
+
+    async def run():
+        reader = await aopen(fname)
+        await reader.aload("89_color")
+        await reader.aresample("nearest", to_shape=(60, 60))
+        return reader.values
+
+    np.testing.assert_array_equal(asyncio.run(run()), expected.values)
+
+@pytest.mark.parametrize("name", ["hydrometeor_type", "btemp_89.0h"])
+def test_cancelled_acrop_is_rolled_back(granules, name):
+    fname = granules["FY3G_MWRI_L1"]
+    reader = FY3G_MWRI_L1(fname)
+    reader.load(name)
+    cropped, release = threading.Event(), threading.Event()
+    crop_window = reader._crop_window
+
+    def blocking_crop_window(idx_box):
+        # the reader is cropped while the task is cancelled
+        crop_window(idx_box)
+        cropped.set()
+        release.wait(10)
+
+    reader._crop_window = blocking_crop_window
+
+    async def run():
+        areader = AsyncReader(reader)
+        task = asyncio.create_task(areader.acrop(BOX))
+        await asyncio.to_thread(cropped.wait, 10)
+        task.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert np.shape(reader.latitude) == np.shape(reader.longitude) == (120, 90)
+        assert len(reader.scanline_times) == 120
+        bands = reader.data if isinstance(reader.data, list) else [reader.data]
+        assert all(np.shape(d) == (120, 90) for d in bands)
+        await areader.aresample("nearest", to_shape=(40, 40))
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+    expected = FY3G_MWRI_L1(fname)
+    expected.load(name)
+    expected.resample("nearest", (40, 40))
+    np.testing.assert_array_equal(reader.values, expected.values)
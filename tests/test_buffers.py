@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from fy3Reader.buffers import BufferPool
+from fy3Reader.factory import open_reader
+
+CASES = [
+    ("FY3D_MWRI_L1", ["89_color", "89_pct", "btemp_37.0v"]),
+    ("FY3G_MWRI_L1", ["hydrometeor_type", "btemp_183.0_7v"]),
+    ("FY3D_MWHS_L1", ["89_color_mwhs", "btemp_150h"]),
+]
+
+@pytest.mark.parametrize("resampler", ["nearest", "bicubic"])
+@pytest.mark.parametrize("granule, names", CASES)
+def test_pooled_reader_matches_default(granules, granule, names, resampler):
+    fname = granules[granule]
+    pool = BufferPool()
+    pooled = open_reader(fname, pool=pool)
+    for name in names:
+        expected = open_reader(fname)
+        expected.load(name)
+        expected.resample(resampler, (50, 60))
+        # the second round runs in buffers given back by the first
+        for _ in range(2):
+            pooled.load(name)
+            pooled.resample(resampler, (50, 60))
+            assert pooled.values.dtype == expected.values.dtype
+            np.testing.assert_array_equal(pooled.values, expected.values)
+            np.testing.assert_array_equal(pooled.longitude, expected.longitude)
+    pooled.release()
+    assert pool.nbytes > 0
+
+def test_pool_reuses_buffers():
+    pool = BufferPool(max_bytes=1000)
+    buf = pool.acquire((10, 10))
+    pool.release(buf)
+    assert pool.nbytes == buf.nbytes
+    assert pool.acquire((10, 10)) is buf
+    assert pool.nbytes == 0
+    # views & buffers over the limit are not kept
+    pool.release(buf[:5])
+    pool.release(np.empty((20, 20)))
+    assert pool.nbytes == 0
+    pool.release(buf)
+    pool.clear()
+    assert pool.nbytes == 0 and pool.acquire((10, 10)) is not buf
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pytest
+
+from fy3Reader.cache import GranuleCache
+from fy3Reader.factory import open_reader
+from fy3Reader.pmr_l2 import FY3G_PMR_L2
+from fy3Reader.scene import Scene
+
+@pytest.fixture
+def cache(tmp_path):
+    return GranuleCache(str(tmp_path / "cache"), max_bytes=None)
+
+@pytest.mark.parametrize("granule, name", [
+    ("FY3D_MWRI_L1", "89_color"), ("FY3G_MWRI_L1", "btemp_183.0_7v"), ("FY3D_MWHS_L1", "89_color_mwhs"),
+])
+def test_cached_reader_matches_default(granules, cache, granule, name):
+    fname = granules[granule]
+    expected = open_reader(fname)
+    expected.load(name)
+    expected.resample("nearest", (50, 60))
+    # a miss, then a hit mapped from the cache
+    for _ in range(2):
+        reader = open_reader(fname, cache=cache)
+        reader.load(name)
+        reader.resample("nearest", (50, 60))
+        np.testing.assert_array_equal(reader.values, expected.values)
+    assert cache.nbytes > 0
+
+def test_cached_pmr_matches_default(granules, cache):
+    fname = granules["FY3G_PMR_L2"]
+    for name in FY3G_PMR_L2(fname).all_available_datasets():
+        expected = FY3G_PMR_L2(fname)
+        expected.load(name, level=1, bins=(10, 20))
+        for _ in range(2):
+            reader = FY3G_PMR_L2(fname, cache=cache)
+            reader.load(name, level=1, bins=(10, 20))
+            np.testing.assert_array_equal(reader.data, expected.data)
+            np.testing.assert_array_equal(reader.longitude, expected.longitude)
+
+def test_scene_reads_through_cache(granules, cache):
+    fname = granules["FY3D_MWRI_L1"]
+    expected = Scene(open_reader(fname))
+    expected.load(["89_color", "hydrometeor_type"])
+    for _ in range(2):
+        scn = Scene(open_reader(fname, cache=cache))
+        scn.load(["89_color", "hydrometeor_type"])
+        np.testing.assert_array_equal(scn["89_color"], expected["89_color"])
+
+def test_cache_entries(tmp_path):
+    cache = GranuleCache(str(tmp_path / "cache"), max_bytes=3 * 8000 + 500)
+    fname = str(tmp_path / "granule")
+    with open(fname, "w") as f:
+        f.write("v1")
+    calls = []
+    loader = lambda: calls.append(1) or np.arange(1000.0)
+    key = cache.key(fname, "/group", "band")
+    np.testing.assert_array_equal(cache.fetch(key, loader), np.arange(1000.0))
+    hit = cache.fetch(key, loader)
+    assert len(calls) == 1 and isinstance(hit, np.memmap) and not hit.flags.writeable
+    # a granule replaced in place gets new keys
+    with open(fname, "w") as f:
+        f.write("v2 longer")
+    assert cache.key(fname, "/group", "band") != key
+    # least recently used entries are evicted over `max_bytes`
+    for band in range(4):
+        cache.put(cache.key(fname, "/group", band), np.zeros(1000))
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.get(key) is None
+    cache.clear()
+    assert cache.nbytes == 0
@@ -0,0 +1,22 @@
+import numpy as np
+
+from fy3Reader.collocation import Collocator, collocate_batch, swath_of
+from fy3Reader.mwri_l1 import FY3D_MWRI_L1
+from fy3Reader.pmr_l2 import FY3G_PMR_L2
+from fy3Reader.parallel import process_pool
+
+def test_collocate_batch_matches_collocator(granules):
+    mwri = FY3D_MWRI_L1(granules["FY3D_MWRI_L1"])
+    mwri.load("btemp_89.0h")
+    pmr = FY3G_PMR_L2(granules["FY3G_PMR_L2"])
+    pmr.load("zFactorCorrectedESurface", level=0)
+    reference, target = swath_of(mwri), swath_of(pmr)
+    expected = Collocator(*reference).match(*target, max_distance=10, max_time=900)
+    assert expected[0].size
+    for processes in (2, process_pool(2)):
+        results = collocate_batch([(reference, target)] * 2, max_distance=10, max_time=900, processes=processes)
+        for result in results:
+            for a, b in zip(result, expected):
+                np.testing.assert_array_equal(a, b)
+    # workers are kept for the next calls
+    assert process_pool(2) is process_pool(2)
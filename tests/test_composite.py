@@ -0,0 +1,65 @@
+import pickle
+import numpy as np
+import pytest
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
+
+from fy3Reader import composite
+from fy3Reader.composite import Color_89, HydrometeorType, PolarizationCorrectedTemperature, fused_composite
+from fy3Reader.mwri_l1 import FY3D_MWRI_L1
+
+def _bands(n, shape=(70, 50)):
+    rng = np.random.default_rng(0)
+    bands = [rng.uniform(180, 300, shape) for _ in range(n)]
+    bands[0][3, 4] = np.nan
+    return bands
+
+def _reference(cls, datas, fractions=None):
+    # channels evaluated on full bands & stretched by matplotlib
+    cm = cls(datas, fractions=fractions)
+    scope = dict(cm.params, **dict(zip(cls.variables, datas)))
+    channels = []
+    for _, expr, vmin, vmax, cmap in cls.channels:
+        value = eval(expr, {"np": np}, scope)
+        if cmap is None:
+            return value
+        channels.append(ScalarMappable(Normalize(vmin, vmax, clip=True), cmap).to_rgba(value, bytes=True)[..., 0])
+    return np.stack(channels, axis=-1)
+
+@pytest.mark.parametrize("cls", [Color_89, HydrometeorType, PolarizationCorrectedTemperature])
+def test_fused_matches_full_evaluation(cls, monkeypatch):
+    datas = _bands(len(cls.variables))
+    expected = _reference(cls, datas)
+    np.testing.assert_array_equal(cls(datas).composite(), expected)
+    # blocks of a few rows, written into a given output
+    monkeypatch.setattr(composite, "BLOCK_BYTES", 3 * 8 * 50)
+    out = np.empty_like(expected)
+    assert cls(datas).composite(out=out) is out
+    np.testing.assert_array_equal(out, expected)
+    blocks = [block for _, block in cls(datas).iter_blocks()]
+    assert len(blocks) > 1
+    np.testing.assert_array_equal(np.concatenate(blocks), expected)
+
+def test_limits_replace_stretch():
+    datas = _bands(2)
+    stretched = fused_composite(
+        "stretched_89", Color_89.variables, [(Color_89.channels[0][0], Color_89.channels[0][1], 230, 280, "gray_r")] + list(Color_89.channels[1:]),
+        fraction_names=Color_89.fraction_names, default_fractions=Color_89.default_fractions
+    )
+    np.testing.assert_array_equal(
+        Color_89(datas, limits={"r_89_pct": (230, 280)}).composite(), stretched(datas).composite()
+    )
+    with pytest.raises(ValueError):
+        Color_89(datas, limits={"unknown": (0, 1)})
+
+def test_declared_composite_on_reader(granules):
+    NDI_89 = fused_composite("89_ndi", ("v", "h"), [("ndi", "(v - h) / (v + h)", None, None, None)])
+    # declared at runtime, pickled by its declaration
+    assert pickle.loads(pickle.dumps(NDI_89)).channels == NDI_89.channels
+    assert pickle.loads(pickle.dumps(Color_89)) is Color_89
+    reader = FY3D_MWRI_L1(granules["FY3D_MWRI_L1"])
+    reader.register_composite("89_ndi", ["btemp_89.0v", "btemp_89.0h"], NDI_89, rgb=False)
+    reader.load("89_ndi")
+    v, h = reader.data
+    reader.composite()
+    np.testing.assert_allclose(reader.values, (v - h) / (v + h))
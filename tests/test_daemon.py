@@ -0,0 +1,100 @@
+import os
+import shutil
+import time
+import threading
+import types
+from collections import namedtuple
+import pytest
+
+from fy3Reader import daemon
+from fy3Reader.daemon import IngestDaemon
+
+Event = namedtuple("Event", ["wd", "mask", "cookie", "name"])
+FLAGS = types.SimpleNamespace(CLOSE_WRITE=8, MOVED_FROM=64, MOVED_TO=128, DELETE=512)
+
+@pytest.fixture
+def watch_dir(tmp_path, granules):
+    # a MWRI granule & a PMR granule (no Scene) already in the directory
+    directory = tmp_path / "incoming"
+    directory.mkdir()
+    for name in ("FY3D_MWRI_L1", "FY3G_PMR_L2"):
+        shutil.copy(granules[name], directory)
+    past = time.time() - 60
+    for fname in os.listdir(directory):
+        os.utime(directory / fname, (past, past))
+    return str(directory)
+
+def _ingest(watch_dir, tmp_path, **kwargs):
+    return IngestDaemon(
+        watch_dir, str(tmp_path / "products"), ["89_color"], to_shape=(50, 50), poll_interval=0.05, settle=0.1, **kwargs
+    )
+
+def _submitted(ingest, watch, seconds=0.5):
+    # run `watch` of `ingest` in a thread, recording the queued granules
+    queued = []
+    ingest.submit = lambda fname, arrived=None: queued.append(os.path.basename(fname)) or True
+    thread = threading.Thread(target=watch)
+    thread.start()
+    time.sleep(seconds)
+    ingest._stop.set()
+    thread.join()
+    return queued
+
+def test_poll_skips_pmr(watch_dir, tmp_path):
+    ingest = _ingest(watch_dir, tmp_path)
+    assert _submitted(ingest, ingest._watch_poll) == [os.path.basename(f) for f in os.listdir(watch_dir) if "MWRI" in f]
+
+def test_inotify_takes_backlog_once(watch_dir, tmp_path, monkeypatch):
+    names = sorted(os.listdir(watch_dir))
+
+    class FakeINotify(object):
+        # the closing of the granules already there arrives after the scan
+        events = [Event(1, FLAGS.CLOSE_WRITE, 0, name) for name in names]
+
+        def add_watch(self, path, mask):
+            pass
+
+        def read(self, timeout):
+            events, FakeINotify.events = FakeINotify.events, []
+            time.sleep(timeout / 1000)
+            return events
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(daemon, "INotify", FakeINotify, raising=False)
+    monkeypatch.setattr(daemon, "flags", FLAGS, raising=False)
+    ingest = _ingest(watch_dir, tmp_path)
+    assert _submitted(ingest, ingest._watch_inotify) == [name for name in names if "MWRI" in name]
+
+def test_unsettled_granule_waits(watch_dir, tmp_path):
+    ingest = _ingest(watch_dir, tmp_path)
+    queued = []
+    ingest.submit = lambda fname, arrived=None: queued.append(fname) or True
+    fname = os.path.join(watch_dir, [f for f in os.listdir(watch_dir) if "MWRI" in f][0])
+    pending = {}
+    ingest._submit_settled([fname], pending)
+    # still being written
+    with open(fname, "ab") as f:
+        f.write(b"\0")
+    time.sleep(0.15)
+    ingest._submit_settled([fname], pending)
+    assert queued == [] and fname in pending
+    time.sleep(0.15)
+    ingest._submit_settled([fname], pending)
+    ingest._submit_settled([fname], pending)
+    assert queued == [fname] and not pending
+
+def test_process_rejects_pmr(watch_dir, tmp_path):
+    ingest = _ingest(watch_dir, tmp_path)
+    fname = os.path.join(watch_dir, [f for f in os.listdir(watch_dir) if "PMR" in f][0])
+    with pytest.raises(ValueError):
+        ingest.process(fname)
+
+def test_process_writes_products(watch_dir, tmp_path):
+    ingest = _ingest(watch_dir, tmp_path)
+    os.makedirs(ingest.out_dir)
+    fname = os.path.join(watch_dir, [f for f in os.listdir(watch_dir) if "MWRI" in f][0])
+    written = ingest.process(fname)
+    assert [os.path.basename(f) for f in written] == [os.path.basename(fname)[:-4] + "_89_color.nc"]
+    assert ingest.stats()["save"]["count"] == 1
@@ -0,0 +1,82 @@
+import h5py
+import numpy as np
+import pytest
+
+from fy3Reader import h5io
+from fy3Reader.h5io import iter_channel_blocks, read_channels, read_hyperslab
+
+LAYOUTS = [
+    # name, channel axis, chunks, compression
+    ("last_contiguous", -1, None, None),
+    ("last_chunked", -1, (16, 30, 16), "gzip"),
+    ("last_chunked_one", -1, (32, 30, 1), "gzip"),
+    ("last_chunked_four", -1, (20, 15, 4), None),
+    ("first_contiguous", 0, None, None),
+    ("first_chunked", 0, (16, 32, 30), "gzip"),
+    ("first_chunked_one", 0, (1, 32, 30), "gzip"),
+]
+
+@pytest.fixture(scope="module")
+def layouts(tmp_path_factory):
+    fname = str(tmp_path_factory.mktemp("h5io") / "layouts.h5")
+    data = np.random.default_rng(0).integers(0, 30000, (100, 30, 16)).astype("i2")
+    with h5py.File(fname, "w") as f:
+        for name, axis, chunks, compression in LAYOUTS:
+            f.create_dataset(name, data=data if axis == -1 else np.moveaxis(data, -1, 0), chunks=chunks, compression=compression)
+    with h5py.File(fname, "r") as f:
+        yield f
+
+def _channel(dataset, axis, idx):
+    return dataset[idx] if axis == 0 else dataset[..., idx]
+
+@pytest.mark.parametrize("name, axis", [(name, axis) for name, axis, _, _ in LAYOUTS])
+def test_read_channels_like_h5py(layouts, name, axis, monkeypatch):
+    dataset = layouts[name]
+    indices = [13, 2, 7, 8]
+    # blocks of a few rows
+    monkeypatch.setattr(h5io, "BLOCK_BYTES", 4096)
+    for dtype in (None, "f4"):
+        outs = read_channels(dataset, indices, axis=axis, dtype=dtype)
+        for idx, out in zip(indices, outs):
+            np.testing.assert_array_equal(out, _channel(dataset, axis, idx))
+            assert out.dtype == (dataset.dtype if dtype is None else np.dtype(dtype))
+    # into given outputs, e.g. buffers of a pool
+    outs = [np.empty(dataset.shape[1:] if axis == 0 else dataset.shape[:-1]) for _ in indices]
+    assert all(a is b for a, b in zip(read_channels(dataset, indices, axis=axis, outs=outs), outs))
+    for idx, out in zip(indices, outs):
+        np.testing.assert_array_equal(out, _channel(dataset, axis, idx))
+    rows = [(r0, r1) for r0, r1, _ in iter_channel_blocks(dataset, indices, axis=axis)]
+    assert len(rows) > 1 and rows[0][0] == 0 and rows[-1][1] == 100
+    assert all(a[1] == b[0] for a, b in zip(rows, rows[1:]))
+
+def test_read_hyperslab(layouts):
+    dataset = layouts["last_chunked"]
+    out = np.empty((10, 5, 3), dtype="f8")
+    read_hyperslab(dataset, out, (20, 3, 4), (10, 5, 3))
+    np.testing.assert_array_equal(out, dataset[20:30, 3:8, 4:7])
+    # not contiguous outputs & a squeezed memory shape
+    out = np.empty((20, 6), dtype="i2")[:, ::2]
+    read_hyperslab(dataset, out, (0, 5, 2), (20, 3, 1))
+    np.testing.assert_array_equal(out, dataset[0:20, 5:8, 2])
+    with pytest.raises(ValueError):
+        read_channels(dataset, [0], axis=1)
+
+def test_memmap_only_contiguous(layouts):
+    assert h5io.memmap_dataset(layouts["last_chunked"]) is None
+    raw = h5io.memmap_dataset(layouts["first_contiguous"])
+    assert isinstance(raw, np.memmap)
+    np.testing.assert_array_equal(raw, layouts["first_contiguous"][...])
+    band = h5io.CalibratedMemmap(raw[3], lambda counts: counts * 0.01 + 327.68)
+    assert band.shape == (100, 30) and band.dtype == np.float64
+    np.testing.assert_array_equal(np.asarray(band[10:20, 5:]), layouts["first_contiguous"][3, 10:20, 5:] * 0.01 + 327.68)
+
+@pytest.mark.parametrize("name, axis", [(name, axis) for name, axis, _, _ in LAYOUTS])
+def test_read_strided_like_h5py(layouts, name, axis):
+    dataset = layouts[name]
+    for stride in (1, 3, 7):
+        np.testing.assert_array_equal(h5io.read_strided(dataset, stride), dataset[::stride, ::stride, ::stride])
+        out = h5io.read_strided(dataset, stride, index=5, axis=axis, dtype="f4")
+        assert out.dtype == np.float32
+        np.testing.assert_array_equal(out, _channel(dataset, axis, 5)[::stride, ::stride])
+    with pytest.raises(ValueError):
+        h5io.read_strided(dataset, 2, index=0, axis=1)
@@ -0,0 +1,54 @@
+import pickle
+import numpy as np
+import pytest
+
+from conftest import make_fy3d_mwri
+from fy3Reader.factory import open_reader
+from fy3Reader.h5io import CalibratedMemmap
+from fy3Reader.scene import Scene
+
+BOX = (22, 30, 130, 138)
+
+@pytest.fixture(scope="module")
+def contiguous(tmp_path_factory, granules):
+    # MWRI counts stored contiguous, MWHS counts are already
+    directory = tmp_path_factory.mktemp("contiguous")
+    return {
+        "FY3D_MWRI_L1": make_fy3d_mwri(str(directory / "FY3D_MWRIA_GBAL_L1_20240530_0405_010KM_MS.HDF"), contiguous=True),
+        "FY3D_MWHS_L1": granules["FY3D_MWHS_L1"],
+    }
+
+@pytest.mark.parametrize("resampler", ["nearest", "bicubic"])
+@pytest.mark.parametrize("granule, names", [
+    ("FY3D_MWRI_L1", ["89_color", "89_pct", "btemp_37.0v"]),
+    ("FY3D_MWHS_L1", ["89_color_mwhs", "btemp_150h"]),
+])
+def test_memmapped_reader_matches_default(contiguous, granule, names, resampler):
+    fname = contiguous[granule]
+    for name in names:
+        expected = open_reader(fname)
+        expected.load(name)
+        expected.crop(BOX)
+        expected.resample(resampler, (50, 60))
+        reader = open_reader(fname, mmap=True)
+        reader.load(name)
+        band = reader.data[0] if name in reader.COMPOSITE_BANDS else reader.data
+        assert isinstance(band, CalibratedMemmap)
+        reader.crop(BOX)
+        reader.resample(resampler, (50, 60))
+        np.testing.assert_array_equal(reader.values, expected.values)
+
+def test_memmapped_bands(contiguous):
+    fname = contiguous["FY3D_MWRI_L1"]
+    expected = open_reader(fname)
+    expected.load("btemp_89.0v")
+    reader = open_reader(fname, mmap=True)
+    reader.load("btemp_89.0v")
+    assert reader.data.dtype == expected.data.dtype
+    np.testing.assert_array_equal(np.asarray(reader.data), expected.data)
+    np.testing.assert_array_equal(pickle.loads(pickle.dumps(reader.data[3:5])), expected.data[3:5])
+    # a Scene evaluates composites of lazy bands block by block
+    scenes = [Scene(open_reader(fname, mmap=mmap)) for mmap in (False, True)]
+    for scn in scenes:
+        scn.load(["hydrometeor_type"])
+    np.testing.assert_array_equal(scenes[1]["hydrometeor_type"], scenes[0]["hydrometeor_type"])
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+
+from fy3Reader import parallel
+from fy3Reader.mwri_l1 import FY3D_MWRI_L1, FY3G_MWRI_L1
+
+@pytest.fixture
+def in_processes(monkeypatch):
+    # the synthetic granules are small, send them to the workers anyway
+    monkeypatch.setattr(parallel, "MIN_PARALLEL_BYTES", 0)
+
+def _loaded(cls, fname, name, **kwargs):
+    reader = cls(fname)
+    reader.load(name, **kwargs)
+    return reader
+
+@pytest.mark.parametrize("cls, granule", [(FY3D_MWRI_L1, "FY3D_MWRI_L1"), (FY3G_MWRI_L1, "FY3G_MWRI_L1")])
+@pytest.mark.parametrize("resampler", ["nearest", "bicubic"])
+def test_processes_match_serial(granules, in_processes, cls, granule, resampler):
+    fname = granules[granule]
+    expected = _loaded(cls, fname, "hydrometeor_type")
+    for processes in (2, parallel.process_pool(2)):
+        reader = _loaded(cls, fname, "hydrometeor_type", processes=processes)
+        for a, b in zip(reader.data, expected.data):
+            np.testing.assert_array_equal(a, b)
+            assert a.dtype == b.dtype
+    expected.resample(resampler, (50, 60))
+    reader.resample(resampler, (50, 60), processes=2)
+    np.testing.assert_array_equal(reader.values, expected.values)
+
+def test_caller_executor(granules, in_processes):
+    fname = granules["FY3G_MWRI_L1"]
+    expected = _loaded(FY3G_MWRI_L1, fname, "89_color")
+    with ProcessPoolExecutor(2) as executor:
+        assert parallel.process_pool(executor) is executor
+        reader = _loaded(FY3G_MWRI_L1, fname, "89_color", processes=executor)
+    for a, b in zip(reader.data, expected.data):
+        np.testing.assert_array_equal(a, b)
+
+def test_small_bands_read_serially(granules, monkeypatch):
+    # no pool is started below `MIN_PARALLEL_BYTES`
+    monkeypatch.setattr(parallel, "process_pool", None)
+    fname = granules["FY3D_MWRI_L1"]
+    reader = _loaded(FY3D_MWRI_L1, fname, "89_color", processes=2)
+    expected = _loaded(FY3D_MWRI_L1, fname, "89_color")
+    for a, b in zip(reader.data, expected.data):
+        np.testing.assert_array_equal(a, b)
+    lons, lats = expected.get_lonlats()
+    stack = parallel.resample_bands(lons, lats, expected.data, (30, 40), processes=2)
+    assert stack.shape == (2, 30, 40)
+
+def test_shared_pools_are_kept():
+    pool = parallel.process_pool(3)
+    assert parallel.process_pool(3) is pool
+    parallel.shutdown_pools()
+    assert parallel.process_pool(3) is not pool
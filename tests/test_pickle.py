@@ -0,0 +1,63 @@
+import pickle
+import numpy as np
+import pytest
+
+from fy3Reader.buffers import BufferPool
+from fy3Reader.composite import fused_composite
+from fy3Reader.factory import open_reader
+from fy3Reader.parallel import process_pool
+from fy3Reader.pmr_l2 import FY3G_PMR_L2
+
+BOX = (22, 30, 130, 138)
+
+def _work(reader):
+    reader.crop(BOX)
+    reader.resample("nearest", (40, 40))
+    return reader
+
+def _reader(fname, name, **kwargs):
+    reader = open_reader(fname, **kwargs)
+    ndi = fused_composite("89_ndi", ("v", "h"), [("ndi", "(v - h) / (v + h)", None, None, None)])
+    reader.register_composite("89_ndi", ["btemp_89.0v", "btemp_89.0h"], ndi, rgb=False)
+    reader.load(name)
+    return reader
+
+@pytest.mark.parametrize("name", ["89_color", "89_ndi", "btemp_89.0h"])
+def test_loaded_reader_round_trip(granules, name):
+    fname = granules["FY3D_MWRI_L1"]
+    expected = _work(_reader(fname, name))
+    for kwargs in ({}, {"pool": BufferPool()}):
+        reader = pickle.loads(pickle.dumps(_reader(fname, name, **kwargs)))
+        # the pool stays in the process of the reader
+        assert reader.pool is None
+        np.testing.assert_array_equal(_work(reader).values, expected.values)
+
+def test_readers_in_processes(granules):
+    fname = granules["FY3D_MWRI_L1"]
+    names = ["89_color", "89_ndi"]
+    expected = [_work(_reader(fname, name)).values for name in names]
+    results = process_pool(2).map(_work, [_reader(fname, name) for name in names])
+    for result, values in zip(results, expected):
+        np.testing.assert_array_equal(result.values, values)
+
+@pytest.mark.parametrize("granule", ["FY3G_MWRI_L1", "FY3D_MWHS_L1"])
+def test_unloaded_reader_reopens_file(granules, granule):
+    fname = granules[granule]
+    reader = pickle.loads(pickle.dumps(open_reader(fname)))
+    name = open_reader(fname).all_available_datasets()[0]
+    reader.load(name)
+    expected = open_reader(fname)
+    expected.load(name)
+    np.testing.assert_array_equal(reader.values, expected.values)
+
+def test_pmr_round_trip(granules):
+    reader = FY3G_PMR_L2(granules["FY3G_PMR_L2"])
+    reader.load("zFactorCorrectedESurface")
+    reader.crop(BOX)
+    copy = pickle.loads(pickle.dumps(reader))
+    np.testing.assert_array_equal(copy.data, reader.data)
+    # the index cache is dropped & rebuilt for the new coordinates
+    copy.load("zFactorCorrectedESurface")
+    copy.crop(BOX)
+    np.testing.assert_array_equal(copy.data, reader.data)
+    assert copy.attrs["Satellite Name"] == "FY-3G"
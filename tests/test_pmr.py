@@ -0,0 +1,49 @@
+import h5py
+import numpy as np
+import pytest
+
+from fy3Reader.pmr_l2 import FY3G_PMR_L2
+
+def _volume(fname, level=0):
+    with h5py.File(fname, "r") as f:
+        volume = f["SLV/zFactorCorrected"][...]
+        lon, lat = f["Geo_Fields/Longitude"][..., level], f["Geo_Fields/Latitude"][..., level]
+    return np.where(volume == np.float32(-9999.9), np.nan, volume), lon, lat
+
+@pytest.mark.parametrize("level", [0, 1])
+def test_bins_are_read_as_hyperslab(granules, level):
+    fname = granules["FY3G_PMR_L2"]
+    volume, lon, lat = _volume(fname, level)
+    reader = FY3G_PMR_L2(fname)
+    reader.load("zFactorCorrected", level=level, bins=(10, 30))
+    np.testing.assert_array_equal(reader.data, volume[..., 10:30])
+    np.testing.assert_array_equal(reader.longitude, lon)
+    np.testing.assert_array_equal(reader.latitude, lat)
+    # float32 fills are masked
+    assert np.isnan(reader.data).any()
+    with pytest.raises(ValueError):
+        reader.load("unknown")
+
+def test_curtain_along_track(granules):
+    fname = granules["FY3G_PMR_L2"]
+    volume, lon, lat = _volume(fname)
+    reader = FY3G_PMR_L2(fname)
+    lons, lats, curtain = reader.vertical_profile("zFactorCorrected", bins=(0, 40))
+    ray = volume.shape[1] // 2
+    np.testing.assert_array_equal(curtain, volume[:, ray, :40])
+    np.testing.assert_array_equal(lons, lon[:, ray])
+    _, _, curtain = reader.vertical_profile("zFactorCorrected", ray=3)
+    np.testing.assert_array_equal(curtain, volume[:, 3])
+    with pytest.raises(ValueError):
+        reader.vertical_profile("zFactorCorrectedESurface")
+
+def test_curtain_along_polyline(granules):
+    fname = granules["FY3G_PMR_L2"]
+    volume, lon, lat = _volume(fname)
+    reader = FY3G_PMR_L2(fname)
+    # through the pixel centres of one scan line
+    row = 40
+    polyline = [(lon[row, 5], lat[row, 5]), (lon[row, 25], lat[row, 25])]
+    lons, lats, curtain = reader.vertical_profile("zFactorCorrected", polyline=polyline, samples=21)
+    assert curtain.shape == (21, volume.shape[2])
+    np.testing.assert_array_equal(curtain, volume[row, 5:26])
@@ -0,0 +1,96 @@
+import os
+import numpy as np
+import pytest
+
+from conftest import make_fy3d_mwri
+from fy3Reader.factory import open_reader
+from fy3Reader.mwri_l1 import FY3D_MWRI_L1
+from fy3Reader.pmr_l2 import FY3G_PMR_L2
+from fy3Reader.quicklook import Overviews, quicklook
+
+def _bands(reader):
+    return reader.data if isinstance(reader.data, list) else [reader.data]
+
+def _full(fname, name):
+    reader = open_reader(fname)
+    reader.load(name)
+    return reader
+
+@pytest.mark.parametrize("granule, name", [
+    ("FY3D_MWRI_L1", "89_color"), ("FY3G_MWRI_L1", "hydrometeor_type"),
+    ("FY3D_MWHS_L1", "btemp_150h"), ("FY3D_MWHS_L1", "89_color_mwhs"),
+])
+def test_strided_load_like_sliced_load(granules, granule, name):
+    fname = granules[granule]
+    full = _full(fname, name)
+    reader = open_reader(fname)
+    for stride in (2, 3, 8):
+        reader.load(name, stride=stride)
+        for a, b in zip(_bands(full), _bands(reader)):
+            assert b.dtype == a.dtype
+            np.testing.assert_array_equal(b, np.asarray(a)[::stride, ::stride])
+        np.testing.assert_array_equal(reader.longitude, full.longitude[::stride, ::stride])
+        np.testing.assert_array_equal(reader.scanline_times, full.scanline_times[::stride])
+
+def test_overview_levels(granules, tmp_path):
+    fname = granules["FY3D_MWRI_L1"]
+    full = _full(fname, "89_color")
+    overviews = Overviews(fname, directory=str(tmp_path))
+    assert overviews.levels() == []
+    overviews.build(FY3D_MWRI_L1(fname), ["89_color"], levels=(2, 4, 8))
+    assert overviews.levels() == [2, 4, 8]
+    # stored levels, and a new level sliced from the coarsest one
+    for stride in (8, 16):
+        reader = FY3D_MWRI_L1(fname)
+        reader.load("89_color", stride=stride, overviews=overviews)
+        for a, b in zip(_bands(full), _bands(reader)):
+            np.testing.assert_array_equal(b, a[::stride, ::stride])
+        np.testing.assert_array_equal(reader.latitude, full.latitude[::stride, ::stride])
+    assert overviews.levels() == [2, 4, 8, 16]
+    group = FY3D_MWRI_L1(fname)._band_source("btemp_89.0v")[1].name
+    np.testing.assert_array_equal(overviews.get(group, "btemp_89.0v", 4), _bands(full)[0][::4, ::4])
+    assert overviews.get(group, "btemp_10.65v", 4) is None
+    overviews.clear()
+    assert overviews.levels() == []
+
+def test_overviews_of_replaced_granule(tmp_path):
+    fname = make_fy3d_mwri(str(tmp_path / "FY3D_MWRIA_GBAL_L1_20240530_0405_010KM_MS.HDF"))
+    overviews = Overviews(fname)
+    overviews.build(FY3D_MWRI_L1(fname), ["btemp_89.0h"], levels=(4,))
+    # the same granule name, moved geolocation & a later modification time
+    make_fy3d_mwri(fname, lon0=140.0)
+    stat = os.stat(fname)
+    os.utime(fname, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert overviews.levels() == []
+    reader = FY3D_MWRI_L1(fname)
+    reader.load("btemp_89.0h", stride=4, overviews=overviews)
+    np.testing.assert_array_equal(reader.longitude, _full(fname, "btemp_89.0h").longitude[::4, ::4])
+    assert overviews.levels() == [4]
+
+@pytest.mark.parametrize("resampler", ["nearest", "bicubic"])
+def test_quicklook_like_strided_resample(granules, tmp_path, resampler):
+    fname = granules["FY3D_MWRI_L1"]
+    reader = FY3D_MWRI_L1(fname)
+    reader.load("89_color", stride=4)
+    reader.resample(resampler, reader.latitude.shape)
+    overviews = Overviews(fname, directory=str(tmp_path))
+    for _ in range(2):
+        lons, lats, values = quicklook(FY3D_MWRI_L1(fname), "89_color", stride=4, resampler=resampler, overviews=overviews)
+        np.testing.assert_array_equal(values, reader.values)
+        np.testing.assert_array_equal(lons, reader.longitude)
+    assert values.shape == (30, 23, 3)
+    with pytest.raises(ValueError):
+        quicklook(FY3D_MWRI_L1(fname), "89_color", stride=0)
+
+@pytest.mark.parametrize("name, bins", [("zFactorCorrectedESurface", None), ("zFactorCorrected", (10, 40))])
+def test_pmr_strided_load(granules, tmp_path, name, bins):
+    fname = granules["FY3G_PMR_L2"]
+    reader = FY3G_PMR_L2(fname)
+    reader.load(name, level=1, bins=bins)
+    full, lons = reader.data, reader.longitude
+    overviews = Overviews(fname, directory=str(tmp_path))
+    for stride, kwargs in ((3, {}), (3, {"overviews": overviews}), (6, {"overviews": overviews})):
+        reader.load(name, level=1, bins=bins, stride=stride, **kwargs)
+        np.testing.assert_array_equal(reader.data, full[::stride, ::stride])
+        np.testing.assert_array_equal(reader.longitude, lons[::stride, ::stride])
+    assert overviews.levels() == [3, 6]
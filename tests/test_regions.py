@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from fy3Reader import regions
+from fy3Reader.buffers import BufferPool
+from fy3Reader.factory import open_reader
+from fy3Reader.pmr_l2 import FY3G_PMR_L2
+from fy3Reader.regions import box_windows, extract_regions
+
+BOXES = [(25, 30, 130, 135), (28, 33, 133, 138), (22, 26, 131, 133)]
+
+def _bands(reader):
+    return reader.data if isinstance(reader.data, list) else [reader.data]
+
+def _cropped(fname, name, box, **kwargs):
+    reader = open_reader(fname)
+    reader.load(name)
+    reader.crop(box)
+    if kwargs:
+        reader.resample(**kwargs)
+    return reader
+
+@pytest.mark.parametrize("granule, name", [
+    ("FY3D_MWRI_L1", "89_color"), ("FY3D_MWRI_L1", "btemp_89.0v"),
+    ("FY3G_MWRI_L1", "hydrometeor_type"), ("FY3D_MWHS_L1", "89_color_mwhs"),
+])
+def test_crop_many_like_crop(granules, monkeypatch, granule, name):
+    fname = granules[granule]
+    # the geolocation scanned in blocks of a few rows
+    monkeypatch.setattr(regions, "SCAN_BYTES", 2000)
+    reader = open_reader(fname)
+    reader.load(name)
+    longitude, bands = reader.longitude, list(_bands(reader))
+    for box, region in zip(BOXES, reader.crop_many(BOXES)):
+        expected = _cropped(fname, name, box)
+        for a, b in zip(_bands(region), _bands(expected)):
+            np.testing.assert_array_equal(a, b)
+        np.testing.assert_array_equal(region.longitude, expected.longitude)
+        np.testing.assert_array_equal(region.scanline_times, expected.scanline_times)
+        assert np.shares_memory(region.latitude, reader.latitude)
+    # the reader is not changed
+    assert reader.longitude is longitude and all(a is b for a, b in zip(_bands(reader), bands))
+
+@pytest.mark.parametrize("resampler", ["nearest", "bicubic"])
+@pytest.mark.parametrize("pool", [None, BufferPool()])
+def test_extract_regions_like_crop_resample(granules, resampler, pool):
+    fname = granules["FY3D_MWRI_L1"]
+    reader = open_reader(fname, pool=pool)
+    reader.load("89_color")
+    for threads in (None, 3):
+        for box, region in zip(BOXES, extract_regions(reader, BOXES, threads=threads, resampler=resampler, to_shape=(40, 40))):
+            expected = _cropped(fname, "89_color", box, resampler=resampler, to_shape=(40, 40))
+            np.testing.assert_array_equal(region.values, expected.values)
+    assert [region.dataset_name for region in extract_regions(reader, BOXES)] == ["89_color"] * 3
+
+def test_pmr_crop_many_like_crop(granules):
+    fname = granules["FY3G_PMR_L2"]
+    reader = FY3G_PMR_L2(fname)
+    reader.load("zFactorCorrectedESurface")
+    for box, region in zip(BOXES, reader.crop_many(BOXES)):
+        expected = FY3G_PMR_L2(fname)
+        expected.load("zFactorCorrectedESurface")
+        expected.crop(box)
+        np.testing.assert_array_equal(region.data, expected.data)
+        np.testing.assert_array_equal(region.latitude, expected.latitude)
+
+def test_empty_box(granules):
+    reader = open_reader(granules["FY3D_MWRI_L1"])
+    with pytest.raises(ValueError):
+        reader.crop_many(BOXES)
+    reader.load("89_color")
+    with pytest.raises(ValueError):
+        reader.crop_many([BOXES[0], (-80, -70, 0, 10)])
+
+def test_box_windows(monkeypatch):
+    lat, lon = np.meshgrid(np.arange(20.0), np.arange(10.0), indexing="ij")
+    mask = lambda lon, lat, box: (lat >= box[0]) & (lat <= box[1]) & (lon >= box[2]) & (lon <= box[3])
+    # lat & lon are the row & column, the windows are the boxes (last row & column included)
+    boxes = [(2, 5, 1, 3), (0, 19, 0, 9), (15, 15, 9, 9)]
+    for scan_bytes in (regions.SCAN_BYTES, 200):
+        monkeypatch.setattr(regions, "SCAN_BYTES", scan_bytes)
+        assert [tuple(int(i) for i in window) for window in box_windows(lon, lat, boxes, mask)] == boxes
+    with pytest.raises(ValueError):
+        box_windows(lon, lat, [(30, 40, 0, 1)], mask)
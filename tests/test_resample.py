@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from conftest import make_fy3d_mwri
+from fy3Reader import resample
+from fy3Reader.mwri_l1 import FY3D_MWRI_L1
+
+def _swath(H=120, W=60, lon0=130.0, lat0=20.0):
+    j, i = np.meshgrid(np.arange(W), np.arange(H))
+    return lon0 + j * 0.1 - i * 0.03, lat0 + i * 0.1 + j * 0.02
+
+def _band(shape):
+    band = np.random.default_rng(0).uniform(180, 300, shape)
+    band[50:55, 20:25] = np.nan
+    return band
+
+def _wrap(x):
+    return (x + 180) % 360 - 180
+
+@pytest.mark.parametrize("func", [resample.kdtree_interp, resample.bicubic_interp])
+def test_dateline_swath_like_shifted_swath(func):
+    # the same swath crossing the antimeridian & moved to 0 degrees
+    lons, lats = _swath(lon0=177.0)
+    band = _band(lons.shape)
+    assert resample.crosses_dateline(_wrap(lons)) and not resample.crosses_dateline(lons - 180)
+    x, y, expected = func(lons - 180, lats, band, (80, 90))
+    x_dl, y_dl, values = func(_wrap(lons), lats, band, (80, 90))
+    # the grid spans the footprint only, longitudes unwrapped beyond 180
+    np.testing.assert_allclose(x_dl, x + 180)
+    np.testing.assert_array_equal(y_dl, y)
+    np.testing.assert_allclose(values, expected, equal_nan=True)
+
+def test_dateline_plan_onto_target():
+    lons, lats = _swath(lon0=177.0)
+    band = _band(lons.shape)
+    target = np.meshgrid(np.linspace(-179, -176, 60), np.linspace(22, 30, 50))
+    values = resample.ResamplePlan(_wrap(lons), lats, None, target=target).apply(band)
+    shifted = (target[0] + 180, target[1])
+    expected = resample.ResamplePlan(lons - 180, lats, None, target=shifted).apply(band)
+    np.testing.assert_array_equal(values, expected)
+    assert np.isfinite(values).any()
+
+def test_polar_swath_searched_on_sphere():
+    lons, lats = _swath(lat0=75.0)
+    band = np.nan_to_num(_band(lons.shape))
+    assert resample._is_polar(lats)
+    expected = resample.kdtree_interp(lons, lats, band, (60, 60), no_xy=True, spherical=True)
+    np.testing.assert_array_equal(resample.kdtree_interp(lons, lats, band, (60, 60), no_xy=True), expected)
+    np.testing.assert_array_equal(resample.ResamplePlan(lons, lats, (60, 60)).apply(band), expected)
+
+def test_crop_box_across_dateline(tmp_path):
+    crossing = FY3D_MWRI_L1(make_fy3d_mwri(str(tmp_path / "crossing.h5"), lon0=176.0))
+    crossing.load("btemp_89.0h")
+    crossing.longitude = _wrap(crossing.longitude)
+    shifted = FY3D_MWRI_L1(make_fy3d_mwri(str(tmp_path / "shifted.h5"), lon0=176.0))
+    shifted.load("btemp_89.0h")
+    shifted.longitude = shifted.longitude - 180
+    crossing.crop((25, 30, 178, -178))
+    shifted.crop((25, 30, -2, 2))
+    np.testing.assert_array_equal(crossing.values, shifted.values)
+    assert (crossing.longitude < 0).any() and (crossing.longitude > 0).any()
+
+@pytest.mark.parametrize("func", [resample.kdtree_interp, resample.spline_interp, resample.bicubic_interp])
+def test_workers_like_one_worker(func):
+    lons, lats = _swath()
+    band = np.nan_to_num(_band(lons.shape))
+    expected = func(lons, lats, band, (80, 90), no_xy=True)
+    for workers in (2, 3, -1):
+        np.testing.assert_array_equal(func(lons, lats, band, (80, 90), no_xy=True, workers=workers), expected)
+
+@pytest.mark.parametrize("resampler", ["nearest", "spline", "bicubic"])
+def test_plan_workers_like_one_worker(resampler):
+    lons, lats = _swath()
+    band = _band(lons.shape)
+    expected = resample.ResamplePlan(lons, lats, (80, 90), resampler=resampler).apply(band)
+    np.testing.assert_array_equal(resample.ResamplePlan(lons, lats, (80, 90), resampler=resampler, workers=3).apply(band), expected)
+
+@pytest.mark.parametrize("resampler", ["nearest", "bicubic"])
+@pytest.mark.parametrize("name", ["89_color", "btemp_89.0h"])
+def test_reader_workers_like_one_worker(granules, resampler, name):
+    reader = FY3D_MWRI_L1(granules["FY3D_MWRI_L1"])
+    reader.load(name)
+    reader.resample(resampler, (50, 60))
+    for workers in (2, -1):
+        threaded = FY3D_MWRI_L1(granules["FY3D_MWRI_L1"])
+        threaded.load(name)
+        threaded.resample(resampler, (50, 60), workers=workers)
+        np.testing.assert_array_equal(threaded.values, reader.values)
+
+def _tilted(H=150, W=60, lon0=130.0, dateline=False):
+    i, j = np.mgrid[0:H, 0:W].astype(float)
+    lons, lats = lon0 + (j + i * 0.6) * 0.05, 20 + (i - j * 0.6) * 0.05
+    return (_wrap(lons) if dateline else lons), lats
+
+def _curved():
+    # a concave outline, the convex hull covers the inner gap
+    i, j = np.mgrid[0:150, 0:40].astype(float)
+    angle, radius = i / 149 * 2.0, 5 + j * 0.05
+    return 130 + radius * np.cos(angle), 20 + radius * np.sin(angle)
+
+SWATHS = {"tilted": _tilted(), "dateline": _tilted(lon0=175.0, dateline=True), "curved": _curved()}
+
+@pytest.mark.parametrize("func", [resample.kdtree_interp, resample.spline_interp, resample.bicubic_interp])
+@pytest.mark.parametrize("swath", list(SWATHS))
+def test_footprint_like_full_grid(monkeypatch, func, swath):
+    lons, lats = SWATHS[swath]
+    band = _band(lons.shape)
+    values = func(lons, lats, band, (90, 100), no_xy=True)
+    # every target pixel evaluated
+    monkeypatch.setattr(resample, "swath_footprint", lambda *args, **kwargs: None)
+    expected = func(lons, lats, band, (90, 100), no_xy=True)
+    np.testing.assert_array_equal(values, expected)
+    assert np.isnan(values).any() and np.isfinite(values).any()
+
+@pytest.mark.parametrize("resampler", ["nearest", "spline", "bicubic"])
+@pytest.mark.parametrize("swath", list(SWATHS))
+def test_plan_footprint_like_full_grid(monkeypatch, resampler, swath):
+    lons, lats = SWATHS[swath]
+    band = _band(lons.shape)
+    plan = resample.ResamplePlan(lons, lats, (90, 100), resampler=resampler)
+    assert plan.footprint is not None and plan.footprint.size < 90 * 100
+    monkeypatch.setattr(resample, "swath_footprint", lambda *args, **kwargs: None)
+    expected = resample.ResamplePlan(lons, lats, (90, 100), resampler=resampler).apply(band)
+    np.testing.assert_array_equal(plan.apply(band), expected)
+
+def test_convex_footprint_fills_concave_gap():
+    lons, lats = _curved()
+    grid = resample.lonlat_interp(lons, lats, (90, 100))
+    outline = resample.swath_footprint(lons, lats, *grid)
+    hull = resample.swath_footprint(lons, lats, *grid, convex=True)
+    assert np.isin(outline, hull).all() and hull.size > outline.size
+    # `griddata` reaches into the gap, the convex footprint keeps all of it
+    values = resample.spline_interp(lons, lats, np.ones(lons.shape), (90, 100), no_xy=True)
+    assert np.isin(np.flatnonzero(np.isfinite(values)), hull).all()
+    assert not np.isin(np.flatnonzero(np.isfinite(values)), outline).all()
+    # not a rectilinear grid
+    assert resample.swath_footprint(lons, lats, grid[0] + grid[1] * 0.1, grid[1]) is None
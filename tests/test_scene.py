@@ -0,0 +1,56 @@
+import os
+import h5py
+import numpy as np
+import pytest
+
+from fy3Reader.factory import open_reader
+from fy3Reader.scene import Scene
+
+BOX = (22, 30, 130, 138)
+
+def _product(fname, name, resampler):
+    reader = open_reader(fname)
+    reader.load(name)
+    reader.crop(BOX)
+    reader.resample(resampler=resampler, to_shape=(50, 60))
+    return reader.values
+
+@pytest.mark.parametrize("resampler", ["nearest", "spline", "bicubic"])
+@pytest.mark.parametrize("granule, names", [
+    ("FY3D_MWRI_L1", ["89_color", "hydrometeor_type", "btemp_89.0h", "89_pct"]),
+    ("FY3G_MWRI_L1", ["89_color", "btemp_89.0h", "89_pct"]),
+    ("FY3D_MWHS_L1", ["89_color_mwhs", "btemp_150h"]),
+])
+def test_scene_matches_reader(granules, granule, names, resampler):
+    fname = granules[granule]
+    scn = Scene(open_reader(fname))
+    scn.load(names)
+    scn.crop(BOX)
+    scn.resample(resampler=resampler, to_shape=(50, 60))
+    assert list(scn) == names
+    for name in names:
+        expected = _product(fname, name, resampler)
+        if expected.dtype == np.uint8:
+            np.testing.assert_array_equal(scn[name], expected)
+        else:
+            # the weights of the plan round differently from `griddata`
+            np.testing.assert_allclose(scn[name], expected, rtol=1e-12)
+
+def test_scene_saves_products(granules, tmp_path):
+    scn = Scene(open_reader(granules["FY3D_MWRI_L1"]))
+    scn.load(["89_color", "89_pct"])
+    scn.resample(to_shape=(40, 40))
+    written = scn.save_datasets(str(tmp_path / "scn_{name}.nc"), processes=1)
+    assert [os.path.basename(f) for f in written] == ["scn_89_color.nc", "scn_89_pct.nc"]
+    with h5py.File(written[0], "r") as f:
+        np.testing.assert_array_equal(f["89_color"][...], scn["89_color"])
+
+def test_scene_errors(granules):
+    scn = Scene(open_reader(granules["FY3D_MWRI_L1"]))
+    with pytest.raises(ValueError):
+        scn.resample(to_shape=(10, 10))
+    with pytest.raises(ValueError):
+        scn.load(["unknown"])
+    scn.load(["89_pct"])
+    with pytest.raises(KeyError):
+        scn["89_color"]
@@ -0,0 +1,95 @@
+import pickle
+import numpy as np
+import pytest
+
+from fy3Reader import h5io
+from fy3Reader.factory import open_reader
+from fy3Reader.mwri_l1 import FY3D_MWRI_L1
+from fy3Reader.pmr_l2 import FY3G_PMR_L2
+from fy3Reader.scene import Scene
+from fy3Reader.stats import BandStats, band_stats, composite_stats, merge_stats, stretch_limits, _in_box
+
+BOX = (25, 30, 130, 135)
+
+def _check(stats, values, width=0.1):
+    # exact moments, percentiles to within one bin of the histogram
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    assert stats.count == values.size
+    assert stats.min == values.min() and stats.max == values.max()
+    np.testing.assert_allclose(stats.mean, values.mean(), rtol=1e-12)
+    q = [2, 50, 98]
+    assert np.abs(stats.percentile(q) - np.percentile(values, q)).max() <= width + 1e-9
+
+def test_itemlike_numpy():
+    values = np.random.default_rng(0).normal(250, 20, 10000)
+    values[:10] = np.nan
+    stats = BandStats()
+    for block in np.array_split(values, 7):
+        stats.update(block)
+    _check(stats, values)
+    # halves merged like the whole
+    a, b = BandStats().update(values[:4000]), BandStats().update(values[4000:])
+    merged = a + b
+    assert merged.count == stats.count and np.array_equal(merged.histogram, stats.histogram)
+    np.testing.assert_allclose(merged.percentile([2, 98]), stats.percentile([2, 98]))
+    assert a.count == 4000 - 10
+    with pytest.raises(ValueError):
+        stats.merge(BandStats(bins=100))
+    assert np.isnan(BandStats().percentile(50)) and np.isnan(BandStats().mean)
+
+def test_out_of_range_values():
+    stats = BandStats(bins=10, value_range=(0, 10)).update([-5.0, 1.0, 2.0, 3.0, 20.0])
+    assert (stats.underflow, stats.overflow) == (1, 1)
+    assert stats.percentile(0) == -5.0 and stats.percentile(100) == 20.0
+
+@pytest.mark.parametrize("granule, names", [
+    ("FY3D_MWRI_L1", ["btemp_89.0v", "btemp_19.0h"]),
+    ("FY3G_MWRI_L1", ["89_color", "btemp_183.0_7v"]),
+    ("FY3D_MWHS_L1", ["btemp_150h", "btemp_89h"]),
+])
+@pytest.mark.parametrize("ll_box", [None, BOX])
+def test_itemlike_loaded_bands(granules, monkeypatch, granule, names, ll_box):
+    fname = granules[granule]
+    # blocks of a few rows
+    monkeypatch.setattr(h5io, "BLOCK_BYTES", 4096)
+    stats = band_stats(open_reader(fname), names, ll_box=ll_box)
+    for band, item in stats.items():
+        reader = open_reader(fname)
+        reader.load(band)
+        values = reader.data if ll_box is None else reader.data[_in_box(reader.longitude, reader.latitude, ll_box)]
+        _check(item, values)
+    merged = pickle.loads(pickle.dumps(merge_stats(stats, stats)))
+    assert all(merged[band].count == 2 * stats[band].count for band in stats)
+
+def test_composite_stats_limits(granules):
+    fname = granules["FY3D_MWRI_L1"]
+    stats = composite_stats(FY3D_MWRI_L1(fname), "89_color", ll_box=BOX)
+    reader = FY3D_MWRI_L1(fname)
+    reader.load("89_color")
+    inside = _in_box(reader.longitude, reader.latitude, BOX)
+    cm = reader.composite_func(reader.data, fractions=reader.COMPOSITE_BANDS["89_color"]["fractions"])
+    for channel, values in cm.channel_values(0, reader.data[0].shape[0]):
+        _check(stats[channel], np.asarray(values)[inside])
+    limits = stretch_limits(stats)
+    assert set(limits) == set(stats)
+    reader.resample("nearest", (50, 50), limits=limits)
+    default = FY3D_MWRI_L1(fname)
+    default.load("89_color")
+    default.resample("nearest", (50, 50))
+    assert not np.array_equal(reader.values, default.values)
+    scn = Scene(FY3D_MWRI_L1(fname))
+    scn.load(["89_color"])
+    scn.limits["89_color"] = limits
+    scn.resample("nearest", (50, 50))
+    np.testing.assert_array_equal(scn["89_color"], reader.values)
+    with pytest.raises(ValueError):
+        composite_stats(FY3D_MWRI_L1(fname), "not_a_composite")
+
+@pytest.mark.parametrize("name", ["zFactorCorrectedESurface", "zFactorCorrected"])
+def test_pmr_band_stats(granules, name):
+    fname = granules["FY3G_PMR_L2"]
+    stats = band_stats(FY3G_PMR_L2(fname), [name], ll_box=BOX, level=1, value_range=(-50, 100), bins=1500)[name]
+    reader = FY3G_PMR_L2(fname)
+    reader.load(name, level=1)
+    _check(stats, reader.data[_in_box(reader.longitude, reader.latitude, BOX)])
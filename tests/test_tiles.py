@@ -0,0 +1,55 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from fy3Reader.mwri_l1 import FY3D_MWRI_L1
+from fy3Reader.tiles import TileGenerator, _lonlat_to_tile, _tile_windows
+
+def _patch(granules):
+    # 10 x 10 swath pixels, tiles of zoom 13 are smaller than their spacing
+    reader = FY3D_MWRI_L1(granules["FY3D_MWRI_L1"])
+    reader.load("89_color")
+    window = np.s_[50:60, 40:50]
+    reader.longitude, reader.latitude = reader.longitude[window], reader.latitude[window]
+    reader.data = [d[window] for d in reader.data]
+    return reader
+
+def test_tiles_cover_swath(granules):
+    reader = _patch(granules)
+    lons, lats = reader.longitude.astype(np.float64), reader.latitude.astype(np.float64)
+    s = np.linspace(0, 1, 8)
+    u, v = np.meshgrid(s, s)
+    for zoom in (8, 11, 13):
+        windows = _tile_windows(lons, lats, zoom)
+        # tiles of points sampled in every cell between 4 neighbouring pixels
+        for i in range(lons.shape[0] - 1):
+            for j in range(lons.shape[1] - 1):
+                lon = (lons[i, j] * (1 - u) * (1 - v) + lons[i + 1, j] * v * (1 - u)
+                       + lons[i, j + 1] * u * (1 - v) + lons[i + 1, j + 1] * u * v)
+                lat = (lats[i, j] * (1 - u) * (1 - v) + lats[i + 1, j] * v * (1 - u)
+                       + lats[i, j + 1] * u * (1 - v) + lats[i + 1, j + 1] * u * v)
+                tx, ty = _lonlat_to_tile(lon, lat, zoom)
+                assert set(zip(tx.ravel().tolist(), ty.ravel().tolist())) <= set(windows)
+
+def _read_tiles(out_dir):
+    tiles = {}
+    for root, _, files in os.walk(out_dir):
+        for fname in files:
+            path = os.path.join(root, fname)
+            tiles[os.path.relpath(path, out_dir)] = np.asarray(Image.open(path))
+    return tiles
+
+def test_generate_same_in_any_executor(granules, tmp_path):
+    reader = _patch(granules)
+    counts, outputs = [], []
+    for processes in (1, ThreadPoolExecutor(2)):
+        out_dir = str(tmp_path / str(len(outputs)))
+        counts.append(TileGenerator(reader, tile_size=32, processes=processes).generate(out_dir, zooms=(11, 13)))
+        outputs.append(_read_tiles(out_dir))
+    assert counts[0] == counts[1] == len(outputs[0])
+    assert outputs[0].keys() == outputs[1].keys()
+    for name, rgba in outputs[0].items():
+        np.testing.assert_array_equal(rgba, outputs[1][name])
+    # every tile of zoom 13 covered by the patch is rendered, no holes
+    assert sum(name.startswith("13" + os.sep) for name in outputs[0]) == len(_tile_windows(reader.longitude, reader.latitude, 13))
@@ -0,0 +1,59 @@
+import h5py
+import numpy as np
+import pytest
+
+from fy3Reader.mwri_l1 import FY3D_MWRI_L1
+from fy3Reader.writer import ProductWriter, write_products
+
+def _grid(lon0, shape=(20, 30)):
+    return np.meshgrid(np.linspace(lon0, lon0 + 5, shape[1]), np.linspace(20, 25, shape[0]))
+
+def test_products_share_coordinates_of_one_grid(tmp_path):
+    lons, lats = _grid(130)
+    fname = str(tmp_path / "same.nc")
+    with ProductWriter(fname) as writer:
+        writer.write("a", np.ones(lons.shape), lons, lats)
+        writer.write("b", np.zeros(lons.shape), lons, lats)
+    with h5py.File(fname, "r") as f:
+        np.testing.assert_array_equal(f["lon"][...], lons[0])
+        np.testing.assert_array_equal(f["b"][...], 0)
+
+@pytest.mark.parametrize("other", [_grid(131), _grid(130, (20, 31))])
+def test_other_grid_needs_suffix(tmp_path, other):
+    lons, lats = _grid(130)
+    with ProductWriter(str(tmp_path / "other.nc")) as writer:
+        writer.write("a", np.ones(lons.shape), lons, lats)
+        with pytest.raises(ValueError):
+            writer.write("b", np.ones(other[0].shape), *other)
+        writer.write("b", np.ones(other[0].shape), *other, suffix="_b")
+
+def test_other_swath_needs_suffix(tmp_path, granules):
+    reader = FY3D_MWRI_L1(granules["FY3D_MWRI_L1"])
+    reader.load("btemp_89.0h")
+    lons, lats = reader.get_lonlats()
+    with ProductWriter(str(tmp_path / "swath.nc")) as writer:
+        writer.write("a", reader.values, lons, lats)
+        with pytest.raises(ValueError):
+            writer.write("b", reader.values, lons + 1, lats)
+
+def test_composite_streamed_like_written(tmp_path, granules):
+    reader = FY3D_MWRI_L1(granules["FY3D_MWRI_L1"])
+    reader.load("89_color")
+    lons, lats = reader.get_lonlats()
+    info = reader.COMPOSITE_BANDS["89_color"]
+    cm = reader.composite_func(reader.data, fractions=info["fractions"])
+    with ProductWriter(str(tmp_path / "streamed.nc"), chunks=(32, 32)) as writer:
+        writer.write_composite("89_color", cm, lons, lats)
+    with ProductWriter(str(tmp_path / "written.nc")) as writer:
+        writer.write("89_color", cm.composite(), lons, lats)
+    with h5py.File(str(tmp_path / "streamed.nc"), "r") as a, h5py.File(str(tmp_path / "written.nc"), "r") as b:
+        np.testing.assert_array_equal(a["89_color"][...], b["89_color"][...])
+
+def test_write_products_in_processes(tmp_path):
+    lons, lats = _grid(130)
+    products = {"a": (np.ones(lons.shape), lons, lats), "b": (np.zeros(lons.shape), lons, lats)}
+    for processes in (1, 2):
+        written = write_products(products, str(tmp_path / f"{processes}_{{name}}.nc"), processes=processes)
+        for fname, (name, (data, _, _)) in zip(written, products.items()):
+            with h5py.File(fname, "r") as f:
+                np.testing.assert_array_equal(f[name][...], data)